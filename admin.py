@@ -3,7 +3,12 @@ from telebot.apihelper import ApiTelegramException
 import config
 import modules.database as db
 import modules.support as support_module
+import modules.catalog as catalog
+import modules.faq_matcher as faq_matcher
+import modules.outbox as outbox
+import modules.broadcast as broadcast
 import re
+import datetime
 
 ADMIN_STATE_NONE = 0
 ADMIN_STATE_MANAGE_REQUESTS = 1
@@ -12,12 +17,18 @@ ADMIN_STATE_AWAITING_FAQ_QUESTION = 3
 ADMIN_STATE_AWAITING_FAQ_ANSWER = 4
 ADMIN_STATE_AWAITING_BULK_FAQ_TEXT = 6
 ADMIN_STATE_AWAITING_GROUP_NAME = 7
+ADMIN_STATE_AWAITING_ANNOUNCEMENT_TEXT = 8
+
+ANNOUNCE_ALL = "all"
+ANNOUNCE_CLASSES = "classes"
+ANNOUNCE_GROUPS = "groups"
 
 
 admin_states = {}
 admin_current_request_id = {}
 admin_current_faq_question = {}
 admin_current_message_to_edit = {}
+admin_current_announcement = {}
 
 def is_admin(user_id):
     return user_id in config.ADMIN_IDS
@@ -28,8 +39,9 @@ def get_admin_main_menu():
     btn_manage_faq = types.InlineKeyboardButton("Управление FAQ", callback_data="admin_manage_faq")
     btn_manage_schedule = types.InlineKeyboardButton("Управление расписанием", callback_data="admin_manage_schedule")
     btn_manage_classes = types.InlineKeyboardButton("Управление классами", callback_data="admin_manage_classes")
+    btn_announce = types.InlineKeyboardButton("📢 Объявление", callback_data="admin_announce")
     btn_back_to_main = types.InlineKeyboardButton("⬅️ Главное меню (Пользователь)", callback_data="back_to_main")
-    markup.add(btn_manage_requests, btn_manage_faq, btn_manage_schedule, btn_manage_classes, btn_back_to_main)
+    markup.add(btn_manage_requests, btn_manage_faq, btn_manage_schedule, btn_manage_classes, btn_announce, btn_back_to_main)
     return markup
 
 def show_admin_panel(bot, chat_id, message_id, user_id):
@@ -60,21 +72,40 @@ def get_manage_requests_menu():
     markup.add(btn_view_new, btn_view_all, btn_delete_one, btn_delete_all, btn_back)
     return markup
 
+REQUESTS_PAGE_SIZE = 10
+
+# Короткие коды фильтров для callback_data (лимит Telegram - 64 байта).
+REQUEST_STATUS_FILTERS = {
+    'all': (None, "Все"),
+    'open': ('Открыт', "Открытые"),
+    'work': ('Изучаем проблему', "В работе"),
+    'done': ('Решен', "Решенные"),
+}
+
+_CURSOR_EPOCH = datetime.datetime(1970, 1, 1)
+
+def encode_request_cursor(created_at, req_id):
+    micros = (created_at - _CURSOR_EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}_{req_id}"
+
+def decode_request_cursor(micros, req_id):
+    return _CURSOR_EPOCH + datetime.timedelta(microseconds=int(micros)), int(req_id)
+
 def show_requests_list(message, bot, is_new_requests=False):
     chat_id = message.chat.id
     
-    if is_new_requests:
-        requests = db.get_new_support_requests()
-        title = "🆕 **Новые запросы:**\n"
-    else:
-        requests = db.get_all_support_requests()
-        title = "📊 **Все запросы в техподдержку:**\n"
+    if not is_new_requests:
+        show_requests_page(bot, chat_id, None, view='list')
+        return
+
+    requests = db.get_new_support_requests()
+    title = "🆕 **Новые запросы:**\n"
 
     if not requests:
         markup = types.InlineKeyboardMarkup()
         btn_back = types.InlineKeyboardButton("⬅️ Назад к управлению запросами", callback_data="admin_manage_requests")
         markup.add(btn_back)
-        bot.send_message(chat_id, f"На данный момент нет {'новых' if is_new_requests else ''} запросов.", reply_markup=markup)
+        bot.send_message(chat_id, "На данный момент нет новых запросов.", reply_markup=markup)
         return
 
     markup = types.InlineKeyboardMarkup(row_width=1)
@@ -88,20 +119,120 @@ def show_requests_list(message, bot, is_new_requests=False):
     bot.send_message(chat_id, title + "\nВыберите запрос для просмотра:", reply_markup=markup, parse_mode="Markdown")
     admin_states[chat_id] = ADMIN_STATE_MANAGE_REQUESTS
 
-def show_request_details_for_admin(bot, chat_id, message_id, request_id):
-    request_data = db.get_support_request_by_id(request_id)
+def show_requests_page(bot, chat_id, message_id, view='list', status_key='all', direction='next', cursor=None):
+    """
+    Показывает одну страницу запросов с навигацией и фильтром по статусу.
+    view='list' - просмотр, view='del' - выбор запроса для удаления.
+    Если message_id задан, сообщение редактируется, иначе отправляется новое.
+    """
+    if status_key not in REQUEST_STATUS_FILTERS:
+        status_key = 'all'
+    status, _ = REQUEST_STATUS_FILTERS[status_key]
+
+    requests, has_more = db.get_support_requests_page(status, cursor, direction, REQUESTS_PAGE_SIZE)
+    if not requests and cursor:
+        # Страница опустела (запросы удалили) - возвращаемся к началу списка.
+        cursor = None
+        direction = 'next'
+        requests, has_more = db.get_support_requests_page(status, None, 'next', REQUESTS_PAGE_SIZE)
+
+    if direction == 'next':
+        has_prev, has_next = cursor is not None, has_more
+    else:
+        has_prev, has_next = has_more, True
 
-    if not request_data:
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for req_id, user_id, username, full_name, description, req_status, created_at in requests:
+        short_desc = description[:50] + "..." if len(description) > 50 else description
+        if view == 'del':
+            markup.add(types.InlineKeyboardButton(f"❌ #{req_id} | {full_name} ({req_status}): {short_desc}", callback_data=f"admin_confirm_delete_one_{req_id}"))
+        else:
+            markup.add(types.InlineKeyboardButton(f"#{req_id} | {full_name} ({req_status}): {short_desc}", callback_data=f"admin_view_request_details_{req_id}"))
+
+    nav_buttons = []
+    if requests and has_prev:
+        first_cursor = encode_request_cursor(requests[0][6], requests[0][0])
+        nav_buttons.append(types.InlineKeyboardButton("⬅️ Новее", callback_data=f"admin_reqs_{view}_{status_key}_p_{first_cursor}"))
+    if requests and has_next:
+        last_cursor = encode_request_cursor(requests[-1][6], requests[-1][0])
+        nav_buttons.append(types.InlineKeyboardButton("Старше ➡️", callback_data=f"admin_reqs_{view}_{status_key}_n_{last_cursor}"))
+    if nav_buttons:
+        markup.row(*nav_buttons)
+
+    filter_buttons = [
+        types.InlineKeyboardButton(("✅ " if key == status_key else "") + label, callback_data=f"admin_reqs_{view}_{key}")
+        for key, (_, label) in REQUEST_STATUS_FILTERS.items()
+    ]
+    markup.row(*filter_buttons)
+    markup.add(types.InlineKeyboardButton("⬅️ Назад к управлению запросами", callback_data="admin_manage_requests"))
+
+    filter_label = REQUEST_STATUS_FILTERS[status_key][1]
+    if view == 'del':
+        title = f"Выберите запрос для удаления ({filter_label}):"
+    else:
+        title = f"📊 **Запросы в техподдержку ({filter_label}):**\n\nВыберите запрос для просмотра:"
+    if not requests:
+        title = "Нет запросов для удаления." if view == 'del' else f"Запросов нет ({filter_label})."
+
+    if message_id:
+        try:
+            bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=title, reply_markup=markup, parse_mode="Markdown")
+        except ApiTelegramException:
+            pass
+    else:
+        bot.send_message(chat_id, title, reply_markup=markup, parse_mode="Markdown")
+    admin_states[chat_id] = ADMIN_STATE_MANAGE_REQUESTS
+
+def handle_requests_page_callback(bot, chat_id, message_id, data):
+    """Разбирает callback вида admin_reqs_{view}_{status}[_{p|n}_{micros}_{id}]."""
+    parts = data.split('_')
+    view, status_key = parts[2], parts[3]
+    if len(parts) == 7:
+        direction = 'prev' if parts[4] == 'p' else 'next'
+        show_requests_page(bot, chat_id, message_id, view, status_key, direction, decode_request_cursor(parts[5], parts[6]))
+    else:
+        show_requests_page(bot, chat_id, message_id, view, status_key)
+
+HISTORY_PAGE_SIZE = 5
+# 5 сообщений по 600 символов плюс заголовок укладываются в лимит Telegram в 4096 символов.
+HISTORY_MESSAGE_MAX_LENGTH = 600
+
+def show_request_details_for_admin(bot, chat_id, message_id, request_id, history_offset=0):
+    """
+    Карточка запроса с окном истории: HISTORY_PAGE_SIZE сообщений, пропуская history_offset самых новых.
+    Все данные приходят одним запросом к БД, стоимость не зависит от длины переписки.
+    Смещение из устаревшей или подделанной кнопки приводится к [0, total - HISTORY_PAGE_SIZE].
+    """
+    history_offset = max(history_offset, 0)
+    result = db.get_support_request_with_history(request_id, HISTORY_PAGE_SIZE, history_offset)
+
+    if not result:
         bot.send_message(chat_id, f"Запрос с ID #{request_id} не найден.")
         return
 
+    request_data, history, total_messages = result
+    max_offset = max(total_messages - HISTORY_PAGE_SIZE, 0)
+    if history_offset > max_offset:
+        # Окно ушло за начало переписки - показываем самые ранние сообщения
+        history_offset = max_offset
+        result = db.get_support_request_with_history(request_id, HISTORY_PAGE_SIZE, history_offset)
+        if not result:
+            bot.send_message(chat_id, f"Запрос с ID #{request_id} не найден.")
+            return
+        request_data, history, total_messages = result
+        max_offset = max(total_messages - HISTORY_PAGE_SIZE, 0)
     req_id, user_id, username, full_name, description, status, created_at = request_data
 
-    history = db.get_messages_for_request(req_id)
     history_text = "\n\n**📜 История переписки:**\n"
     if history:
+        first_shown = total_messages - history_offset - len(history) + 1
+        last_shown = total_messages - history_offset
+        if total_messages > len(history):
+            history_text += f"_Сообщения {first_shown}–{last_shown} из {total_messages}_\n\n"
         for sender_name, sender_type, msg_text, msg_time in history:
             sender_prefix = "👤 Пользователь" if sender_type == 'user' else "⚙️ Админ"
+            if len(msg_text) > HISTORY_MESSAGE_MAX_LENGTH:
+                msg_text = msg_text[:HISTORY_MESSAGE_MAX_LENGTH] + "…"
             history_text += f"_{msg_time.strftime('%d.%m %H:%M')}_ | **{sender_prefix} ({sender_name})**:\n{msg_text}\n\n"
     else:
         history_text += "_Переписки еще нет._"
@@ -122,6 +253,14 @@ def show_request_details_for_admin(bot, chat_id, message_id, request_id):
     elif status == 'Изучаем проблему':
         markup.add(types.InlineKeyboardButton("✅ Решить (Решен)", callback_data=f"admin_change_status_Решен_{req_id}"))
     
+    history_buttons = []
+    if history_offset + len(history) < total_messages:
+        history_buttons.append(types.InlineKeyboardButton("⬆️ Ранее", callback_data=f"admin_request_history_{min(history_offset + HISTORY_PAGE_SIZE, max_offset)}_{req_id}"))
+    if history_offset > 0:
+        history_buttons.append(types.InlineKeyboardButton("⬇️ Позже", callback_data=f"admin_request_history_{max(history_offset - HISTORY_PAGE_SIZE, 0)}_{req_id}"))
+    if history_buttons:
+        markup.row(*history_buttons)
+
     markup.add(types.InlineKeyboardButton("💬 Ответить пользователю", callback_data=f"admin_start_answer_{req_id}"))
     markup.add(types.InlineKeyboardButton("⬅️ Назад к списку запросов", callback_data="admin_manage_requests"))
     
@@ -207,20 +346,17 @@ def process_admin_answer(message, bot):
         del admin_current_message_to_edit[chat_id]
 
 def change_request_status(bot, call_id, chat_id, message_id_to_edit, request_id, new_status, admin_id):
-    if db.update_support_request_status(request_id, new_status, admin_id):
+    notification = outbox.message(
+        outbox.KIND_REQUEST_STATUS,
+        f"🔔 **Обновление по вашему запросу #{request_id}:**\n"
+        f"Новый статус: **`{new_status}`**"
+        f"{' (Ваш запрос решен)' if new_status == 'Решен' else ''}",
+        parse_mode="Markdown"
+    )
+    if db.update_support_request_status(request_id, new_status, admin_id, notification):
+        outbox.wake()
         bot.answer_callback_query(call_id, f"Статус изменен на '{new_status}'")
-        
-        request_data = db.get_support_request_by_id(request_id)
-        if request_data:
-            user_requester_id = request_data[1]
-            bot.send_message(
-                user_requester_id,
-                f"🔔 **Обновление по вашему запросу #{request_id}:**\n"
-                f"Новый статус: **`{new_status}`**"
-                f"{' (Ваш запрос решен)' if new_status == 'Решен' else ''}",
-                parse_mode="Markdown"
-            )
-        
+
         show_request_details_for_admin(bot, chat_id, message_id_to_edit, request_id)
         return True
     else:
@@ -258,19 +394,11 @@ def process_faq_answer(message, bot):
         if chat_id in admin_current_faq_question: del admin_current_faq_question[chat_id]
         return
     
-    conn = db.get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO faq (question, answer) VALUES (%s, %s);", (question, answer))
-            conn.commit()
-            bot.send_message(chat_id, "Новый FAQ успешно добавлен!")
-        except Exception as e:
-            bot.send_message(chat_id, f"Ошибка при добавлении FAQ: {e}")
-            conn.rollback()
-        finally:
-            cur.close()
-            conn.close()
+    if db.add_faq_item(question, answer):
+        faq_matcher.invalidate_index()
+        bot.send_message(chat_id, "Новый FAQ успешно добавлен!")
+    else:
+        bot.send_message(chat_id, "Ошибка при добавлении FAQ.")
 
     admin_states[chat_id] = ADMIN_STATE_NONE
     if chat_id in admin_current_faq_question: del admin_current_faq_question[chat_id]
@@ -278,24 +406,7 @@ def process_faq_answer(message, bot):
     bot.send_message(chat_id, "Выберите действие:", reply_markup=get_manage_faq_menu())
 
 def show_deletable_requests_list(bot, chat_id, message_id):
-    requests = db.get_all_support_requests()
-    
-    if not requests:
-        markup = types.InlineKeyboardMarkup()
-        btn_back = types.InlineKeyboardButton("⬅️ Назад к управлению запросами", callback_data="admin_manage_requests")
-        markup.add(btn_back)
-        bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Нет запросов для удаления.", reply_markup=markup)
-        return
-
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for req_id, user_id, username, full_name, description, status, created_at in requests:
-        short_desc = description[:50] + "..." if len(description) > 50 else description
-        button_text = f"❌ #{req_id} | {full_name} ({status}): {short_desc}"
-        markup.add(types.InlineKeyboardButton(button_text, callback_data=f"admin_confirm_delete_one_{req_id}"))
-    
-    markup.add(types.InlineKeyboardButton("⬅️ Назад к управлению запросами", callback_data="admin_manage_requests"))
-    
-    bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Выберите запрос для удаления:", reply_markup=markup, parse_mode="Markdown")
+    show_requests_page(bot, chat_id, message_id, view='del')
 
 def start_bulk_faq_update_flow(bot, chat_id):
     template = (
@@ -338,10 +449,18 @@ def process_bulk_faq_text(message, bot, admin_states):
     
     if not faq_items:
         bot.send_message(chat_id, "❌ Не удалось извлечь корректные пары Вопрос/Ответ из текста. Проверьте формат.")
-    elif db.bulk_update_faq(faq_items):
-        bot.send_message(chat_id, f"✅ FAQ успешно обновлен! Добавлено {len(faq_items)} записей.")
     else:
-        bot.send_message(chat_id, "❌ Произошла ошибка при массовом обновлении FAQ.")
+        report = db.bulk_update_faq(faq_items)
+        if report is not None:
+            if report['inserted'] or report['updated'] or report['deleted']:
+                faq_matcher.invalidate_index()
+            bot.send_message(
+                chat_id,
+                f"✅ FAQ успешно обновлен! Записей в списке: {len(faq_items)}.\n"
+                f"Добавлено: {len(report['inserted'])}, изменено: {len(report['updated'])}, удалено: {len(report['deleted'])}."
+            )
+        else:
+            bot.send_message(chat_id, "❌ Произошла ошибка при массовом обновлении FAQ.")
     
     admin_states[chat_id] = ADMIN_STATE_NONE
     bot.send_message(chat_id, "Что еще хотите сделать в админ-панели?", reply_markup=get_admin_main_menu())
@@ -362,7 +481,7 @@ def get_manage_classes_menu():
     return markup
 
 def show_manage_classes_panel(bot, chat_id, message_id):
-    groups = db.get_all_groups_with_classes()
+    groups = catalog.get_all_groups_with_classes()
     text = "🏫 **Управление классами и группами**\n\n"
     if groups:
         text += "Текущий список групп:\n"
@@ -403,7 +522,7 @@ def process_add_group(message, bot):
         bot.send_message(chat_id, "Номер класса должен быть от 1 до 11.")
         return
         
-    success, message_text = db.add_class_group(class_number, group_name)
+    success, message_text = catalog.add_class_group(class_number, group_name)
     bot.send_message(chat_id, message_text)
 
     admin_states[chat_id] = ADMIN_STATE_NONE
@@ -411,7 +530,7 @@ def process_add_group(message, bot):
 
 
 def show_deletable_groups_list(bot, chat_id, message_id):
-    groups = db.get_all_groups_with_classes()
+    groups = catalog.get_all_groups_with_classes()
     if not groups:
         bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Нет групп для удаления.", reply_markup=types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("⬅️ Назад", callback_data="admin_manage_classes")))
         return
@@ -423,7 +542,7 @@ def show_deletable_groups_list(bot, chat_id, message_id):
     bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Выберите группу для удаления:", reply_markup=markup)
 
 def confirm_delete_group(bot, chat_id, message_id, group_id):
-    group_info = db.get_group_info(group_id)
+    group_info = catalog.get_group_info(group_id)
     if not group_info: return
     
     group_name = f"{group_info[2]}{group_info[1]}"
@@ -434,8 +553,157 @@ def confirm_delete_group(bot, chat_id, message_id, group_id):
     bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=f"Вы уверены, что хотите удалить группу `{group_name}`? Все связанные расписания будут удалены, а ученики отвязаны.", reply_markup=markup, parse_mode="Markdown")
 
 def do_delete_group(bot, call, group_id):
-    if db.delete_group_by_id(group_id):
+    if catalog.delete_group(group_id):
         bot.answer_callback_query(call.id, "Группа удалена.")
         show_deletable_groups_list(bot, call.message.chat.id, call.message.message_id)
     else:
-        bot.answer_callback_query(call.id, "Ошибка при удалении.", show_alert=True)
\ No newline at end of file
+        bot.answer_callback_query(call.id, "Ошибка при удалении.", show_alert=True)
+
+def get_announcement_menu():
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    btn_all = types.InlineKeyboardButton("👥 Всем ученикам", callback_data="admin_announce_all")
+    btn_classes = types.InlineKeyboardButton("🏫 Выбрать классы", callback_data="admin_announce_classes")
+    btn_groups = types.InlineKeyboardButton("🔤 Выбрать группы", callback_data="admin_announce_groups")
+    btn_back = types.InlineKeyboardButton("⬅️ Назад в Админ-панель", callback_data="admin_back_to_main")
+    markup.add(btn_all, btn_classes, btn_groups, btn_back)
+    return markup
+
+def show_announcement_menu(bot, chat_id, message_id):
+    admin_current_announcement.pop(chat_id, None)
+    admin_states[chat_id] = ADMIN_STATE_NONE
+    bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="📢 **Объявление**\nКому отправить?", reply_markup=get_announcement_menu(), parse_mode="Markdown")
+
+def get_announcement_selection_menu(scope, selected):
+    markup = types.InlineKeyboardMarkup(row_width=4)
+    if scope == ANNOUNCE_CLASSES:
+        options = [(class_id, str(class_number)) for class_id, class_number in catalog.get_all_classes()]
+    else:
+        options = [(group_id, f"{class_number}{group_name}") for group_id, class_number, group_name in catalog.get_all_groups_with_classes()]
+    buttons = [
+        types.InlineKeyboardButton(f"✅ {label}" if option_id in selected else label, callback_data=f"admin_announce_toggle_{option_id}")
+        for option_id, label in options
+    ]
+    if buttons:
+        markup.add(*buttons)
+    markup.row(types.InlineKeyboardButton("Далее ➡️", callback_data="admin_announce_next"))
+    markup.row(types.InlineKeyboardButton("⬅️ Назад", callback_data="admin_announce"))
+    return markup
+
+def show_announcement_selection(bot, chat_id, message_id):
+    announcement = admin_current_announcement.get(chat_id)
+    if not announcement:
+        show_announcement_menu(bot, chat_id, message_id)
+        return
+    what = "классы" if announcement['scope'] == ANNOUNCE_CLASSES else "группы"
+    bot.edit_message_text(
+        chat_id=chat_id,
+        message_id=message_id,
+        text=f"Отметьте {what}, которым отправить объявление, и нажмите «Далее».",
+        reply_markup=get_announcement_selection_menu(announcement['scope'], announcement['selected'])
+    )
+
+def start_announcement(bot, chat_id, message_id, scope):
+    admin_current_announcement[chat_id] = {'scope': scope, 'selected': set(), 'text': None, 'entities': None}
+    if scope == ANNOUNCE_ALL:
+        ask_announcement_text(bot, chat_id, message_id)
+    else:
+        show_announcement_selection(bot, chat_id, message_id)
+
+def toggle_announcement_target(bot, chat_id, message_id, option_id):
+    announcement = admin_current_announcement.get(chat_id)
+    if not announcement:
+        show_announcement_menu(bot, chat_id, message_id)
+        return
+    announcement['selected'] ^= {option_id}
+    show_announcement_selection(bot, chat_id, message_id)
+
+def announcement_group_ids(announcement):
+    """Группы-получатели объявления; None - все ученики."""
+    if announcement['scope'] == ANNOUNCE_ALL:
+        return None
+    if announcement['scope'] == ANNOUNCE_GROUPS:
+        return sorted(announcement['selected'])
+    return [group_id for class_id in sorted(announcement['selected']) for group_id, _ in catalog.get_groups_for_class(class_id)]
+
+def describe_announcement_target(announcement):
+    if announcement['scope'] == ANNOUNCE_ALL:
+        return "все ученики"
+    if announcement['scope'] == ANNOUNCE_CLASSES:
+        classes = dict(catalog.get_all_classes())
+        return "классы " + ", ".join(str(classes.get(class_id, class_id)) for class_id in sorted(announcement['selected']))
+    names = []
+    for group_id in sorted(announcement['selected']):
+        group_info = catalog.get_group_info(group_id)
+        names.append(f"{group_info[2]}{group_info[1]}" if group_info else str(group_id))
+    return "группы " + ", ".join(names)
+
+def ask_announcement_text(bot, chat_id, message_id):
+    """Проверяет выбор получателей и просит ввести текст. Возвращает False, если получателей нет."""
+    announcement = admin_current_announcement.get(chat_id)
+    if not announcement:
+        show_announcement_menu(bot, chat_id, message_id)
+        return True
+    if announcement['scope'] != ANNOUNCE_ALL and not announcement['selected']:
+        return False
+
+    recipients = db.count_recipients(announcement_group_ids(announcement))
+    if not recipients:
+        markup = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("⬅️ Назад", callback_data="admin_announce"))
+        text = "Не удалось подсчитать получателей." if recipients is None else "Среди выбранных нет учеников, которым бот может написать."
+        bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=markup)
+        return True
+
+    bot.edit_message_text(
+        chat_id=chat_id,
+        message_id=message_id,
+        text=f"Получатели: {describe_announcement_target(announcement)} ({recipients} чел.).\nОтправьте текст объявления одним сообщением."
+    )
+    admin_states[chat_id] = ADMIN_STATE_AWAITING_ANNOUNCEMENT_TEXT
+    return True
+
+def process_announcement_text(message, bot):
+    chat_id = message.chat.id
+    announcement = admin_current_announcement.get(chat_id)
+    admin_states[chat_id] = ADMIN_STATE_NONE
+    if not announcement:
+        bot.send_message(chat_id, "Ошибка: получатели не выбраны. Начните сначала.", reply_markup=get_admin_main_menu())
+        return
+
+    announcement['text'] = message.text
+    # Форматирование из сообщения админа переносится в рассылку как есть
+    announcement['entities'] = message.entities
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    btn_send = types.InlineKeyboardButton("✅ Отправить", callback_data="admin_announce_send")
+    btn_cancel = types.InlineKeyboardButton("Отмена", callback_data="admin_announce_cancel")
+    markup.add(btn_send, btn_cancel)
+    bot.send_message(chat_id, f"Отправить объявление (получатели: {describe_announcement_target(announcement)})?\nТекст - в сообщении выше.", reply_markup=markup)
+
+def send_announcement(bot, call):
+    """Запускает рассылку объявления в фоне; ход показывается админу одним обновляемым сообщением."""
+    chat_id = call.message.chat.id
+    announcement = admin_current_announcement.pop(chat_id, None)
+    if not announcement or not announcement['text']:
+        bot.answer_callback_query(call.id, "Объявление не найдено, начните заново.", show_alert=True)
+        return
+
+    group_ids = announcement_group_ids(announcement)
+    total = db.count_recipients(group_ids)
+    bot.answer_callback_query(call.id, "Рассылка запущена.")
+    bot.edit_message_text(chat_id=chat_id, message_id=call.message.message_id, text=f"📢 Объявление отправляется (получатели: {describe_announcement_target(announcement)}).")
+    # Получатели читаются из базы по ходу отправки, а не загружаются списком заранее
+    broadcast.start_broadcast(
+        bot,
+        db.iter_recipient_ids(group_ids),
+        announcement['text'],
+        "Объявление",
+        report_chat_id=chat_id,
+        total=total,
+        entities=announcement['entities']
+    )
+    bot.send_message(chat_id, "Что еще хотите сделать в админ-панели?", reply_markup=get_admin_main_menu())
+
+def cancel_announcement(bot, chat_id, message_id):
+    admin_current_announcement.pop(chat_id, None)
+    admin_states[chat_id] = ADMIN_STATE_NONE
+    bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Объявление отменено.")
+    bot.send_message(chat_id, "Что еще хотите сделать в админ-панели?", reply_markup=get_admin_main_menu())
@@ -0,0 +1,111 @@
+"""
+Сравнение приближенного поиска FAQ (IVF, HNSW) с точным перебором.
+
+Для каждого размера корпуса генерируются нормированные векторы размерности модели,
+сгруппированные вокруг "тем" (как перефразировки одного вопроса), и запросы - зашумленные
+копии случайных векторов корпуса. Отчет для каждого режима содержит recall@1 относительно
+точного режима, задержку поиска (p50/p95) и время построения индекса.
+HNSW замеряется, только если установлен hnswlib.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_faq_ann
+    python -m benchmarks.bench_faq_ann --sizes 1000 10000 100000 --queries 500 --probes 4 8 16
+"""
+import argparse
+import json
+import time
+import numpy as np
+import modules.faq_ann as faq_ann
+
+DIM = 384
+
+
+def normalize(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_corpus(size, rng, questions_per_topic=20, spread=1.0):
+    topics = normalize(rng.standard_normal((max(1, size // questions_per_topic), DIM)))
+    labels = rng.integers(0, len(topics), size)
+    return normalize(topics[labels] + spread * rng.standard_normal((size, DIM)) / np.sqrt(DIM))
+
+
+def make_queries(corpus, count, rng, noise=0.8):
+    picked = corpus[rng.integers(0, len(corpus), count)]
+    return normalize(picked + noise * rng.standard_normal(picked.shape) / np.sqrt(DIM))
+
+
+def measure(searcher, queries, top_k):
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(searcher.search(query, top_k))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, {
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+    }
+
+
+def recall_at_1(exact_results, results):
+    hits = sum(1 for exact, found in zip(exact_results, results) if found and found[0][0] == exact[0][0])
+    return round(hits / len(exact_results), 4)
+
+
+def build(mode, corpus, **kwargs):
+    started = time.perf_counter()
+    searcher = faq_ann.create_searcher(corpus, mode, **kwargs)
+    return searcher, round(time.perf_counter() - started, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16], help="Значения FAQ_IVF_PROBES")
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128], help="Значения FAQ_HNSW_EF")
+    parser.add_argument("--noise", type=float, default=0.8, help="Шум запросов: чем больше, тем дальше запрос от исходного вопроса")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        import hnswlib  # noqa: F401
+        has_hnsw = True
+    except ImportError:
+        has_hnsw = False
+
+    rng = np.random.default_rng(args.seed)
+    report = {"dim": DIM, "queries": args.queries, "sizes": {}}
+    for size in args.sizes:
+        corpus = make_corpus(size, rng)
+        queries = make_queries(corpus, args.queries, rng, args.noise)
+
+        exact, build_seconds = build(faq_ann.MODE_EXACT, corpus)
+        exact_results, metrics = measure(exact, queries, 1)
+        modes = {"exact": dict(metrics, build_seconds=build_seconds)}
+
+        # Центроиды обучаются один раз, для следующих значений probes векторы только перераспределяются,
+        # как при обновлении FAQ - поэтому их build_seconds меньше.
+        ivf = None
+        for probes in args.probes:
+            ivf, build_seconds = build(faq_ann.MODE_IVF, corpus, previous=ivf, ivf_probes=probes)
+            results, metrics = measure(ivf, queries, 1)
+            modes[f"ivf_probes_{probes}"] = dict(metrics, build_seconds=build_seconds, recall_at_1=recall_at_1(exact_results, results),
+                                                 lists=len(ivf.centroids))
+
+        if has_hnsw:
+            for ef in args.ef:
+                hnsw, build_seconds = build(faq_ann.MODE_HNSW, corpus, hnsw_ef=ef)
+                results, metrics = measure(hnsw, queries, 1)
+                modes[f"hnsw_ef_{ef}"] = dict(metrics, build_seconds=build_seconds, recall_at_1=recall_at_1(exact_results, results))
+
+        report["sizes"][str(size)] = modes
+
+    if not has_hnsw:
+        report["note"] = "hnswlib не установлен, HNSW не замерялся"
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Сравнение бэкендов кодировщика FAQ: PyTorch (sentence-transformers) и ONNX Runtime int8.
+
+Каждый бэкенд запускается в отдельном процессе, чтобы честно измерить потребление памяти.
+Отчет содержит:
+  * паритет - косинусное согласие эмбеддингов ONNX с эталонными PyTorch на вопросах FAQ
+    и долю совпадений ближайшего соседа;
+  * задержку кодирования одного запроса (p50/p95), время кодирования всего FAQ и RSS процесса.
+
+Запуск из корня проекта (вопросы берутся из таблицы faq или из файла, по одному в строке):
+    python -m benchmarks.bench_faq_encoders
+    python -m benchmarks.bench_faq_encoders --questions questions.txt --onnx-dir models/onnx-minilm
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+BACKENDS = ["torch", "onnx"]
+
+
+def load_questions(path):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    import modules.database as db
+    return [question for question, _ in db.get_all_faq_items()]
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_worker(args):
+    import modules.faq_encoders as faq_encoders
+
+    questions = load_questions(args.questions)
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    encoder = faq_encoders.create_encoder(MODEL_NAME, args.worker, onnx_model_dir=args.onnx_dir, onnx_quantize=not args.onnx_fp32)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    embeddings = encoder.encode(questions)
+    corpus_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(args.repeat):
+        for question in questions[:args.queries]:
+            started = time.perf_counter()
+            encoder.encode([question])
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    np.save(args.out + ".npy", embeddings)
+    metrics = {
+        "backend": args.worker,
+        "key": encoder.key,
+        "load_seconds": round(load_seconds, 3),
+        "corpus_size": len(questions),
+        "corpus_encode_seconds": round(corpus_seconds, 3),
+        "query_latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "query_latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "rss_mb_model": round(current_rss_mb() - rss_before, 1),
+        "rss_mb_peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    with open(args.out + ".json", "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+
+
+def parity(reference, candidate):
+    cosines = np.sum(reference * candidate, axis=1)
+    ref_sims = reference @ reference.T
+    cand_sims = candidate @ candidate.T
+    np.fill_diagonal(ref_sims, -np.inf)
+    np.fill_diagonal(cand_sims, -np.inf)
+    nn_agreement = float(np.mean(ref_sims.argmax(axis=1) == cand_sims.argmax(axis=1))) if len(reference) > 1 else 1.0
+    return {
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "cosine_min": round(float(cosines.min()), 5),
+        "cosine_p5": round(float(np.percentile(cosines, 5)), 5),
+        "nearest_neighbour_agreement": round(nn_agreement, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="Файл с вопросами (по умолчанию - таблица faq)")
+    parser.add_argument("--onnx-dir", default=os.path.join("models", "onnx-minilm"))
+    parser.add_argument("--onnx-fp32", action="store_true", help="Сравнивать ONNX без квантования")
+    parser.add_argument("--queries", type=int, default=200, help="Сколько вопросов использовать для замера задержки")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in BACKENDS:
+            out = os.path.join(tmp, backend)
+            command = [sys.executable, "-m", "benchmarks.bench_faq_encoders", "--worker", backend, "--out", out,
+                       "--onnx-dir", args.onnx_dir, "--queries", str(args.queries), "--repeat", str(args.repeat)]
+            if args.questions:
+                command += ["--questions", args.questions]
+            if args.onnx_fp32:
+                command.append("--onnx-fp32")
+            subprocess.run(command, check=True)
+            with open(out + ".json", encoding="utf-8") as f:
+                results[backend] = json.load(f)
+            embeddings[backend] = np.load(out + ".npy")
+
+    report = {"backends": results, "parity_onnx_vs_torch": parity(embeddings["torch"], embeddings["onnx"])}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Сравнение планов горячих запросов до и после миграции с индексами.
+
+Создает временную схему в базе из config.py, заполняет ее синтетическими данными,
+выполняет EXPLAIN ANALYZE для каждого запроса на базовой схеме (миграция 1),
+применяет остальные миграции и повторяет замеры. Схема удаляется по окончании.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_schema_indexes --users 20000 --requests 50000 --messages 200000
+"""
+import argparse
+import psycopg2
+import modules.database as db
+import modules.migrations as migrations
+
+BENCH_SCHEMA = "bench_schema_indexes"
+
+HOT_QUERIES = [
+    ("get_user_support_requests",
+     "SELECT id, description, status, created_at FROM support_requests WHERE user_id = %(user_id)s ORDER BY created_at DESC;"),
+    ("get_new_support_requests",
+     "SELECT id, user_id, username, full_name, description, status, created_at FROM support_requests "
+     "WHERE created_at >= now() - interval '10 minutes' AND status = 'Открыт' ORDER BY created_at ASC;"),
+    ("get_messages_for_request",
+     "SELECT sender_name, sender_type, message_text, created_at FROM support_messages "
+     "WHERE request_id = %(request_id)s ORDER BY created_at ASC;"),
+    ("get_user_ids_for_group",
+     "SELECT id FROM users WHERE group_id = %(group_id)s AND is_admin IS NOT TRUE;"),
+]
+
+
+def seed(cur, users, requests, messages):
+    cur.execute("""
+        INSERT INTO class_groups (class_id, group_name)
+        SELECT c.id, g FROM classes c CROSS JOIN unnest(ARRAY['А', 'Б', 'В', 'Г']) AS g;
+    """)
+    cur.execute("""
+        INSERT INTO users (id, username, first_name, group_id)
+        SELECT i, 'user' || i, 'Имя', 1 + i %% 44
+        FROM generate_series(1, %s) AS i;
+    """, (users,))
+    cur.execute("""
+        INSERT INTO support_requests (user_id, description, status, created_at)
+        SELECT 1 + (i * 7919) %% %s, 'Описание проблемы ' || i,
+               CASE WHEN i %% 20 = 0 THEN 'Открыт' WHEN i %% 3 = 0 THEN 'Изучаем проблему' ELSE 'Решен' END,
+               now() - (i || ' minutes')::interval
+        FROM generate_series(1, %s) AS i;
+    """, (users, requests))
+    cur.execute("""
+        INSERT INTO support_messages (request_id, sender_id, sender_name, sender_type, message_text, created_at)
+        SELECT 1 + (i * 104729) %% %s, i, 'Отправитель', CASE WHEN i %% 2 = 0 THEN 'user' ELSE 'admin' END,
+               'Сообщение ' || i, now() - (i || ' seconds')::interval
+        FROM generate_series(1, %s) AS i;
+    """, (requests, messages))
+    cur.execute("ANALYZE;")
+
+
+def explain_all(cur, params):
+    plans = {}
+    for name, query in HOT_QUERIES:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) " + query, params)
+        plans[name] = "\n".join(row[0] for row in cur.fetchall())
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    conn = db._connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA};")
+        cur.execute(f"SET search_path TO {BENCH_SCHEMA};")
+
+        base_migration = migrations.MIGRATIONS[0]
+        for statement in base_migration[2]:
+            cur.execute(statement)
+        seed(cur, args.users, args.requests, args.messages)
+        conn.commit()
+
+        params = {'user_id': args.users // 2, 'request_id': args.requests // 2, 'group_id': 5}
+        before = explain_all(cur, params)
+
+        for migration in migrations.MIGRATIONS[1:]:
+            for statement in migration[2]:
+                cur.execute(statement)
+        cur.execute("ANALYZE;")
+        conn.commit()
+        after = explain_all(cur, params)
+
+        for name, _ in HOT_QUERIES:
+            print("=" * 80)
+            print(name)
+            print("-" * 80 + "\nДО (версия схемы 1):\n" + before[name])
+            print("-" * 80 + f"\nПОСЛЕ (версия схемы {migrations.LATEST_VERSION}):\n" + after[name])
+    except psycopg2.Error as e:
+        print(f"Ошибка бенчмарка: {e}")
+        conn.rollback()
+    finally:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+        conn.commit()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Офлайн-оценка качества и скорости faq_matcher на размеченных вопросах.
+
+Файл разметки - CSV с колонками question,expected: вопрос пользователя и id ожидаемой
+записи FAQ или "none", если правильного ответа в FAQ нет. FAQ берется из базы config.py;
+база только читается - индекс строится в памяти, сохраненные векторы бота не меняются.
+
+Для каждого бэкенда кодировщика (в отдельном процессе, чтобы честно измерить память) отчет содержит:
+  * precision / recall / F1 и точность для каждого порога из сетки - лучший ответ считается
+    найденным, если его схожесть не ниже порога;
+  * задержку одного поиска p50/p95/p99 (кэш запросов сбрасывается перед каждым вопросом),
+    пропускную способность последовательных запросов, время загрузки и пиковую RSS процесса.
+
+Запуск из корня проекта:
+    python -m benchmarks.eval_faq_matcher --labels faq_labels.csv
+    python -m benchmarks.eval_faq_matcher --labels faq_labels.csv --backends torch onnx --output eval.json
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+BACKENDS = ["torch", "onnx"]
+NONE_LABEL = "none"
+DEFAULT_THRESHOLDS = [round(0.30 + 0.05 * i, 2) for i in range(13)]
+
+
+def load_labels(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = []
+        for row in csv.DictReader(f):
+            expected = row["expected"].strip().lower()
+            rows.append((row["question"], None if expected == NONE_LABEL else int(expected)))
+        return rows
+
+
+def run_worker(args):
+    import modules.faq_matcher as faq_matcher
+
+    labels = load_labels(args.labels)
+    faq_matcher.ENCODER_BACKEND = args.worker
+    # Оцениваем одиночные запросы: окно микропакетирования только добавило бы задержку
+    faq_matcher.BATCH_MAX_SIZE = 0
+
+    started = time.perf_counter()
+    if not faq_matcher.load_model():
+        raise SystemExit(f"Не удалось загрузить бэкенд {args.worker}")
+    # Индекс строится только в памяти: векторы оцениваемого бэкенда не должны попасть в faq_embeddings бота
+    index, _ = faq_matcher.build_index()
+    if index is None:
+        raise SystemExit("Не удалось прочитать FAQ из базы")
+    load_seconds = time.perf_counter() - started
+
+    # Прогрев: первые вызовы модели заметно медленнее
+    for question, _ in labels[:5]:
+        faq_matcher.search_query(index, question, 1)
+
+    predictions = []
+    latencies = []
+    total_started = time.perf_counter()
+    for question, _ in labels:
+        faq_matcher._query_cache.clear()
+        started = time.perf_counter()
+        matches = faq_matcher.search_query(index, question, 1)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if matches:
+            position, score = matches[0]
+            predictions.append((index.ids[position], score))
+        else:
+            predictions.append((None, 0.0))
+    total_seconds = time.perf_counter() - total_started
+
+    metrics = {
+        "backend": args.worker,
+        "model_key": faq_matcher.EMBEDDING_MODEL_KEY,
+        "search_mode": index.searcher.mode,
+        "faq_size": len(index),
+        "load_seconds": round(load_seconds, 3),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)), 3),
+        "throughput_qps": round(len(labels) / total_seconds, 2),
+        "rss_mb_peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "predictions": predictions,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+
+
+def score_threshold(labels, predictions, threshold):
+    tp = fp = fn = correct = 0
+    for (_, expected), (predicted, score) in zip(labels, predictions):
+        if score < threshold:
+            predicted = None
+        if predicted == expected:
+            correct += 1
+            if expected is not None:
+                tp += 1
+            continue
+        if predicted is not None:
+            fp += 1
+        if expected is not None:
+            fn += 1
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "threshold": threshold,
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "accuracy": round(correct / len(labels), 4),
+        "tp": tp, "fp": fp, "fn": fn,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", required=True, help="CSV с колонками question,expected")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["torch"])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--output", help="Куда записать JSON-отчет (по умолчанию - в stdout)")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    import modules.faq_matcher as faq_matcher
+
+    labels = load_labels(args.labels)
+    report = {
+        "labels_file": os.path.basename(args.labels),
+        "labeled_questions": len(labels),
+        "expected_none": sum(1 for _, expected in labels if expected is None),
+        "current_threshold": faq_matcher.SIMILARITY_THRESHOLD,
+        "backends": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            out = os.path.join(tmp, backend + ".json")
+            subprocess.run([sys.executable, "-m", "benchmarks.eval_faq_matcher", "--worker", backend,
+                            "--labels", args.labels, "--out", out], check=True)
+            with open(out, encoding="utf-8") as f:
+                result = json.load(f)
+
+            predictions = result.pop("predictions")
+            sweep = [score_threshold(labels, predictions, threshold) for threshold in sorted(args.thresholds)]
+            result["thresholds"] = sweep
+            result["best_f1"] = max(sweep, key=lambda row: row["f1"])
+            result["at_current_threshold"] = score_threshold(labels, predictions, faq_matcher.SIMILARITY_THRESHOLD)
+            report["backends"][backend] = result
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
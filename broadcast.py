@@ -0,0 +1,345 @@
+"""
+Массовая рассылка сообщений с учетом ограничений Telegram.
+
+Telegram допускает порядка 30 сообщений в секунду от бота в целом и около одного
+сообщения в секунду в один чат; при превышении отвечает 429 с полем retry_after.
+Здесь оба ограничения соблюдаются ведрами токенов, отправка идет в несколько потоков,
+а при 429 все отправители ждут указанное время и повторяют попытку.
+Рассылка выполняется в фоне; ход и итог можно показывать админу одним редактируемым сообщением.
+Пользователи, заблокировавшие бота или удалившие аккаунт, отмечаются в users недоступными
+и в следующие рассылки не попадают, пока снова не напишут /start.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from telebot.apihelper import ApiTelegramException
+import config
+from modules.cache import LRUCache
+import modules.database as db
+
+GLOBAL_RATE = getattr(config, 'BROADCAST_GLOBAL_RATE', 25.0)
+PER_CHAT_RATE = getattr(config, 'BROADCAST_PER_CHAT_RATE', 1.0)
+CONCURRENCY = getattr(config, 'BROADCAST_CONCURRENCY', 8)
+MAX_ATTEMPTS = getattr(config, 'BROADCAST_MAX_ATTEMPTS', 4)
+PROGRESS_INTERVAL = getattr(config, 'BROADCAST_PROGRESS_INTERVAL', 3.0)
+
+# Пауза перед повтором после сетевой ошибки, умножается на номер попытки
+NETWORK_RETRY_DELAY = 1.0
+
+# Исходы одной попытки отправки
+DELIVERY_SENT = "sent"
+DELIVERY_RETRY = "retry"      # 429 или сетевая ошибка - стоит повторить позже
+DELIVERY_FAILED = "failed"    # Telegram отклонил сообщение, повтор не поможет
+DELIVERY_UNREACHABLE = "unreachable"  # чат недоступен навсегда, пользователь отмечен неактивным
+
+# Виды ошибок отправки
+ERROR_BLOCKED = "blocked"                # 403: бот заблокирован, аккаунт удален или бот исключен из чата
+ERROR_CHAT_NOT_FOUND = "chat_not_found"  # 400: такого чата нет
+ERROR_RATE_LIMIT = "rate_limit"          # 429
+ERROR_NETWORK = "network"                # таймаут, обрыв соединения, 5xx Telegram
+ERROR_PARSE = "parse_entities"           # 400: Telegram не разобрал разметку Markdown/HTML в тексте
+ERROR_BAD_REQUEST = "bad_request"        # прочие 4xx: ошибка в самом сообщении, чат при этом жив
+
+UNREACHABLE_ERRORS = (ERROR_BLOCKED, ERROR_CHAT_NOT_FOUND)
+_CHAT_NOT_FOUND_MARKERS = ("chat not found", "user not found", "peer_id_invalid")
+_PARSE_ERROR_MARKER = "can't parse entities"
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд. pause() останавливает выдачу."""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Общий лимит бота плюс лимит на каждый чат."""
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE):
+        # Небольшой запас в ведре сглаживает старт рассылки, не превышая среднюю скорость
+        self.global_bucket = TokenBucket(global_rate, capacity=max(1.0, global_rate / 5))
+        self.per_chat_rate = per_chat_rate
+        self._chat_buckets = LRUCache(max_size=10000, ttl=60)
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id, None)
+            if bucket is None:
+                bucket = TokenBucket(self.per_chat_rate)
+                self._chat_buckets.put(chat_id, bucket)
+            return bucket
+
+    def acquire(self, chat_id):
+        self._chat_bucket(chat_id).acquire()
+        self.global_bucket.acquire()
+
+    def pause(self, seconds):
+        self.global_bucket.pause(seconds)
+
+
+limiter = RateLimiter()
+
+
+def retry_after(error):
+    """Сколько секунд ждать по ответу 429 (или None, если это не 429)."""
+    if not isinstance(error, ApiTelegramException) or error.error_code != 429:
+        return None
+    parameters = (error.result_json or {}).get('parameters') or {}
+    return parameters.get('retry_after', 1)
+
+
+def classify_error(error):
+    """Вид ошибки отправки (ERROR_*). Сбои соединения считаются сетевыми, прочие исключения - ошибкой запроса."""
+    if isinstance(error, (requests.exceptions.RequestException, ConnectionError, TimeoutError)):
+        return ERROR_NETWORK
+    if not isinstance(error, ApiTelegramException):
+        return ERROR_BAD_REQUEST
+    if error.error_code == 429:
+        return ERROR_RATE_LIMIT
+    if error.error_code == 403:
+        return ERROR_BLOCKED
+    if error.error_code >= 500:
+        return ERROR_NETWORK
+    description = (error.description or "").lower()
+    if error.error_code == 400 and any(marker in description for marker in _CHAT_NOT_FOUND_MARKERS):
+        return ERROR_CHAT_NOT_FOUND
+    if error.error_code == 400 and _PARSE_ERROR_MARKER in description:
+        return ERROR_PARSE
+    return ERROR_BAD_REQUEST
+
+
+def deliver_once(bot, chat_id, text, **kwargs):
+    """
+    Одна попытка отправки через общий ограничитель. Возвращает (исход, ошибка, пауза):
+    при 429 все отправители приостанавливаются на retry_after, и он же возвращается как пауза.
+    Если чат недоступен навсегда, пользователь сразу отмечается в базе неактивным.
+    """
+    limiter.acquire(chat_id)
+    try:
+        bot.send_message(chat_id, text, **kwargs)
+        return DELIVERY_SENT, None, None
+    except Exception as e:
+        kind = classify_error(e)
+        if kind == ERROR_RATE_LIMIT:
+            wait = retry_after(e)
+            limiter.pause(wait)
+            return DELIVERY_RETRY, e, wait
+        if kind == ERROR_NETWORK:
+            return DELIVERY_RETRY, e, None
+        if kind in UNREACHABLE_ERRORS:
+            db.deactivate_user(chat_id, kind)
+            return DELIVERY_UNREACHABLE, e, None
+        return DELIVERY_FAILED, e, None
+
+
+def deliver(bot, chat_id, text, **kwargs):
+    """
+    Отправляет одно сообщение, повторяя попытки после 429 и сетевых ошибок (с нарастающей паузой).
+    Возвращает итоговый исход: DELIVERY_SENT, DELIVERY_FAILED или DELIVERY_UNREACHABLE.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        outcome, error, wait = deliver_once(bot, chat_id, text, **kwargs)
+        if outcome == DELIVERY_SENT:
+            return outcome
+        if outcome == DELIVERY_UNREACHABLE:
+            print(f"Пользователь {chat_id} недоступен и отмечен неактивным: {error}")
+            return outcome
+        if outcome == DELIVERY_FAILED:
+            print(f"Не удалось отправить сообщение пользователю {chat_id}: {error}")
+            return outcome
+        if wait is None:
+            print(f"Сетевая ошибка при отправке пользователю {chat_id} (попытка {attempt}): {error}")
+            time.sleep(NETWORK_RETRY_DELAY * attempt)
+    print(f"Не удалось отправить сообщение пользователю {chat_id}: исчерпаны попытки.")
+    return DELIVERY_FAILED
+
+
+def send(bot, chat_id, text, **kwargs):
+    """То же, что deliver; возвращает True при успехе, False - если сообщение доставить не удалось."""
+    return deliver(bot, chat_id, text, **kwargs) == DELIVERY_SENT
+
+
+class BroadcastJob:
+    """Счетчики одной рассылки. total может быть неизвестен (None), если получатели читаются потоком."""
+
+    def __init__(self, title, total=None):
+        self.title = title
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        # Часть failed: чаты, недоступные навсегда (бот заблокирован, аккаунт удален)
+        self.unreachable = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            if outcome == DELIVERY_SENT:
+                self.sent += 1
+            else:
+                self.failed += 1
+                if outcome == DELIVERY_UNREACHABLE:
+                    self.unreachable += 1
+
+    @property
+    def processed(self):
+        return self.sent + self.failed
+
+    @property
+    def remaining(self):
+        if self.total is None:
+            return None
+        return max(0, self.total - self.processed)
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def eta_seconds(self):
+        if self.remaining is None or not self.processed:
+            return None
+        rate = self.processed / max(time.monotonic() - self.started_at, 1e-6)
+        return self.remaining / rate
+
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} с"
+    return f"{seconds // 60} мин {seconds % 60} с"
+
+
+def format_progress(job):
+    if job.done:
+        text = (
+            f"✅ {job.title}: рассылка завершена за {_format_duration(job.finished_at - job.started_at)}.\n"
+            f"Доставлено: {job.sent}\n"
+            f"Не доставлено: {job.failed}"
+        )
+        if job.unreachable:
+            text += f"\nИз них заблокировали бота или удалили аккаунт: {job.unreachable}"
+        return text
+    lines = [f"📤 {job.title}: идет рассылка...", f"Отправлено: {job.sent}", f"Ошибок: {job.failed}"]
+    if job.remaining is not None:
+        lines.append(f"Осталось: {job.remaining}")
+    eta = job.eta_seconds()
+    if eta is not None:
+        lines.append(f"Примерно осталось времени: {_format_duration(eta)}")
+    return "\n".join(lines)
+
+
+class ProgressReporter:
+    """Одно сообщение админу, которое редактируется по ходу рассылки."""
+
+    def __init__(self, bot, chat_id, job):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.job = job
+        self.message_id = None
+        self._last_text = None
+
+    def update(self):
+        text = format_progress(self.job)
+        if text == self._last_text:
+            return
+        self._last_text = text
+        try:
+            limiter.acquire(self.chat_id)
+            if self.message_id is None:
+                self.message_id = self.bot.send_message(self.chat_id, text).message_id
+            else:
+                self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except Exception as e:
+            print(f"Не удалось обновить ход рассылки для админа {self.chat_id}: {e}")
+
+
+def _run(bot, job, recipients, text, send_kwargs, reporter):
+    # Очередь задач ограничена: получатели читаются по мере отправки, а не все сразу.
+    slots = threading.BoundedSemaphore(CONCURRENCY * 2)
+    all_done = threading.Condition()
+    in_flight = [0]
+
+    def deliver_to(chat_id):
+        try:
+            job.record(deliver(bot, chat_id, text, **send_kwargs))
+        finally:
+            slots.release()
+            with all_done:
+                in_flight[0] -= 1
+                all_done.notify_all()
+
+    last_report = time.monotonic()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="broadcast") as executor:
+        for chat_id in recipients:
+            slots.acquire()
+            with all_done:
+                in_flight[0] += 1
+            executor.submit(deliver_to, chat_id)
+            if reporter and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                reporter.update()
+                last_report = time.monotonic()
+
+        while True:
+            with all_done:
+                if in_flight[0]:
+                    all_done.wait(PROGRESS_INTERVAL)
+                pending = in_flight[0]
+            if not pending:
+                break
+            # Отчет отправляется без блокировки: отправителям она нужна, чтобы отметить завершение
+            if reporter and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                reporter.update()
+                last_report = time.monotonic()
+
+    job.finished_at = time.monotonic()
+    if reporter:
+        reporter.update()
+    print(f"Рассылка '{job.title}' завершена: доставлено {job.sent}, не доставлено {job.failed}.")
+
+
+def start_broadcast(bot, recipients, text, title, report_chat_id=None, total=None, **send_kwargs):
+    """
+    Запускает рассылку text всем recipients (любой итерируемый набор chat_id) в фоновом потоке
+    и сразу возвращает BroadcastJob. Если задан report_chat_id, туда отправляется сообщение
+    с ходом рассылки, которое обновляется на месте. send_kwargs передаются в bot.send_message.
+    """
+    if total is None and hasattr(recipients, '__len__'):
+        total = len(recipients)
+    job = BroadcastJob(title, total)
+    reporter = ProgressReporter(bot, report_chat_id, job) if report_chat_id else None
+    if reporter:
+        reporter.update()
+    threading.Thread(
+        target=_run,
+        args=(bot, job, recipients, text, send_kwargs, reporter),
+        name="broadcast-coordinator",
+        daemon=True
+    ).start()
+    return job
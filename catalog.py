@@ -0,0 +1,102 @@
+import threading
+from types import MappingProxyType
+import modules.database as db
+import modules.invalidation as invalidation
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок справочника классов и групп.
+    Кортежи строк совпадают по форме с результатами соответствующих функций database.py.
+    """
+
+    __slots__ = ('classes', 'groups_with_classes', '_groups_by_class', '_group_info')
+
+    def __init__(self, classes, groups):
+        groups_by_class = {}
+        group_info = {}
+        groups_with_classes = []
+        for group_id, class_id, group_name, class_number in groups:
+            groups_by_class.setdefault(class_id, []).append((group_id, group_name))
+            group_info[group_id] = (group_id, group_name, class_number)
+            groups_with_classes.append((group_id, class_number, group_name))
+
+        self.classes = tuple(tuple(row) for row in classes)
+        self.groups_with_classes = tuple(groups_with_classes)
+        self._groups_by_class = MappingProxyType({class_id: tuple(rows) for class_id, rows in groups_by_class.items()})
+        self._group_info = MappingProxyType(group_info)
+
+    def groups_for_class(self, class_id):
+        return self._groups_by_class.get(class_id, ())
+
+    def group_info(self, group_id):
+        return self._group_info.get(group_id)
+
+
+EMPTY_SNAPSHOT = CatalogSnapshot((), ())
+
+_snapshot = None
+_generation = 0
+_rebuild_lock = threading.Lock()
+
+
+def refresh():
+    """Перечитывает справочник из БД и атомарно подменяет снимок. Возвращает новый снимок или None."""
+    global _snapshot
+    with _rebuild_lock:
+        generation = _generation
+        data = db.load_catalog()
+        if data is None:
+            return None
+        snapshot = CatalogSnapshot(*data)
+        # Если во время чтения пришла инвалидация, снимок мог устареть - не закрепляем его.
+        _snapshot = snapshot if generation == _generation else None
+        return snapshot
+
+
+def get_catalog():
+    """Текущий снимок; строится при первом обращении и после инвалидации."""
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    return refresh() or EMPTY_SNAPSHOT
+
+
+def get_all_classes():
+    return get_catalog().classes
+
+
+def get_groups_for_class(class_id):
+    return get_catalog().groups_for_class(class_id)
+
+
+def get_group_info(group_id):
+    return get_catalog().group_info(group_id)
+
+
+def get_all_groups_with_classes():
+    return get_catalog().groups_with_classes
+
+
+def add_class_group(class_number, group_name):
+    result = db.add_class_group(class_number, group_name)
+    if result[0]:
+        refresh()
+    return result
+
+
+def delete_group(group_id):
+    if db.delete_group_by_id(group_id):
+        refresh()
+        return True
+    return False
+
+
+def _on_catalog_changed(group_id, version):
+    # Изменение пришло из другого процесса - снимок перестроится при следующем обращении.
+    global _snapshot, _generation
+    _generation += 1
+    _snapshot = None
+
+
+invalidation.subscribe(invalidation.ENTITY_CATALOG, _on_catalog_changed)
@@ -1,113 +1,102 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import config
 import datetime
+import threading
+from contextlib import contextmanager
+from modules.db_pool import ConnectionPool
+import modules.migrations as migrations
+from modules.cache import LRUCache, MISSING
+import modules.invalidation as invalidation
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_user_group_cache = LRUCache(
+    max_size=getattr(config, 'USER_GROUP_CACHE_SIZE', 10000),
+    ttl=getattr(config, 'USER_GROUP_CACHE_TTL', 600)
+)
+
+def _connect():
+    return psycopg2.connect(
+        host=config.PG_HOST,
+        port=config.PG_PORT,
+        database=config.PG_DATABASE,
+        user=config.PG_USER,
+        password=config.PG_PASSWORD
+    )
+
+def get_db_pool():
+    """Возвращает общий пул соединений, создавая его при первом обращении."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    min_size=getattr(config, 'PG_POOL_MIN_SIZE', 1),
+                    max_size=getattr(config, 'PG_POOL_MAX_SIZE', 10),
+                    timeout=getattr(config, 'PG_POOL_TIMEOUT', 5.0),
+                    health_check_interval=getattr(config, 'PG_POOL_HEALTH_CHECK_INTERVAL', 30.0)
+                )
+    return _pool
 
 def get_db_connection():
+    """Берет соединение из пула. Его обязательно нужно вернуть через release_db_connection."""
     try:
-        conn = psycopg2.connect(
-            host=config.PG_HOST,
-            port=config.PG_PORT,
-            database=config.PG_DATABASE,
-            user=config.PG_USER,
-            password=config.PG_PASSWORD
-        )
-        return conn
+        return get_db_pool().getconn()
     except psycopg2.Error as e:
         print(f"Ошибка подключения к базе данных: {e}")
         return None
 
-def init_db():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
+def release_db_connection(conn):
+    """Возвращает соединение в пул."""
+    if conn is not None:
+        get_db_pool().putconn(conn)
 
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS support_requests (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    username VARCHAR(255),
-                    full_name VARCHAR(255),
-                    description TEXT NOT NULL,
-                    status VARCHAR(50) DEFAULT 'Открыт',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    assigned_to BIGINT,
-                    resolved_at TIMESTAMP
-                );
-            """)
+@contextmanager
+def db_connection():
+    """Контекстный менеджер: выдает соединение из пула (или None) и возвращает его по выходу."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
 
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS faq (
-                    id SERIAL PRIMARY KEY,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    category VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
+def get_db_pool_stats():
+    """Статистика пула: выдачи, ожидания, таймауты, занятые/свободные соединения."""
+    return get_db_pool().stats()
 
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS classes (
-                    id SERIAL PRIMARY KEY,
-                    class_number INT UNIQUE NOT NULL
-                );
-            """)
+def start_invalidation_listener():
+    """Подписывает процесс на события изменения данных от других процессов бота."""
+    invalidation.start_listener(_connect)
 
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS class_groups (
-                    id SERIAL PRIMARY KEY,
-                    class_id INT NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
-                    group_name VARCHAR(10) NOT NULL,
-                    UNIQUE(class_id, group_name)
-                );
-            """)
+def close_db_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
 
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id BIGINT PRIMARY KEY,
-                    username VARCHAR(255),
-                    first_name VARCHAR(255),
-                    last_name VARCHAR(255),
-                    is_admin BOOLEAN DEFAULT FALSE,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    group_id INT REFERENCES class_groups(id) ON DELETE SET NULL
-                );
-            """)
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS schedules (
-                    id SERIAL PRIMARY KEY,
-                    group_id INT UNIQUE NOT NULL REFERENCES class_groups(id) ON DELETE CASCADE,
-                    schedule_text TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS support_messages (
-                    id SERIAL PRIMARY KEY,
-                    request_id INTEGER NOT NULL REFERENCES support_requests(id) ON DELETE CASCADE,
-                    sender_id BIGINT NOT NULL,
-                    sender_name VARCHAR(255),
-                    sender_type VARCHAR(10) NOT NULL,
-                    message_text TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            cur.execute("INSERT INTO classes (class_number) SELECT i FROM generate_series(1, 11) AS i ON CONFLICT (class_number) DO NOTHING;")
-
-            conn.commit()
-            print("База данных инициализирована успешно.")
+def init_db():
+    conn = get_db_connection()
+    if conn:
+        try:
+            applied = migrations.migrate(conn)
+            if applied:
+                print(f"Применены миграции схемы: {', '.join(map(str, applied))}.")
+            print(f"База данных инициализирована успешно (версия схемы {migrations.LATEST_VERSION}).")
         except psycopg2.Error as e:
             print(f"Ошибка при инициализации базы данных: {e}")
-            conn.rollback()
         finally:
-            cur.close()
-            conn.close()
+            release_db_connection(conn)
 
-def add_support_request(user_id, username, full_name, description):
+def add_support_request(user_id, username, full_name, description, build_notification=None):
+    """
+    Создает запрос и возвращает его id. build_notification(request_id) -> (chat_ids, уведомление outbox.message)
+    ставит уведомление в очередь в той же транзакции.
+    """
     conn = get_db_connection()
     if conn:
         try:
@@ -120,6 +109,8 @@ def add_support_request(user_id, username, full_name, description):
                 (user_id, username, full_name, description)
             )
             request_id = cur.fetchone()[0]
+            if build_notification:
+                _enqueue_notification(cur, *build_notification(request_id))
             conn.commit()
             return request_id
         except psycopg2.Error as e:
@@ -128,7 +119,7 @@ def add_support_request(user_id, username, full_name, description):
             return None
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
 def add_support_message(request_id, sender_id, sender_name, sender_type, message_text):
     conn = get_db_connection()
@@ -148,7 +139,7 @@ def add_support_message(request_id, sender_id, sender_name, sender_type, message
             conn.rollback()
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_messages_for_request(request_id):
     conn = get_db_connection()
@@ -168,7 +159,7 @@ def get_messages_for_request(request_id):
             return []
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
 def get_user_support_requests(user_id):
     conn = get_db_connection()
@@ -189,7 +180,7 @@ def get_user_support_requests(user_id):
             return []
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_all_faq_items():
     conn = get_db_connection()
@@ -204,7 +195,107 @@ def get_all_faq_items():
             return []
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+
+def get_faq_rows_with_embedding_meta(model_name):
+    """
+    Возвращает (id, question, answer, model_name, question_hash) всех FAQ; model_name и question_hash
+    равны None, если эмбеддинг для этой модели еще не сохранен. None при ошибке. Сами векторы не читаются.
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT f.id, f.question, f.answer, e.model_name, e.question_hash
+                FROM faq f
+                LEFT JOIN faq_embeddings e ON e.faq_id = f.id AND e.model_name = %s
+                ORDER BY f.id;
+            """, (model_name,))
+            return [(faq_id, question, answer, model_name, bytes(question_hash) if question_hash is not None else None)
+                    for faq_id, question, answer, model_name, question_hash in cur.fetchall()]
+        except psycopg2.Error as e:
+            print(f"Ошибка при получении FAQ: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def get_faq_embeddings(faq_ids, model_name):
+    """Возвращает {faq_id: bytes} сохраненных эмбеддингов модели model_name для указанных FAQ."""
+    if not faq_ids:
+        return {}
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT faq_id, embedding FROM faq_embeddings WHERE faq_id = ANY(%s) AND model_name = %s;",
+                (list(faq_ids), model_name)
+            )
+            return {faq_id: bytes(embedding) for faq_id, embedding in cur.fetchall()}
+        except psycopg2.Error as e:
+            print(f"Ошибка при получении эмбеддингов FAQ: {e}")
+            return {}
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return {}
+
+def save_faq_embeddings(rows):
+    """rows - список (faq_id, model_name, question_hash, embedding_bytes)."""
+    if not rows:
+        return True
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                INSERT INTO faq_embeddings (faq_id, model_name, question_hash, embedding)
+                SELECT v.faq_id, v.model_name, v.question_hash, v.embedding
+                FROM (VALUES %s) AS v(faq_id, model_name, question_hash, embedding)
+                JOIN faq f ON f.id = v.faq_id
+                ON CONFLICT (faq_id, model_name) DO UPDATE SET
+                    question_hash = EXCLUDED.question_hash,
+                    embedding = EXCLUDED.embedding,
+                    updated_at = CURRENT_TIMESTAMP;
+                """,
+                [(faq_id, model_name, psycopg2.Binary(question_hash), psycopg2.Binary(embedding))
+                 for faq_id, model_name, question_hash, embedding in rows],
+                template="(%s::int, %s::varchar, %s::bytea, %s::bytea)",
+                page_size=500
+            )
+            conn.commit()
+            return True
+        except psycopg2.Error as e:
+            print(f"Ошибка при сохранении эмбеддингов FAQ: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
+
+def add_faq_item(question, answer):
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO faq (question, answer) VALUES (%s, %s);", (question, answer))
+            invalidation.publish(cur, invalidation.ENTITY_FAQ, version=datetime.datetime.now())
+            conn.commit()
+            return True
+        except psycopg2.Error as e:
+            print(f"Ошибка при добавлении FAQ: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
 
 def get_all_support_requests():
     conn = get_db_connection()
@@ -224,7 +315,52 @@ def get_all_support_requests():
             return []
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+
+def get_support_requests_page(status=None, cursor=None, direction='next', limit=10):
+    """
+    Страница запросов (новые сверху) с keyset-пагинацией по (created_at, id).
+    cursor - (created_at, id) крайней строки уже показанной страницы: для direction='next'
+    берутся более старые запросы, для 'prev' - более новые. Возвращает (rows, has_more).
+    """
+    conditions = []
+    params = []
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if cursor:
+        conditions.append("(created_at, id) < (%s, %s)" if direction == 'next' else "(created_at, id) > (%s, %s)")
+        params.extend(cursor)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    order = "DESC" if direction == 'next' else "ASC"
+    params.append(limit + 1)
+
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT id, user_id, username, full_name, description, status, created_at
+                FROM support_requests {where}
+                ORDER BY created_at {order}, id {order}
+                LIMIT %s;
+                """,
+                params
+            )
+            rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if direction != 'next':
+                rows.reverse()
+            return rows, has_more
+        except psycopg2.Error as e:
+            print(f"Ошибка при получении страницы запросов: {e}")
+            return [], False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return [], False
 
 def get_new_support_requests(minutes_threshold=10):
     conn = get_db_connection()
@@ -248,7 +384,7 @@ def get_new_support_requests(minutes_threshold=10):
             return []
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_support_request_by_id(request_id):
     conn = get_db_connection()
@@ -269,9 +405,55 @@ def get_support_request_by_id(request_id):
             return None
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
-def update_support_request_status(request_id, new_status, admin_id=None):
+def get_support_request_with_history(request_id, limit=5, offset=0):
+    """
+    Одним запросом возвращает (request, messages, total_messages): заголовок запроса,
+    окно из limit сообщений, пропустив offset самых новых (в хронологическом порядке),
+    и общее число сообщений. None, если запрос не найден или произошла ошибка.
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT r.id, r.user_id, r.username, r.full_name, r.description, r.status, r.created_at,
+                       cnt.total, m.sender_name, m.sender_type, m.message_text, m.created_at
+                FROM support_requests r
+                CROSS JOIN LATERAL (
+                    SELECT count(*) AS total FROM support_messages WHERE request_id = r.id
+                ) cnt
+                LEFT JOIN LATERAL (
+                    SELECT sender_name, sender_type, message_text, created_at, id
+                    FROM support_messages
+                    WHERE request_id = r.id
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s OFFSET %s
+                ) m ON TRUE
+                WHERE r.id = %s
+                ORDER BY m.created_at ASC, m.id ASC;
+                """,
+                (limit, offset, request_id)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                return None
+            request = rows[0][:7]
+            total = rows[0][7]
+            messages = [row[8:] for row in rows if row[9] is not None]
+            return request, messages, total
+        except psycopg2.Error as e:
+            print(f"Ошибка при получении запроса с историей: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def update_support_request_status(request_id, new_status, admin_id=None, notification=None):
+    """Меняет статус запроса; notification (outbox.message) ставится в очередь автору запроса в той же транзакции."""
     conn = get_db_connection()
     if conn:
         try:
@@ -280,7 +462,7 @@ def update_support_request_status(request_id, new_status, admin_id=None):
                 cur.execute(
                     """
                     UPDATE support_requests SET status = %s, assigned_to = %s, resolved_at = CURRENT_TIMESTAMP
-                    WHERE id = %s;
+                    WHERE id = %s RETURNING user_id;
                     """,
                     (new_status, admin_id, request_id)
                 )
@@ -288,10 +470,13 @@ def update_support_request_status(request_id, new_status, admin_id=None):
                 cur.execute(
                     """
                     UPDATE support_requests SET status = %s, assigned_to = %s
-                    WHERE id = %s;
+                    WHERE id = %s RETURNING user_id;
                     """,
                     (new_status, admin_id, request_id)
                 )
+            row = cur.fetchone()
+            if notification and row:
+                _enqueue_notification(cur, [row[0]], notification)
             conn.commit()
             return True
         except psycopg2.Error as e:
@@ -300,7 +485,7 @@ def update_support_request_status(request_id, new_status, admin_id=None):
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 
 def add_or_update_user(user_id, username, first_name, last_name, is_admin=False):
@@ -328,32 +513,257 @@ def add_or_update_user(user_id, username, first_name, last_name, is_admin=False)
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
-def update_schedule(group_id, schedule_text):
+# id пользователей, отмеченных недоступными: по нему /start обращается к БД только ради них.
+# None - набор еще не загружен или сброшен после переподключения слушателя инвалидации.
+_inactive_users = None
+_inactive_users_lock = threading.Lock()
+
+def _load_inactive_users():
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM users WHERE NOT is_active;")
+            return {row[0] for row in cur.fetchall()}
+        except psycopg2.Error as e:
+            print(f"Ошибка при загрузке недоступных пользователей: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def is_user_inactive(user_id):
+    """Отмечен ли пользователь недоступным. Если набор не удалось загрузить, отвечает True - пусть решит БД."""
+    global _inactive_users
+    with _inactive_users_lock:
+        inactive = _inactive_users
+    if inactive is None:
+        inactive = _load_inactive_users()
+        if inactive is None:
+            return True
+        with _inactive_users_lock:
+            if _inactive_users is None:
+                _inactive_users = inactive
+            inactive = _inactive_users
+    return user_id in inactive
+
+def _mark_inactive(user_id, inactive):
+    with _inactive_users_lock:
+        if _inactive_users is None:
+            return
+        if inactive:
+            _inactive_users.add(user_id)
+        else:
+            _inactive_users.discard(user_id)
+
+def _on_user_active_changed(user_id, version):
+    global _inactive_users
+    if user_id is None:
+        with _inactive_users_lock:
+            _inactive_users = None
+    else:
+        _mark_inactive(user_id, not version)
+
+invalidation.subscribe(invalidation.ENTITY_USER_ACTIVE, _on_user_active_changed)
+
+def deactivate_user(user_id, reason):
+    """
+    Отмечает пользователя недоступным (заблокировал бота, удалил аккаунт): рассылки его пропускают.
+    Ожидающие отправки уведомления для него сразу переводятся в 'dead'.
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE users SET is_active = FALSE, deactivated_at = CURRENT_TIMESTAMP, deactivation_reason = %s
+                WHERE id = %s AND is_active;
+                """,
+                (reason, user_id)
+            )
+            deactivated = cur.rowcount > 0
+            cur.execute(
+                """
+                UPDATE notification_outbox SET status = 'dead', last_error = %s, locked_at = NULL
+                WHERE chat_id = %s AND status = 'pending';
+                """,
+                (reason, user_id)
+            )
+            if deactivated:
+                invalidation.publish(cur, invalidation.ENTITY_USER_ACTIVE, user_id, False)
+            conn.commit()
+            _mark_inactive(user_id, True)
+            return deactivated
+        except psycopg2.Error as e:
+            print(f"Ошибка при отметке пользователя {user_id} недоступным: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
+
+def reactivate_user(user_id):
+    """
+    Снимает отметку недоступности (пользователь снова написал боту). True, если отметка была.
+    Для доступных пользователей в БД не обращается (см. is_user_inactive).
+    """
+    if not is_user_inactive(user_id):
+        return False
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE users SET is_active = TRUE, deactivated_at = NULL, deactivation_reason = NULL
+                WHERE id = %s AND NOT is_active;
+                """,
+                (user_id,)
+            )
+            reactivated = cur.rowcount > 0
+            if reactivated:
+                invalidation.publish(cur, invalidation.ENTITY_USER_ACTIVE, user_id, True)
+            conn.commit()
+            _mark_inactive(user_id, False)
+            return reactivated
+        except psycopg2.Error as e:
+            print(f"Ошибка при повторной активации пользователя {user_id}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
+
+def upsert_users(users):
+    """Пакетный вариант add_or_update_user: users - список (user_id, username, first_name, last_name, is_admin)."""
+    if not users:
+        return True
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                INSERT INTO users (id, username, first_name, last_name, is_admin)
+                VALUES %s
+                ON CONFLICT (id) DO UPDATE SET
+                    username = EXCLUDED.username,
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    is_admin = EXCLUDED.is_admin;
+                """,
+                users,
+                page_size=1000
+            )
+            conn.commit()
+            return True
+        except psycopg2.Error as e:
+            print(f"Ошибка при пакетном обновлении пользователей: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
+
+def update_schedule(group_id, schedule_text, build_notification=None, debounce_seconds=0):
+    """
+    Сохраняет расписание группы. Возвращает (updated_at, queued): updated_at - новая версия или False
+    при ошибке, queued - {'batch_id', 'send_in'} поставленного в очередь уведомления или None.
+
+    Уведомление ученикам откладывается на debounce_seconds. Правки, пришедшие в это окно,
+    заменяют еще не отправленное уведомление новым: build_notification(base_text) получает
+    расписание, каким оно было до первой правки окна, и возвращает outbox.message или None.
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            # Блокировка группы упорядочивает одновременные правки одного расписания
+            cur.execute("SELECT id FROM class_groups WHERE id = %s FOR NO KEY UPDATE;", (group_id,))
+            cur.execute("SELECT schedule_text FROM schedules WHERE group_id = %s;", (group_id,))
+            row = cur.fetchone()
+            previous_text = row[0] if row else None
             cur.execute(
                 """
                 INSERT INTO schedules (group_id, schedule_text, updated_at)
                 VALUES (%s, %s, CURRENT_TIMESTAMP)
                 ON CONFLICT (group_id) DO UPDATE SET
                     schedule_text = EXCLUDED.schedule_text,
-                    updated_at = EXCLUDED.updated_at;
+                    updated_at = EXCLUDED.updated_at
+                RETURNING updated_at;
                 """,
                 (group_id, schedule_text)
             )
+            updated_at = cur.fetchone()[0]
+            invalidation.publish(cur, invalidation.ENTITY_SCHEDULE, group_id, updated_at)
+            queued = None
+            if build_notification:
+                queued = _queue_schedule_notification(cur, group_id, previous_text, build_notification, debounce_seconds)
             conn.commit()
-            return True
+            return updated_at, queued
         except psycopg2.Error as e:
             print(f"Ошибка при обновлении расписания: {e}")
             conn.rollback()
-            return False
+            return False, None
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+    return False, None
+
+def _queue_schedule_notification(cur, group_id, previous_text, build_notification, debounce_seconds):
+    cur.execute(
+        """
+        SELECT base_schedule_text, batch_id
+        FROM schedule_notification_windows
+        WHERE group_id = %s AND send_after > CURRENT_TIMESTAMP
+        FOR UPDATE;
+        """,
+        (group_id,)
+    )
+    window = cur.fetchone()
+    if window:
+        # Окно еще открыто: неотправленное уведомление заменяется новым, посчитанным от того же исходного расписания
+        base_text, batch_id = window
+        cur.execute("DELETE FROM notification_outbox WHERE batch_id = %s AND status = 'pending';", (batch_id,))
+    else:
+        base_text, batch_id = previous_text, None
+
+    notification = build_notification(base_text)
+    if notification is None:
+        return None
+
+    if batch_id:
+        notification = dict(notification, batch_id=batch_id)
+    else:
+        cur.execute(
+            """
+            INSERT INTO schedule_notification_windows (group_id, base_schedule_text, batch_id, send_after)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            ON CONFLICT (group_id) DO UPDATE SET
+                base_schedule_text = EXCLUDED.base_schedule_text,
+                batch_id = EXCLUDED.batch_id,
+                send_after = EXCLUDED.send_after;
+            """,
+            (group_id, base_text, notification['batch_id'], debounce_seconds)
+        )
+    cur.execute(
+        """
+        SELECT send_after, EXTRACT(EPOCH FROM send_after - CURRENT_TIMESTAMP)
+        FROM schedule_notification_windows WHERE group_id = %s;
+        """,
+        (group_id,)
+    )
+    send_after, send_in = cur.fetchone()
+    _enqueue_group_notification(cur, group_id, notification, send_after)
+    return {'batch_id': notification['batch_id'], 'send_in': max(0.0, float(send_in))}
 
 def get_schedule_for_group(group_id):
     conn = get_db_connection()
@@ -368,7 +778,24 @@ def get_schedule_for_group(group_id):
             return None
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+
+def get_schedule_with_version(group_id):
+    """Возвращает (schedule_text, updated_at); (None, None), если расписания нет; None при ошибке."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT schedule_text, updated_at FROM schedules WHERE group_id = %s;", (group_id,))
+            result = cur.fetchone()
+            return result if result else (None, None)
+        except psycopg2.Error as e:
+            print(f"Ошибка при получении расписания: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
 
 def delete_all_support_requests():
     """Удаляет ВСЕ запросы и сообщения техподдержки."""
@@ -386,7 +813,7 @@ def delete_all_support_requests():
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def delete_support_request_by_id(request_id):
     """Удаляет один запрос по ID."""
@@ -403,7 +830,7 @@ def delete_support_request_by_id(request_id):
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def delete_user_support_requests(user_id):
     """Удаляет все запросы конкретного пользователя."""
@@ -420,26 +847,67 @@ def delete_user_support_requests(user_id):
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def bulk_update_faq(faq_items):
-    """Массово обновляет FAQ: удаляет старые и вставляет новые."""
+    """
+    Приводит FAQ к переданному списку (вопрос, ответ) одной транзакцией, не очищая таблицу:
+    новые вопросы вставляются, у существующих обновляется ответ, отсутствующие удаляются.
+    Возвращает словарь со списками id: {'inserted': [...], 'updated': [...], 'deleted': [...]} или None при ошибке.
+    """
+    desired = {}
+    for question, answer in faq_items:
+        desired[question] = answer
+
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("TRUNCATE TABLE faq RESTART IDENTITY;")
-            for question, answer in faq_items:
-                cur.execute("INSERT INTO faq (question, answer) VALUES (%s, %s);", (question, answer))
+            # Не мешает читателям, но сериализует одновременные массовые обновления.
+            cur.execute("LOCK TABLE faq IN SHARE ROW EXCLUSIVE MODE;")
+            cur.execute("SELECT id, question, answer FROM faq ORDER BY id;")
+
+            existing = {}
+            to_delete = []
+            for faq_id, question, answer in cur.fetchall():
+                if question in existing or question not in desired:
+                    to_delete.append(faq_id)
+                else:
+                    existing[question] = (faq_id, answer)
+
+            to_update = [(existing[q][0], a) for q, a in desired.items() if q in existing and existing[q][1] != a]
+            to_insert = [(q, a) for q, a in desired.items() if q not in existing]
+
+            inserted_ids = []
+            if to_insert:
+                rows = execute_values(cur, "INSERT INTO faq (question, answer) VALUES %s RETURNING id;", to_insert, page_size=1000, fetch=True)
+                inserted_ids = [row[0] for row in rows]
+            if to_update:
+                execute_values(
+                    cur,
+                    "UPDATE faq SET answer = v.answer FROM (VALUES %s) AS v(id, answer) WHERE faq.id = v.id;",
+                    to_update,
+                    page_size=1000
+                )
+            if to_delete:
+                cur.execute("DELETE FROM faq WHERE id = ANY(%s);", (to_delete,))
+
+            if inserted_ids or to_update or to_delete:
+                invalidation.publish(cur, invalidation.ENTITY_FAQ, version=datetime.datetime.now())
             conn.commit()
-            return True
+            return {
+                'inserted': inserted_ids,
+                'updated': [faq_id for faq_id, _ in to_update],
+                'deleted': to_delete,
+            }
         except psycopg2.Error as e:
             print(f"Ошибка при массовом обновлении FAQ: {e}")
             conn.rollback()
-            return False
+            return None
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+    return None
 
 def delete_all_faq_items():
     """Удаляет все элементы FAQ."""
@@ -447,7 +915,9 @@ def delete_all_faq_items():
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("TRUNCATE TABLE faq RESTART IDENTITY;")
+            # faq_embeddings ссылается на faq, а ON DELETE CASCADE на TRUNCATE не действует
+            cur.execute("TRUNCATE TABLE faq, faq_embeddings RESTART IDENTITY;")
+            invalidation.publish(cur, invalidation.ENTITY_FAQ, version=datetime.datetime.now())
             conn.commit()
             return True
         except psycopg2.Error as e:
@@ -456,37 +926,27 @@ def delete_all_faq_items():
             return False
         finally:
             cur.close()
-            conn.close()
-
-def get_all_user_ids():
-    """Возвращает список всех уникальных user_id из таблицы users."""
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM users WHERE is_admin IS NOT TRUE;")
-            user_ids = [row[0] for row in cur.fetchall()]
-            return user_ids
-        except psycopg2.Error as e:
-            print(f"Ошибка при получении всех user_id: {e}")
-            return []
-        finally:
-            cur.close()
-            conn.close()
-    return []
+            release_db_connection(conn)
 
 
 def get_user_group(user_id):
+    """Группа пользователя; читается через кэш, который поддерживают set_user_group и delete_group_by_id."""
+    group_id = _user_group_cache.get(user_id)
+    if group_id is not MISSING:
+        return group_id
+
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
             cur.execute("SELECT group_id FROM users WHERE id = %s;", (user_id,))
             result = cur.fetchone()
-            return result[0] if result else None
+            group_id = result[0] if result else None
+            _user_group_cache.put(user_id, group_id)
+            return group_id
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def set_user_group(user_id, group_id):
     conn = get_db_connection()
@@ -494,15 +954,42 @@ def set_user_group(user_id, group_id):
         try:
             cur = conn.cursor()
             cur.execute("UPDATE users SET group_id = %s WHERE id = %s;", (group_id, user_id))
+            invalidation.publish(cur, invalidation.ENTITY_USER_GROUP, user_id)
             conn.commit()
+            if cur.rowcount:
+                _user_group_cache.put(user_id, group_id)
+            else:
+                _user_group_cache.invalidate(user_id)
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при установке группы для пользователя: {e}")
             conn.rollback()
+            _user_group_cache.invalidate(user_id)
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+
+def get_user_group_cache_stats():
+    return _user_group_cache.stats()
+
+def _evict_group_members(group_id):
+    _user_group_cache.invalidate_where(lambda user_id, cached_group_id: cached_group_id == group_id)
+
+def _on_user_group_changed(user_id, version):
+    if user_id is None:
+        _user_group_cache.clear()
+    else:
+        _user_group_cache.invalidate(user_id)
+
+def _on_catalog_changed(group_id, version):
+    if group_id is None:
+        _user_group_cache.clear()
+    else:
+        _evict_group_members(group_id)
+
+invalidation.subscribe(invalidation.ENTITY_USER_GROUP, _on_user_group_changed)
+invalidation.subscribe(invalidation.ENTITY_CATALOG, _on_catalog_changed)
 
 def get_all_classes():
     conn = get_db_connection()
@@ -513,7 +1000,7 @@ def get_all_classes():
             return cur.fetchall()
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_groups_for_class(class_id):
     conn = get_db_connection()
@@ -524,7 +1011,7 @@ def get_groups_for_class(class_id):
             return cur.fetchall()
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_group_info(group_id):
     conn = get_db_connection()
@@ -540,7 +1027,31 @@ def get_group_info(group_id):
             return cur.fetchone()
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+
+def load_catalog():
+    """Читает справочник классов и групп одним соединением. Возвращает (classes, groups) или None при ошибке."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id, class_number FROM classes ORDER BY class_number;")
+            classes = cur.fetchall()
+            cur.execute("""
+                SELECT g.id, g.class_id, g.group_name, c.class_number
+                FROM class_groups g
+                JOIN classes c ON g.class_id = c.id
+                ORDER BY c.class_number, g.group_name;
+            """)
+            groups = cur.fetchall()
+            return classes, groups
+        except psycopg2.Error as e:
+            print(f"Ошибка при загрузке справочника классов: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
 
 def add_class_group(class_number, group_name):
     conn = get_db_connection()
@@ -552,7 +1063,9 @@ def add_class_group(class_number, group_name):
             if not class_id_row: return False, "Класс не найден"
 
             class_id = class_id_row[0]
-            cur.execute("INSERT INTO class_groups (class_id, group_name) VALUES (%s, %s);", (class_id, group_name.upper()))
+            cur.execute("INSERT INTO class_groups (class_id, group_name) VALUES (%s, %s) RETURNING id;", (class_id, group_name.upper()))
+            group_id = cur.fetchone()[0]
+            invalidation.publish(cur, invalidation.ENTITY_CATALOG, group_id)
             conn.commit()
             return True, "Группа успешно добавлена"
         except psycopg2.IntegrityError:
@@ -563,7 +1076,7 @@ def add_class_group(class_number, group_name):
             return False, str(e)
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def get_all_groups_with_classes():
     conn = get_db_connection()
@@ -579,7 +1092,7 @@ def get_all_groups_with_classes():
             return cur.fetchall()
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
 
 def delete_group_by_id(group_id):
     conn = get_db_connection()
@@ -587,7 +1100,10 @@ def delete_group_by_id(group_id):
         try:
             cur = conn.cursor()
             cur.execute("DELETE FROM class_groups WHERE id = %s;", (group_id,))
+            invalidation.publish(cur, invalidation.ENTITY_CATALOG, group_id)
             conn.commit()
+            # ON DELETE SET NULL отвязал учеников группы - их закэшированные значения устарели.
+            _evict_group_members(group_id)
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при удалении группы: {e}")
@@ -595,15 +1111,15 @@ def delete_group_by_id(group_id):
             return False
         finally:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
 def get_user_ids_for_group(group_id):
-    """Возвращает список user_id для конкретной группы."""
+    """Возвращает список user_id доступных для бота учеников конкретной группы."""
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("SELECT id FROM users WHERE group_id = %s AND is_admin IS NOT TRUE;", (group_id,))
+            cur.execute("SELECT id FROM users WHERE group_id = %s AND is_admin IS NOT TRUE AND is_active;", (group_id,))
             user_ids = [row[0] for row in cur.fetchall()]
             return user_ids
         except psycopg2.Error as e:
@@ -611,5 +1127,213 @@ def get_user_ids_for_group(group_id):
             return []
         finally:
             cur.close()
-            conn.close()
-    return []
\ No newline at end of file
+            release_db_connection(conn)
+    return []
+
+def _recipients_query(group_ids):
+    """Запрос id доступных учеников: всех (group_ids is None) или только из перечисленных групп."""
+    if group_ids is None:
+        return "SELECT id FROM users WHERE is_admin IS NOT TRUE AND is_active", ()
+    return "SELECT id FROM users WHERE group_id = ANY(%s) AND is_admin IS NOT TRUE AND is_active", (list(group_ids),)
+
+def count_recipients(group_ids=None):
+    """Сколько учеников получит рассылку (см. iter_recipient_ids). None при ошибке."""
+    query, params = _recipients_query(group_ids)
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM ({query}) AS recipients;", params)
+            return cur.fetchone()[0]
+        except psycopg2.Error as e:
+            print(f"Ошибка при подсчете получателей рассылки: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def _recipient_ids_page(query, params, after_id, limit):
+    """Следующие limit id из запроса получателей по возрастанию, больше after_id. None при ошибке."""
+    if after_id is not None:
+        query += " AND id > %s"
+        params += (after_id,)
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"{query} ORDER BY id LIMIT %s;", params + (limit,))
+            return [row[0] for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            print(f"Ошибка при чтении получателей рассылки: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def iter_recipient_ids(group_ids=None, batch_size=2000):
+    """
+    Генератор id доступных учеников для рассылки: всех или только из group_ids.
+    Id читаются страницами по batch_size по первичному ключу (id > последний выданный),
+    список целиком в памяти не собирается. Соединение берется из пула на время одной страницы,
+    так что долгая рассылка его не удерживает. Ученики, добавленные во время рассылки
+    с id больше уже выданных, тоже ее получат; повторов и пропусков существующих нет.
+    """
+    query, params = _recipients_query(group_ids)
+    last_id = None
+    while True:
+        page = _recipient_ids_page(query, params, last_id, batch_size)
+        if not page:
+            return
+        yield from page
+        if len(page) < batch_size:
+            return
+        last_id = page[-1]
+
+def _enqueue_notification(cur, chat_ids, notification):
+    """Ставит уведомление (см. outbox.message) в notification_outbox для chat_ids в транзакции cur."""
+    rows = [
+        (chat_id, notification['kind'], notification['batch_id'], notification['text'],
+         notification['parse_mode'], notification['reply_markup'])
+        for chat_id in chat_ids
+    ]
+    if rows:
+        execute_values(
+            cur,
+            """
+            INSERT INTO notification_outbox (chat_id, kind, batch_id, message_text, parse_mode, reply_markup)
+            VALUES %s;
+            """,
+            rows,
+            page_size=1000
+        )
+
+def _enqueue_group_notification(cur, group_id, notification, available_at=None):
+    """
+    То же для всех учеников группы - одним INSERT ... SELECT, без выборки id в Python.
+    available_at откладывает отправку (по умолчанию - сразу).
+    """
+    cur.execute(
+        """
+        INSERT INTO notification_outbox (chat_id, kind, batch_id, message_text, parse_mode, reply_markup, available_at)
+        SELECT id, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP) FROM users WHERE group_id = %s AND is_admin IS NOT TRUE AND is_active;
+        """,
+        (notification['kind'], notification['batch_id'], notification['text'],
+         notification['parse_mode'], notification['reply_markup'], available_at, group_id)
+    )
+
+def claim_outbox_batch(limit, lease_seconds):
+    """
+    Забирает до limit готовых к отправке уведомлений (и брошенных в статусе 'sending' дольше lease_seconds),
+    помечая их 'sending'. Строки, уже взятые другими рабочими, пропускаются (SKIP LOCKED).
+    Возвращает список (id, chat_id, message_text, parse_mode, reply_markup, attempts).
+    """
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE notification_outbox AS o
+                SET status = 'sending', locked_at = CURRENT_TIMESTAMP, attempts = o.attempts + 1
+                FROM (
+                    SELECT id FROM notification_outbox
+                    WHERE (status = 'pending' AND available_at <= CURRENT_TIMESTAMP)
+                       OR (status = 'sending' AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ) AS picked
+                WHERE o.id = picked.id
+                RETURNING o.id, o.chat_id, o.message_text, o.parse_mode, o.reply_markup, o.attempts;
+                """,
+                (lease_seconds, limit)
+            )
+            rows = cur.fetchall()
+            conn.commit()
+            return rows
+        except psycopg2.Error as e:
+            print(f"Ошибка при выборке уведомлений из очереди: {e}")
+            conn.rollback()
+            return []
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return []
+
+def record_outbox_results(results):
+    """
+    Записывает исходы отправки: results - список (id, статус, текст ошибки, пауза перед повтором в секундах).
+    Для статуса 'pending' строка снова станет доступна через указанную паузу.
+    """
+    if not results:
+        return True
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                UPDATE notification_outbox AS o SET
+                    status = v.status,
+                    last_error = v.error,
+                    locked_at = NULL,
+                    sent_at = CASE WHEN v.status = 'sent' THEN CURRENT_TIMESTAMP ELSE o.sent_at END,
+                    available_at = CASE WHEN v.delay IS NULL THEN o.available_at
+                                        ELSE CURRENT_TIMESTAMP + make_interval(secs => v.delay) END
+                FROM (VALUES %s) AS v(id, status, error, delay)
+                WHERE o.id = v.id;
+                """,
+                results,
+                template="(%s::bigint, %s, %s, %s::double precision)"
+            )
+            conn.commit()
+            return True
+        except psycopg2.Error as e:
+            print(f"Ошибка при записи результатов отправки уведомлений: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return False
+
+def get_outbox_batch_counts(batch_id):
+    """Число уведомлений пачки по статусам: {'pending': n, 'sending': n, 'sent': n, 'dead': n}. None при ошибке."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT status, COUNT(*) FROM notification_outbox WHERE batch_id = %s GROUP BY status;", (batch_id,))
+            return dict(cur.fetchall())
+        except psycopg2.Error as e:
+            print(f"Ошибка при подсчете уведомлений пачки: {e}")
+            return None
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return None
+
+def delete_sent_outbox(older_than_days):
+    """Удаляет доставленные уведомления старше older_than_days дней. Недоставленные ('dead') остаются для разбора."""
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "DELETE FROM notification_outbox WHERE status = 'sent' AND sent_at < CURRENT_TIMESTAMP - make_interval(days => %s);",
+                (older_than_days,)
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+        except psycopg2.Error as e:
+            print(f"Ошибка при очистке очереди уведомлений: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    return 0
\ No newline at end of file
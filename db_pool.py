@@ -0,0 +1,175 @@
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений PostgreSQL.
+    Держит от min_size до max_size соединений, при исчерпании ждет свободное
+    соединение не дольше timeout секунд и проверяет простаивавшие соединения перед выдачей.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, health_check_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные размеры пула: нужно 0 <= min_size <= max_size, max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = set()
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    def _new_connection(self):
+        conn = self._connect()
+        self._stats['connections_created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._stats['connections_discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn, idle_since):
+        """Проверка соединения перед выдачей. Вызывается без блокировки пула: запрос к серверу может зависнуть."""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """Выдает соединение из пула, при необходимости ожидая освобождения."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        wait_started = None
+
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("Пул соединений закрыт")
+
+                    if self._idle:
+                        # Соединение числится выданным, пока идет проверка, чтобы другие потоки не превысили max_size.
+                        conn, idle_since = self._idle.pop()
+                        self._in_use.add(conn)
+                        break
+
+                    if len(self._in_use) < self.max_size:
+                        # Слот зарезервирован до подключения, чтобы другие потоки не превысили max_size.
+                        placeholder = object()
+                        self._in_use.add(placeholder)
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"Нет свободных соединений в пуле ({self.max_size}) за {timeout} с")
+                    if not waited:
+                        waited = True
+                        wait_started = time.monotonic()
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                break
+            healthy = self._is_healthy(conn, idle_since)
+            with self._cond:
+                if healthy and not self._closed:
+                    return self._checkout(conn, waited, wait_started)
+                self._in_use.discard(conn)
+                self._stats['health_check_failures'] += 1
+                self._discard(conn)
+                self._cond.notify()
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use.discard(placeholder)
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use.discard(placeholder)
+            self._stats['connections_created'] += 1
+            return self._checkout(conn, waited, wait_started)
+
+    def _checkout(self, conn, waited, wait_started):
+        self._in_use.add(conn)
+        self._stats['checkouts'] += 1
+        if waited:
+            self._stats['wait_time_total'] += time.monotonic() - wait_started
+        return conn
+
+    def putconn(self, conn):
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию."""
+        if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+        with self._cond:
+            self._in_use.discard(conn)
+            broken = conn.closed or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE
+            if self._closed or broken or len(self._idle) >= self.max_size:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Закрывает все простаивающие соединения; выданные закроются при возврате."""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """Снимок статистики пула."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['in_use'] = len(self._in_use)
+            snapshot['idle'] = len(self._idle)
+            snapshot['min_size'] = self.min_size
+            snapshot['max_size'] = self.max_size
+            return snapshot
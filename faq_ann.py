@@ -0,0 +1,149 @@
+"""
+Поиск ближайших соседей по нормированным эмбеддингам FAQ.
+
+Режимы (FAQ_SEARCH_MODE в config.py):
+  * exact - полный перебор скалярным произведением numpy, точный;
+  * ivf   - инвертированные списки по центроидам сферического k-means, просматриваются
+            FAQ_IVF_PROBES ближайших списков (только numpy);
+  * hnsw  - граф HNSW из hnswlib (нужен пакет hnswlib).
+Все режимы возвращают список (позиция, схожесть) по убыванию схожести; схожесть - точный косинус.
+"""
+import numpy as np
+
+MODE_EXACT = "exact"
+MODE_IVF = "ivf"
+MODE_HNSW = "hnsw"
+
+# Размер блока строк при назначении векторов центроидам, чтобы не держать в памяти всю матрицу n x k
+_ASSIGN_CHUNK = 8192
+
+
+def top_k_indices(scores, top_k):
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    return best[np.argsort(-scores[best])]
+
+
+class ExactSearcher:
+    mode = MODE_EXACT
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def search(self, query_embedding, top_k):
+        scores = self.matrix @ query_embedding
+        return [(int(i), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+
+def _assign(matrix, centroids):
+    labels = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), _ASSIGN_CHUNK):
+        labels[start:start + _ASSIGN_CHUNK] = (matrix[start:start + _ASSIGN_CHUNK] @ centroids.T).argmax(axis=1)
+    return labels
+
+
+def train_centroids(matrix, n_lists, iterations=10, sample_per_list=64, seed=0):
+    """Сферический k-means на подвыборке: центроиды нормированы, близость - скалярное произведение."""
+    rng = np.random.default_rng(seed)
+    if len(matrix) > n_lists * sample_per_list:
+        sample = matrix[rng.choice(len(matrix), n_lists * sample_per_list, replace=False)]
+    else:
+        sample = matrix
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        # Пустые списки заново засеваем случайными векторами
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = sums / np.clip(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12, None)
+    return centroids.astype(np.float32)
+
+
+class IvfSearcher:
+    """
+    IVF: векторы разложены по спискам ближайших центроидов и переупорядочены так,
+    что каждый список - непрерывный срез матрицы. При обновлении FAQ центроиды
+    переиспользуются (векторы лишь перераспределяются), пока размер корпуса
+    не изменится больше чем вдвое относительно обучения.
+    """
+
+    mode = MODE_IVF
+
+    def __init__(self, matrix, n_probe=8, centroids=None, trained_size=None):
+        n = len(matrix)
+        if centroids is None:
+            n_lists = max(1, min(n, int(4 * np.sqrt(n))))
+            centroids = train_centroids(matrix, n_lists)
+            trained_size = n
+        self.centroids = centroids
+        self.trained_size = trained_size
+        self.n_probe = min(n_probe, len(centroids))
+
+        labels = _assign(matrix, centroids)
+        self.order = np.argsort(labels, kind="stable")
+        self.sorted_matrix = matrix[self.order]
+        counts = np.bincount(labels, minlength=len(centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self):
+        return len(self.order)
+
+    def can_reuse_for(self, size):
+        return self.trained_size / 2 <= size <= self.trained_size * 2
+
+    def search(self, query_embedding, top_k):
+        probes = top_k_indices(self.centroids @ query_embedding, self.n_probe)
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes])
+        if not len(rows):
+            return []
+        scores = self.sorted_matrix[rows] @ query_embedding
+        return [(int(self.order[rows[i]]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+
+class HnswSearcher:
+    """Граф HNSW (hnswlib) по скалярному произведению. Перестраивается целиком при изменении FAQ."""
+
+    mode = MODE_HNSW
+
+    def __init__(self, matrix, m=16, ef_construction=200, ef=64):
+        import hnswlib
+        self._index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self._index.init_index(max_elements=max(1, len(matrix)), ef_construction=ef_construction, M=m)
+        self._index.add_items(matrix, np.arange(len(matrix)))
+        self.ef = ef
+        self._size = len(matrix)
+
+    def __len__(self):
+        return self._size
+
+    def search(self, query_embedding, top_k):
+        top_k = min(top_k, self._size)
+        if top_k <= 0:
+            return []
+        self._index.set_ef(max(self.ef, top_k))
+        labels, distances = self._index.knn_query(query_embedding, k=top_k)
+        # Для пространства 'ip' hnswlib возвращает расстояние 1 - скалярное произведение
+        return [(int(label), float(1.0 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+
+def create_searcher(matrix, mode=MODE_EXACT, min_size=0, previous=None, ivf_probes=8, hnsw_ef=64):
+    """
+    Строит поисковик для матрицы. Корпуса меньше min_size всегда ищутся точно - там перебор дешевле.
+    previous - поисковик прошлой версии индекса, из которого IVF берет обученные центроиды.
+    """
+    if mode == MODE_EXACT or len(matrix) < max(min_size, 1):
+        return ExactSearcher(matrix)
+    if mode == MODE_IVF:
+        if isinstance(previous, IvfSearcher) and previous.can_reuse_for(len(matrix)):
+            return IvfSearcher(matrix, ivf_probes, previous.centroids, previous.trained_size)
+        return IvfSearcher(matrix, ivf_probes)
+    if mode == MODE_HNSW:
+        return HnswSearcher(matrix, ef=hnsw_ef)
+    raise ValueError(f"Неизвестный режим поиска FAQ: {mode}")
@@ -0,0 +1,222 @@
+"""
+Сменные реализации кодировщика вопросов для faq_matcher.
+
+Все кодировщики возвращают нормированные эмбеддинги float32 одинаковой размерности,
+поэтому индекс FAQ и поиск от выбора бэкенда не зависят. Бэкенд задается FAQ_ENCODER_BACKEND в config.py.
+
+Экспорт ONNX-модели заранее (иначе она будет экспортирована при первом запуске):
+    python -m modules.faq_encoders models/onnx-minilm
+"""
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+
+# Максимальная длина последовательности, как у sentence-transformers для этой модели
+MAX_SEQ_LENGTH = 128
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+
+def _normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+class SentenceTransformerEncoder:
+    """Исходный кодировщик на PyTorch через sentence-transformers."""
+
+    backend = BACKEND_TORCH
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        # Ключ совпадает с тем, под которым векторы сохранялись до появления бэкендов.
+        self.key = f"{model_name}:normalized:float32:{self.dim}"
+
+    def encode(self, texts):
+        return np.asarray(self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True), dtype=np.float32)
+
+
+class OnnxEncoder:
+    """
+    Та же модель, экспортированная в ONNX и исполняемая onnxruntime на CPU,
+    по умолчанию с динамическим квантованием весов в int8. Пулинг - среднее по токенам, как в исходной модели.
+    """
+
+    backend = BACKEND_ONNX
+
+    def __init__(self, model_name, model_dir, quantize=True, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, ONNX_INT8_FILE if quantize else ONNX_FP32_FILE)
+        if not os.path.exists(model_path):
+            print(f"ONNX-модель не найдена в '{model_dir}', выполняю экспорт...")
+            export_onnx(model_name, model_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.model_name = model_name
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {inp.name for inp in self._session.get_inputs()}
+        self.dim = self._session.get_outputs()[0].shape[-1]
+        if not isinstance(self.dim, int):
+            self.dim = self.encode(["dim"]).shape[1]
+        self.key = f"{model_name}:onnx-{'int8' if quantize else 'fp32'}:normalized:float32:{self.dim}"
+
+    def encode(self, texts):
+        encoded = self._tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np")
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        token_embeddings = self._session.run(None, inputs)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return _normalize(pooled)
+
+
+class BatchingEncoder:
+    """
+    Сервис микропакетирования поверх любого кодировщика: запросы, пришедшие в течение
+    max_wait_ms после первого (но не больше max_batch_size), кодируются одним вызовом.
+    Каждый вызывающий получает свой Future с вектором.
+    """
+
+    def __init__(self, encoder, max_batch_size=32, max_wait_ms=5.0):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._wait_total = 0.0
+        self._recent_waits = deque(maxlen=1000)
+        self._recent_batch_sizes = deque(maxlen=1000)
+        self._worker = threading.Thread(target=self._run, name="faq-encoder-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode_one(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def encode(self, texts):
+        """Крупные пакеты (индексация FAQ) идут напрямую, минуя очередь."""
+        return self.encoder.encode(texts)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            waits = [started - submitted for _, _, submitted in batch]
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_batch = max(self._max_batch, len(batch))
+                self._wait_total += sum(waits)
+                self._recent_waits.extend(waits)
+                self._recent_batch_sizes.append(len(batch))
+
+            try:
+                embeddings = self.encoder.encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._recent_waits)
+            sizes = list(self._recent_batch_sizes)
+            return {
+                'batches': self._batches,
+                'items': self._items,
+                'queue_size': self._queue.qsize(),
+                'avg_batch_size': self._items / self._batches if self._batches else 0.0,
+                'max_batch_size': self._max_batch,
+                'recent_avg_batch_size': sum(sizes) / len(sizes) if sizes else 0.0,
+                'avg_queue_wait_ms': 1000 * self._wait_total / self._items if self._items else 0.0,
+                'p95_queue_wait_ms': 1000 * waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            }
+
+
+def export_onnx(model_name, model_dir, quantize=True):
+    """Экспортирует трансформер модели в ONNX (и int8-версию) вместе с токенизатором."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hf_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(model_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(hf_name)
+    tokenizer.save_pretrained(model_dir)
+    model = AutoModel.from_pretrained(hf_name)
+    model.eval()
+
+    sample = tokenizer(["Как восстановить пароль?"], return_tensors="pt")
+    fp32_path = os.path.join(model_dir, ONNX_FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(model_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+
+
+def create_encoder(model_name, backend=BACKEND_TORCH, onnx_model_dir=None, onnx_quantize=True, threads=None):
+    if backend == BACKEND_TORCH:
+        return SentenceTransformerEncoder(model_name)
+    if backend == BACKEND_ONNX:
+        return OnnxEncoder(model_name, onnx_model_dir or os.path.join("models", "onnx-minilm"), onnx_quantize, threads)
+    raise ValueError(f"Неизвестный бэкенд кодировщика: {backend}")
+
+
+if __name__ == "__main__":
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("models", "onnx-minilm")
+    export_onnx("paraphrase-multilingual-MiniLM-L12-v2", target_dir)
+    print(f"ONNX-модель сохранена в '{target_dir}'.")
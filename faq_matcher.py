@@ -1,35 +1,449 @@
-from sentence_transformers import SentenceTransformer, util
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+import hashlib
+import heapq
+import math
+import re
+import threading
 import config
+import modules.database as db
+import modules.invalidation as invalidation
+import modules.faq_encoders as faq_encoders
+import modules.faq_ann as faq_ann
+from modules.cache import LRUCache
 
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
-print(f"Загрузка языковой модели '{MODEL_NAME}'...")
-model = SentenceTransformer(MODEL_NAME)
-print("Модель успешно загружена.")
+
+# 'torch' - исходная модель sentence-transformers, 'onnx' - ONNX Runtime (по умолчанию int8) на CPU
+ENCODER_BACKEND = getattr(config, 'FAQ_ENCODER_BACKEND', faq_encoders.BACKEND_TORCH)
 
 SIMILARITY_THRESHOLD = 0.60
+LEXICAL_SIMILARITY_THRESHOLD = 0.50
+# Кандидаты ниже основного порога, но выше этого, предлагаются пользователю как "Возможно, вы имели в виду"
+SUGGESTION_THRESHOLD = 0.45
+TOP_K = 3
+
+# Сколько лучших по BM25 вопросов передается на семантическое переранжирование
+LEXICAL_CANDIDATES = getattr(config, 'FAQ_LEXICAL_CANDIDATES', 50)
+
+# 'exact' - полный перебор numpy, 'ivf' или 'hnsw' - приближенный поиск (см. faq_ann)
+SEARCH_MODE = getattr(config, 'FAQ_SEARCH_MODE', faq_ann.MODE_EXACT)
+ANN_MIN_SIZE = getattr(config, 'FAQ_ANN_MIN_SIZE', 5000)
+IVF_PROBES = getattr(config, 'FAQ_IVF_PROBES', 8)
+HNSW_EF = getattr(config, 'FAQ_HNSW_EF', 64)
+
+# Что делать с обращением, пока модель грузится: 'lexical' - искать по словам, 'none' - сразу создавать запрос.
+FALLBACK_MODE = getattr(config, 'FAQ_FALLBACK_MODE', 'lexical')
+
+MODEL_STATE_NOT_LOADED = "not_loaded"
+MODEL_STATE_LOADING = "loading"
+MODEL_STATE_READY = "ready"
+MODEL_STATE_FAILED = "failed"
+
+encoder = None
+# Одиночные запросы пользователей кодируются пакетами; 0 в FAQ_BATCH_MAX_SIZE отключает пакетирование.
+# Действует только при поиске в процессе бота (FAQ_WORKER_PROCESSES = 0): рабочие процессы faq_workers
+# получают запросы по одному и пакетирование у себя выключают.
+BATCH_MAX_SIZE = getattr(config, 'FAQ_BATCH_MAX_SIZE', 32)
+BATCH_WINDOW_MS = getattr(config, 'FAQ_BATCH_WINDOW_MS', 5.0)
+model_state = MODEL_STATE_NOT_LOADED
+_model_lock = threading.Lock()
+
+EMBEDDING_DIM = None
+EMBEDDING_MODEL_KEY = None
+
+
+def load_model():
+    """
+    Загружает кодировщик выбранного бэкенда синхронно (тяжелые импорты тоже здесь).
+    Повторные вызовы ничего не делают.
+    """
+    global encoder, model_state, EMBEDDING_DIM, EMBEDDING_MODEL_KEY
+    with _model_lock:
+        if model_state == MODEL_STATE_READY:
+            return True
+        model_state = MODEL_STATE_LOADING
+        try:
+            print(f"Загрузка языковой модели '{MODEL_NAME}' (бэкенд: {ENCODER_BACKEND})...")
+            loaded = faq_encoders.create_encoder(
+                MODEL_NAME,
+                ENCODER_BACKEND,
+                onnx_model_dir=getattr(config, 'FAQ_ONNX_MODEL_DIR', None),
+                onnx_quantize=getattr(config, 'FAQ_ONNX_QUANTIZE', True)
+            )
+        except Exception as e:
+            model_state = MODEL_STATE_FAILED
+            print(f"Не удалось загрузить языковую модель: {e}")
+            return False
+
+        EMBEDDING_DIM = loaded.dim
+        # Ключ модели, с которым эмбеддинги сохраняются в БД. При смене модели, бэкенда или
+        # способа нормализации ключ меняется, и сохраненные векторы пересчитываются.
+        EMBEDDING_MODEL_KEY = loaded.key
+        if BATCH_MAX_SIZE and BATCH_MAX_SIZE > 1:
+            loaded = faq_encoders.BatchingEncoder(loaded, BATCH_MAX_SIZE, BATCH_WINDOW_MS)
+        encoder = loaded
+        model_state = MODEL_STATE_READY
+        print("Модель успешно загружена.")
+        return True
+
+
+def _load_in_background():
+    if load_model():
+        sync_index()
+
+
+def start_loading():
+    """Запускает загрузку модели и индекса FAQ в фоне; бот отвечает, не дожидаясь ее."""
+    global model_state
+    with _model_lock:
+        if model_state in (MODEL_STATE_LOADING, MODEL_STATE_READY):
+            return
+        model_state = MODEL_STATE_LOADING
+    threading.Thread(target=_load_in_background, name="faq-model-loader", daemon=True).start()
+
+
+def is_ready():
+    return model_state == MODEL_STATE_READY
+
+
+_WORD_PATTERN = re.compile(r'\w+')
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]+')
+
+# Грубое усечение до основы: "пароль", "пароля", "паролем" дают один терм
+STEM_LENGTH = 5
+
+
+def _words(text):
+    return {word for word in _WORD_PATTERN.findall(text.lower()) if len(word) > 2}
 
-def find_best_faq_match(user_question, all_faq_items):
+
+def _terms(text):
+    return [word[:STEM_LENGTH] for word in _WORD_PATTERN.findall(text.casefold()) if len(word) > 2]
+
+
+def normalize_query(text):
+    """Без регистра, пунктуации и лишних пробелов: ключ кэша и точного совпадения."""
+    return " ".join(_PUNCTUATION_PATTERN.sub(" ", text.casefold()).split())
+
+
+class Bm25Index:
+    """
+    Инвертированный индекс BM25 по вопросам и ответам FAQ. Вопрос весит вдвое больше ответа.
+    Поиск проходит только по спискам документов, содержащих термы запроса.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    QUESTION_WEIGHT = 2
+
+    def __init__(self, items):
+        self.postings = {}
+        lengths = []
+        for pos, (question, answer) in enumerate(items):
+            terms = _terms(question) * self.QUESTION_WEIGHT + _terms(answer)
+            lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((pos, tf))
+        self.lengths = lengths
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        total = len(lengths)
+        self.idf = {term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()}
+
+    def search(self, text, limit):
+        """Список (позиция, оценка BM25) лучших документов, по убыванию оценки."""
+        scores = {}
+        for term in set(_terms(text)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for pos, tf in docs:
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[pos] / self.avg_length)
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+class FaqIndex:
     """
-    Находит наиболее подходящий вопрос из FAQ, используя семантическую схожесть.
+    Неизменяемый индекс FAQ: строки ids/items выровнены со строками matrix -
+    нормированными эмбеддингами вопросов в float32. Косинусная близость = скалярное произведение.
+    Рядом хранятся BM25-индекс, словарь точных совпадений нормализованных вопросов
+    и поисковик по векторам (точный или приближенный, см. faq_ann).
     """
-    if not all_faq_items:
-        return None
 
-    faq_questions = [item[0] for item in all_faq_items]
+    def __init__(self, ids, items, matrix, version, searcher=None):
+        self.ids = ids
+        self.items = items
+        self.matrix = matrix
+        self.version = version
+        self.searcher = searcher or faq_ann.ExactSearcher(matrix)
+        self.lexical = Bm25Index(items)
+        self.exact = {normalize_query(question): pos for pos, (question, _) in enumerate(items)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_embedding, candidates=None, top_k=TOP_K):
+        """
+        Список (позиция, схожесть) лучших совпадений по убыванию схожести.
+        candidates - позиции, отобранные BM25: они объединяются с ближайшими по вектору
+        и ранжируются вместе, так что перефразировка без общих слов тоже находится.
+        """
+        if not self.ids:
+            return []
+
+        matches = self.searcher.search(query_embedding, top_k)
+        if candidates:
+            # Приближенный поиск может упустить совпадение по ключевым словам - досчитываем кандидатов BM25.
+            merged = dict(matches)
+            merged.update(self._rerank(query_embedding, candidates, top_k))
+            matches = heapq.nlargest(top_k, merged.items(), key=lambda item: item[1])
+        return matches
+
+    def _rerank(self, query_embedding, candidates, top_k):
+        positions = np.asarray(candidates)
+        similarities = self.matrix[positions] @ query_embedding
+        return [(int(positions[i]), float(similarities[i])) for i in faq_ann.top_k_indices(similarities, top_k)]
+
+
+def encode(texts):
+    """Нормированные эмбеддинги float32 для списка строк."""
+    return encoder.encode(texts)
+
+
+def encode_query(text):
+    """Эмбеддинг одного запроса пользователя; при включенном пакетировании - через общую очередь."""
+    if isinstance(encoder, faq_encoders.BatchingEncoder):
+        return encoder.encode_one(text)
+    return encoder.encode([text])[0]
+
+
+def get_encoder_stats():
+    if isinstance(encoder, faq_encoders.BatchingEncoder):
+        return encoder.stats()
+    return {}
+
 
-    user_embedding = model.encode(user_question)
-    faq_embeddings = model.encode(faq_questions)
+def question_hash(question):
+    return hashlib.sha256(question.encode('utf-8')).digest()
 
-    similarities = cosine_similarity([user_embedding], faq_embeddings)[0]
 
-    best_match_index = similarities.argmax()
-    best_match_score = similarities[best_match_index]
+_index = FaqIndex([], [], None, 0)
+_index_stale = True
+_index_lock = threading.Lock()
+# Растет при каждом изменении FAQ; по нему рабочие процессы (faq_workers) понимают, что пора пересинхронизироваться.
+index_generation = 0
 
+
+def build_index(old=None):
+    """
+    Строит индекс по содержимому таблицы faq, ничего не записывая в БД. Эмбеддинги берутся
+    из индекса old, затем из таблицы faq_embeddings (векторы каждой модели хранятся отдельно);
+    кодируются только строки без сохраненного вектора текущей модели или с изменившимся хэшем вопроса.
+    Возвращает (индекс, новые эмбеддинги для save_faq_embeddings) или (None, []), если FAQ не прочитан.
+    """
+    rows = db.get_faq_rows_with_embedding_meta(EMBEDDING_MODEL_KEY)
+    if rows is None:
+        return None, []
+
+    old = old or FaqIndex([], [], None, 0)
+    old_positions = {faq_id: i for i, faq_id in enumerate(old.ids)}
+    vectors = [None] * len(rows)
+    to_load = {}
+    for pos, (faq_id, question, _, model_key, stored_hash) in enumerate(rows):
+        old_pos = old_positions.get(faq_id)
+        if old_pos is not None and old.items[old_pos][0] == question:
+            vectors[pos] = old.matrix[old_pos]
+        elif model_key == EMBEDDING_MODEL_KEY and stored_hash == question_hash(question):
+            to_load[faq_id] = pos
+
+    for faq_id, blob in db.get_faq_embeddings(to_load.keys(), EMBEDDING_MODEL_KEY).items():
+        vector = np.frombuffer(blob, dtype=np.float32)
+        if vector.shape == (EMBEDDING_DIM,):
+            vectors[to_load[faq_id]] = vector
+
+    to_encode = [pos for pos, vector in enumerate(vectors) if vector is None]
+    new_embeddings = []
+    if to_encode:
+        encoded = encode([rows[pos][1] for pos in to_encode])
+        for vector, pos in zip(encoded, to_encode):
+            vectors[pos] = vector
+            faq_id, question = rows[pos][0], rows[pos][1]
+            new_embeddings.append((faq_id, EMBEDDING_MODEL_KEY, question_hash(question), vector.tobytes()))
+
+    matrix = np.vstack(vectors) if vectors else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    index = FaqIndex(
+        [row[0] for row in rows],
+        [(row[1], row[2]) for row in rows],
+        matrix,
+        old.version + 1,
+        _build_searcher(matrix, old.searcher)
+    )
     if config.DEBUG_FAQ_MATCHING:
-        print(f"Поиск по FAQ: '{user_question}' -> '{faq_questions[best_match_index]}' (Схожесть: {best_match_score:.2f})")
+        print(f"Индекс FAQ построен: {len(rows)} записей, загружено из БД {len(to_load)}, закодировано заново {len(to_encode)}.")
+    return index, new_embeddings
+
+
+def sync_index():
+    """Приводит индекс к содержимому таблицы faq (см. build_index) и сохраняет в БД новые векторы."""
+    global _index, _index_stale
+    if not is_ready():
+        return _index
+    with _index_lock:
+        _index_stale = False
+        index, new_embeddings = build_index(_index)
+        if index is None:
+            _index_stale = True
+            return _index
+        db.save_faq_embeddings(new_embeddings)
+        _index = index
+        return _index
+
+
+def _build_searcher(matrix, previous):
+    try:
+        return faq_ann.create_searcher(matrix, SEARCH_MODE, ANN_MIN_SIZE, previous, IVF_PROBES, HNSW_EF)
+    except ImportError as e:
+        print(f"Режим поиска '{SEARCH_MODE}' недоступен ({e}), используется точный поиск.")
+        return faq_ann.ExactSearcher(matrix)
+
+
+def invalidate_index(entity_id=None, version=None):
+    """Помечает индекс устаревшим; он досинхронизируется перед следующим поиском."""
+    global _index_stale, index_generation
+    index_generation += 1
+    _index_stale = True
+
+
+def clear_index():
+    """Сразу опустошает индекс в памяти (после удаления всего FAQ), не дожидаясь синхронизации с БД."""
+    global _index
+    with _index_lock:
+        _index = FaqIndex([], [], None, _index.version + 1)
+    invalidate_index()
+
+
+def get_index():
+    if _index_stale:
+        return sync_index()
+    return _index
+
+
+def find_lexical_faq_matches(user_question, top_k=TOP_K):
+    """
+    Дешевый поиск по пересечению слов (коэффициент Жаккара) - пока языковая модель не загружена.
+    Возвращает список (вопрос, ответ, схожесть, True) не ниже LEXICAL_SIMILARITY_THRESHOLD.
+    """
+    user_words = _words(user_question)
+    if not user_words:
+        return []
+
+    scored = []
+    for question, answer in db.get_all_faq_items():
+        faq_words = _words(question)
+        if not faq_words:
+            continue
+        score = len(user_words & faq_words) / len(user_words | faq_words)
+        if score >= LEXICAL_SIMILARITY_THRESHOLD:
+            scored.append((question, answer, score, True))
+
+    matches = heapq.nlargest(top_k, scored, key=lambda item: item[2])
+    if config.DEBUG_FAQ_MATCHING and matches:
+        print(f"Поиск по FAQ (по словам): '{user_question}' -> '{matches[0][0]}' (Схожесть: {matches[0][2]:.2f})")
+    return matches
+
+
+# нормализованный текст запроса -> (версия индекса, эмбеддинг, [(позиция, схожесть), ...], глубина поиска);
+# ищется не меньше TOP_K совпадений, чтобы вызов с top_k=1 не урезал подсказки для следующих
+_query_cache = LRUCache(max_size=getattr(config, 'FAQ_QUERY_CACHE_SIZE', 2048))
+_query_cache_rescored = 0
+_exact_hits = 0
+_full_scans = 0
+
+
+def search_query(index, user_question, top_k=TOP_K):
+    """
+    Гибридный поиск с учетом кэша повторяющихся вопросов: точное совпадение вопроса
+    идет первым без кодирования запроса, иначе кандидаты BM25 объединяются с ближайшими
+    по эмбеддингу запроса. Пока FAQ не больше LEXICAL_CANDIDATES, BM25 не используется.
+    Возвращает список (позиция, схожесть) по убыванию схожести.
+    """
+    global _query_cache_rescored, _exact_hits, _full_scans
+    key = normalize_query(user_question)
+    exact = index.exact.get(key)
+    if exact is not None:
+        _exact_hits += 1
+        if top_k <= 1:
+            return [(exact, 1.0)]
+        # Остальные места занимают ближайшие к найденному вопросу - его вектор уже есть в индексе
+        neighbours = [match for match in index.search(index.matrix[exact], None, top_k + 1) if match[0] != exact]
+        return [(exact, 1.0)] + neighbours[:top_k - 1]
+
+    depth = max(top_k, TOP_K)
+    cached = _query_cache.get(key, None)
+    if cached is not None and cached[0] == index.version and cached[3] >= top_k:
+        return cached[2][:top_k]
+
+    if cached is not None:
+        embedding = cached[1]
+        if cached[0] != index.version:
+            _query_cache_rescored += 1
+    else:
+        embedding = encode_query(user_question)
+    candidates = None
+    if len(index) > LEXICAL_CANDIDATES:
+        candidates = [pos for pos, _ in index.lexical.search(user_question, LEXICAL_CANDIDATES)]
+    if not candidates:
+        _full_scans += 1
+    matches = index.search(embedding, candidates, depth)
+    _query_cache.put(key, (index.version, embedding, matches, depth))
+    return matches[:top_k]
+
+
+def get_query_cache_stats():
+    stats = _query_cache.stats()
+    stats['rescored_after_faq_change'] = _query_cache_rescored
+    stats['exact_hits'] = _exact_hits
+    stats['full_scans'] = _full_scans
+    return stats
+
+
+def find_faq_matches(user_question, top_k=TOP_K):
+    """
+    До top_k подходящих вопросов FAQ в виде (вопрос, ответ, схожесть, уверенно) по убыванию схожести.
+    В список попадают совпадения не ниже SUGGESTION_THRESHOLD; уверенными считаются
+    совпадения не ниже SIMILARITY_THRESHOLD, остальные годятся только для "Возможно, вы имели в виду".
+    Пока модель не готова, используется поиск по словам (или ничего - см. FAQ_FALLBACK_MODE).
+    """
+    if not is_ready():
+        if model_state == MODEL_STATE_NOT_LOADED:
+            start_loading()
+        if FALLBACK_MODE == 'lexical':
+            return find_lexical_faq_matches(user_question, top_k)
+        return []
+
+    index = get_index()
+    if not len(index):
+        return []
+
+    matches = search_query(index, user_question, top_k)
+
+    if config.DEBUG_FAQ_MATCHING:
+        best_match_index, best_match_score = matches[0]
+        print(f"Поиск по FAQ: '{user_question}' -> '{index.items[best_match_index][0]}' (Схожесть: {best_match_score:.2f})")
+
+    return [(*index.items[pos], score, score >= SIMILARITY_THRESHOLD) for pos, score in matches if score >= SUGGESTION_THRESHOLD]
+
+
+def find_best_faq_match(user_question):
+    """(вопрос, ответ) уверенного совпадения из FAQ или None."""
+    matches = find_faq_matches(user_question, top_k=1)
+    if matches and matches[0][3]:
+        return matches[0][:2]
+    return None
+
 
-    if best_match_score >= SIMILARITY_THRESHOLD:
-        return all_faq_items[best_match_index]
-    
-    return None
\ No newline at end of file
+invalidation.subscribe(invalidation.ENTITY_FAQ, invalidate_index)
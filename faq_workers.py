@@ -0,0 +1,202 @@
+"""
+Поиск по FAQ в отдельных процессах, чтобы кодирование запроса не держало GIL процесса бота.
+
+Каждый рабочий процесс один раз загружает модель и индекс FAQ (векторы берутся из faq_embeddings),
+а перед каждой задачей сверяет поколение индекса с родительским процессом.
+При FAQ_WORKER_PROCESSES = 0 поиск выполняется в процессе бота, как раньше.
+
+Пакетирование запросов к модели (FAQ_BATCH_MAX_SIZE) работает только в режиме без рабочих процессов:
+каждый процесс выполняет одну задачу за раз, и параллелизм здесь дает число процессов, а не пакеты.
+
+Поиск не блокирует поток обработчика Telegram: результат передается в callback из отдельного пула потоков.
+"""
+import functools
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import config
+import modules.faq_matcher as faq_matcher
+
+WORKER_PROCESSES = getattr(config, 'FAQ_WORKER_PROCESSES', 2)
+MATCH_TIMEOUT = getattr(config, 'FAQ_MATCH_TIMEOUT', 10.0)
+
+_executor = None
+_executor_lock = threading.Lock()
+_ready_workers = 0
+# Сюда рабочие процессы текущего пула сообщают свои PID, чтобы зависший пул можно было добить
+_worker_pids = None
+# Продолжения поиска (ответ пользователю) выполняются здесь, а не в служебном потоке пула процессов
+_callbacks = ThreadPoolExecutor(max_workers=4, thread_name_prefix="faq-match-callback")
+
+# Поколение индекса, известное рабочему процессу (используется только внутри рабочих процессов)
+_worker_generation = None
+
+
+def _init_worker(worker_pids):
+    worker_pids.put(os.getpid())
+    # В рабочем процессе запросы идут по одному - ждать попутчиков для пакета бессмысленно.
+    faq_matcher.BATCH_MAX_SIZE = 0
+    faq_matcher.load_model()
+    faq_matcher.sync_index()
+
+
+def _warm_up():
+    return faq_matcher.is_ready()
+
+
+def _match_in_worker(user_question, top_k, generation):
+    global _worker_generation
+    if generation != _worker_generation:
+        faq_matcher.invalidate_index()
+        _worker_generation = generation
+    return faq_matcher.find_faq_matches(user_question, top_k)
+
+
+def _on_worker_ready(executor, future):
+    global _ready_workers
+    if not future.cancelled() and future.exception() is None and future.result():
+        with _executor_lock:
+            # Прогрев пула, который уже заменили, не должен засчитываться новому пулу
+            if executor is _executor:
+                _ready_workers += 1
+
+
+def _create_executor():
+    global _executor, _ready_workers, _worker_pids
+    _ready_workers = 0
+    # spawn, а не fork: дочерние процессы не должны наследовать соединения из пула и потоки родителя.
+    context = multiprocessing.get_context("spawn")
+    _worker_pids = context.SimpleQueue()
+    _executor = ProcessPoolExecutor(
+        max_workers=WORKER_PROCESSES,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(_worker_pids,)
+    )
+    # Прогреваем все процессы сразу, чтобы первый пользователь не ждал загрузки модели.
+    for _ in range(WORKER_PROCESSES):
+        _executor.submit(_warm_up).add_done_callback(functools.partial(_on_worker_ready, _executor))
+
+
+def _kill_workers():
+    """Завершает процессы текущего пула по PID, которые они сообщили при запуске."""
+    while not _worker_pids.empty():
+        pid = _worker_pids.get()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass  # процесс уже завершился
+
+
+def _restart_executor(executor):
+    """Останавливает пул (вместе с зависшими процессами) и создает новый, если его еще не заменили."""
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _kill_workers()
+        executor.shutdown(wait=False, cancel_futures=True)
+        _create_executor()
+
+
+def start():
+    """Запускает пул рабочих процессов или, если он выключен, фоновую загрузку модели в этом процессе."""
+    if WORKER_PROCESSES <= 0:
+        faq_matcher.start_loading()
+        return
+    with _executor_lock:
+        if _executor is None:
+            _create_executor()
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def is_ready():
+    if WORKER_PROCESSES <= 0:
+        return faq_matcher.is_ready()
+    return _ready_workers > 0
+
+
+def _recreate_broken(executor, error):
+    print(f"Пул поиска по FAQ аварийно завершился, перезапускаю: {error}")
+    with _executor_lock:
+        if _executor is executor:
+            _create_executor()
+
+
+def _run_callback(on_done, search, *args):
+    try:
+        on_done(search(*args))
+    except Exception as e:
+        print(f"Ошибка при обработке результата поиска по FAQ: {e}")
+
+
+def find_faq_matches_async(user_question, on_done, top_k=faq_matcher.TOP_K):
+    """
+    Ищет как faq_matcher.find_faq_matches и вызывает on_done(matches) ровно один раз в отдельном потоке.
+    Пока рабочие процессы прогреваются, используется запасной поиск faq_matcher; при таймауте
+    или сбое пула on_done получает пустой список, и обращение сразу оформляется запросом в техподдержку.
+    """
+    if WORKER_PROCESSES <= 0:
+        _callbacks.submit(_run_callback, on_done, faq_matcher.find_faq_matches, user_question, top_k)
+        return
+
+    with _executor_lock:
+        if _executor is None:
+            _create_executor()
+        executor = _executor
+
+    if not is_ready():
+        if faq_matcher.FALLBACK_MODE == 'lexical':
+            _callbacks.submit(_run_callback, on_done, faq_matcher.find_lexical_faq_matches, user_question, top_k)
+        else:
+            _callbacks.submit(_run_callback, on_done, lambda: [])
+        return
+
+    try:
+        future = executor.submit(_match_in_worker, user_question, top_k, faq_matcher.index_generation)
+    except BrokenProcessPool as e:
+        _recreate_broken(executor, e)
+        _callbacks.submit(_run_callback, on_done, lambda: [])
+        return
+
+    # Результат и таймаут соревнуются: кто первым захватит claimed, тот и вызывает on_done.
+    claimed = threading.Lock()
+
+    def on_timeout():
+        if not claimed.acquire(blocking=False):
+            return
+        print(f"Поиск по FAQ не уложился в {MATCH_TIMEOUT} с, создаю запрос без него.")
+        # Ждавшую в очереди задачу можно просто отменить. Уже выполняющуюся cancel() не остановит:
+        # процесс завис и держит слот пула, поэтому пул перезапускается.
+        if not future.cancel() and not future.done():
+            print("Рабочий процесс поиска по FAQ завис, перезапускаю пул.")
+            _restart_executor(executor)
+        _callbacks.submit(_run_callback, on_done, lambda: [])
+
+    def on_result(done_future):
+        if not claimed.acquire(blocking=False):
+            return
+        timer.cancel()
+        matches = []
+        if not done_future.cancelled():
+            try:
+                matches = done_future.result()
+            except BrokenProcessPool as e:
+                _recreate_broken(executor, e)
+            except Exception as e:
+                print(f"Ошибка поиска по FAQ в рабочем процессе: {e}")
+        _callbacks.submit(_run_callback, on_done, lambda: matches)
+
+    timer = threading.Timer(MATCH_TIMEOUT, on_timeout)
+    timer.daemon = True
+    timer.start()
+    future.add_done_callback(on_result)
@@ -0,0 +1,117 @@
+import json
+import os
+import select
+import threading
+import uuid
+import psycopg2
+from psycopg2 import extensions
+
+CHANNEL = "cache_invalidation"
+
+# Сущности, об изменении которых сообщают писатели в database.py
+ENTITY_SCHEDULE = "schedule"      # id - group_id, version - schedules.updated_at
+ENTITY_FAQ = "faq"                # id не передается, version - произвольная метка изменения
+ENTITY_CATALOG = "catalog"        # id - group_id добавленной/удаленной группы
+ENTITY_USER_GROUP = "user_group"  # id - user_id
+ENTITY_USER_ACTIVE = "user_active"  # id - user_id, version - True (снова доступен) или False (недоступен)
+
+# Уникальный идентификатор процесса: свои же события слушатель пропускает, кэш уже обновлен писателем.
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+POLL_TIMEOUT = 5.0
+MAX_RECONNECT_DELAY = 60.0
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+_listener = None
+_stop_event = threading.Event()
+
+
+def publish(cur, entity, entity_id=None, version=None):
+    """
+    Публикует событие изменения через pg_notify в транзакции курсора cur.
+    PostgreSQL доставит его слушателям только после COMMIT, при откате событие пропадет.
+    """
+    payload = json.dumps({
+        'entity': entity,
+        'id': entity_id,
+        'version': version.isoformat() if hasattr(version, 'isoformat') else version,
+        'origin': PROCESS_ID,
+    })
+    cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+
+
+def subscribe(entity, handler):
+    """Регистрирует handler(entity_id, version); entity_id=None означает "сбросить все"."""
+    with _handlers_lock:
+        _handlers.setdefault(entity, []).append(handler)
+
+
+def _dispatch(entity, entity_id, version):
+    with _handlers_lock:
+        handlers = list(_handlers.get(entity, []))
+    for handler in handlers:
+        try:
+            handler(entity_id, version)
+        except Exception as e:
+            print(f"Ошибка обработчика инвалидации '{entity}': {e}")
+
+
+def _dispatch_all():
+    with _handlers_lock:
+        entities = list(_handlers)
+    for entity in entities:
+        _dispatch(entity, None, None)
+
+
+def _handle_payload(payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        print(f"Некорректное событие инвалидации: {payload}")
+        return
+    if event.get('origin') == PROCESS_ID:
+        return
+    _dispatch(event.get('entity'), event.get('id'), event.get('version'))
+
+
+def _listen_loop(connect):
+    delay = 1.0
+    while not _stop_event.is_set():
+        conn = None
+        try:
+            conn = connect()
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            # Пока соединения не было, события могли потеряться - сбрасываем кэши целиком.
+            _dispatch_all()
+            delay = 1.0
+
+            while not _stop_event.is_set():
+                if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _handle_payload(conn.notifies.pop(0).payload)
+        except psycopg2.Error as e:
+            print(f"Слушатель инвалидации потерял соединение: {e}. Переподключение через {delay:.0f} с.")
+            _stop_event.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start_listener(connect):
+    """Запускает фоновый поток LISTEN; connect - функция, открывающая отдельное соединение."""
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    _stop_event.clear()
+    _listener = threading.Thread(target=_listen_loop, args=(connect,), name="cache-invalidation", daemon=True)
+    _listener.start()
+
+
+def stop_listener():
+    _stop_event.set()
@@ -7,6 +7,12 @@ import modules.database as db
 import modules.support as support_module
 import modules.admin as admin_module
 import modules.schedule as schedule_module
+import modules.catalog as catalog
+import modules.faq_matcher as faq_matcher
+import modules.faq_workers as faq_workers
+import modules.outbox as outbox
+import modules.user_profiles as user_profiles
+import modules.invalidation as invalidation
 
 if config.BOT_TOKEN is None:
     print("Ошибка: TELEGRAM_BOT_TOKEN не установлен в переменных окружения.")
@@ -59,7 +65,10 @@ def send_welcome(message):
     user_name = message.from_user.first_name if message.from_user.first_name else "Пользователь"
     
     is_admin_user = (user_id in config.ADMIN_IDS)
-    db.add_or_update_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
+    user_profiles.track_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
+    # Пользователь, ранее заблокировавший бота, снова получает рассылки (остальных это в БД не ведет)
+    if db.reactivate_user(user_id):
+        print(f"Пользователь {user_id} снова доступен для рассылок.")
 
     user_group_id = db.get_user_group(user_id)
     if not user_group_id and not is_admin_user:
@@ -92,7 +101,7 @@ def get_main_menu_with_admin_button(is_admin_user):
 
 def show_admin_group_selection_for_schedule(message):
     chat_id = message.chat.id
-    groups = db.get_all_groups_with_classes()
+    groups = catalog.get_all_groups_with_classes()
     if not groups:
         bot.send_message(chat_id, "В системе еще не создано ни одной группы. Расписание смотреть некому.")
         return
@@ -106,7 +115,7 @@ def show_admin_group_selection_for_schedule(message):
 def show_schedule_options(message):
     user_id = message.from_user.id
     is_admin_user = admin_module.is_admin(user_id)
-    db.add_or_update_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
+    user_profiles.track_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
     
     if is_admin_user:
         show_admin_group_selection_for_schedule(message)
@@ -123,7 +132,7 @@ def show_schedule_options(message):
 def show_support_options(message):
     user_id = message.from_user.id
     is_admin_user = (user_id in config.ADMIN_IDS)
-    db.add_or_update_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
+    user_profiles.track_user(user_id, message.from_user.username, message.from_user.first_name, message.from_user.last_name, is_admin_user)
     bot.send_message(message.chat.id, "Выбери опцию техподдержки:", reply_markup=support_module.get_support_menu())
 
 @bot.message_handler(func=lambda message: message.text == "⚙️ Админ-панель" and admin_module.is_admin(message.from_user.id))
@@ -131,7 +140,7 @@ def show_admin_panel_entry(message):
     admin_module.show_admin_panel(bot, message.chat.id, message.message_id, message.from_user.id)
 
 def get_class_selection_menu():
-    classes = db.get_all_classes()
+    classes = catalog.get_all_classes()
     markup = types.InlineKeyboardMarkup(row_width=4)
     if classes:
         buttons = [types.InlineKeyboardButton(str(c[1]), callback_data=f"select_class_{c[0]}") for c in classes]
@@ -141,7 +150,7 @@ def get_class_selection_menu():
     return markup
 
 def get_group_selection_menu(class_id):
-    groups = db.get_groups_for_class(class_id)
+    groups = catalog.get_groups_for_class(class_id)
     markup = types.InlineKeyboardMarkup(row_width=3)
     if groups:
         buttons = [types.InlineKeyboardButton(g[1], callback_data=f"select_group_{g[0]}") for g in groups]
@@ -167,7 +176,7 @@ def callback_query(call):
     elif call.data.startswith("select_group_"):
         group_id = int(call.data.split('_')[-1])
         db.set_user_group(user_id, group_id)
-        group_info = db.get_group_info(group_id)
+        group_info = catalog.get_group_info(group_id)
         class_name = group_info[2] if group_info else ""
         group_name = group_info[1] if group_info else ""
 
@@ -182,7 +191,7 @@ def callback_query(call):
     elif call.data.startswith("admin_view_schedule_for_group_"):
         group_id = int(call.data.split('_')[-1])
         admin_schedule_view_state[user_id] = group_id
-        group_info = db.get_group_info(group_id)
+        group_info = catalog.get_group_info(group_id)
         group_name_full = f"{group_info[2]}{group_info[1]}" if group_info else f"ID: {group_id}"
         bot.edit_message_text(
             chat_id=chat_id,
@@ -209,15 +218,14 @@ def callback_query(call):
             bot.send_message(chat_id, "Пожалуйста, сначала выбери свой класс.")
             return
 
-        full_schedule = db.get_schedule_for_group(group_id_to_show)
-        if not full_schedule:
+        group_schedule = schedule_module.get_group_schedule(group_id_to_show)
+        if not group_schedule or not group_schedule['text']:
             bot.send_message(chat_id, "Расписание для этой группы еще не заполнено.")
             return
 
-        days_of_week_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
         day_index = datetime.datetime.now().weekday()
-        current_day_name = days_of_week_full[day_index]
-        day_schedule = schedule_module.parse_schedule_for_day(full_schedule, current_day_name)
+        current_day_name = schedule_module.DAYS_OF_WEEK[day_index]
+        day_schedule = group_schedule['day_texts'][current_day_name]
         
         markup = types.InlineKeyboardMarkup()
         btn_back = types.InlineKeyboardButton("⬅️ Назад к выбору дня", callback_data="back_to_schedule_menu")
@@ -239,15 +247,14 @@ def callback_query(call):
             bot.send_message(chat_id, "Пожалуйста, сначала выбери свой класс.")
             return
 
-        full_schedule = db.get_schedule_for_group(group_id_to_show)
-        if not full_schedule:
+        group_schedule = schedule_module.get_group_schedule(group_id_to_show)
+        if not group_schedule or not group_schedule['text']:
             bot.send_message(chat_id, "Расписание для этой группы еще не заполнено.")
             return
 
-        days_of_week_full = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
         day_index = int(call.data.split('_')[-1])
-        current_day_name = days_of_week_full[day_index]
-        day_schedule = schedule_module.parse_schedule_for_day(full_schedule, current_day_name)
+        current_day_name = schedule_module.DAYS_OF_WEEK[day_index]
+        day_schedule = group_schedule['day_texts'][current_day_name]
         
         markup = types.InlineKeyboardMarkup()
         btn_back = types.InlineKeyboardButton("⬅️ Назад к выбору дня", callback_data="back_to_schedule_menu")
@@ -269,12 +276,12 @@ def callback_query(call):
             bot.send_message(chat_id, "Пожалуйста, сначала выбери свой класс.")
             return
 
-        full_schedule = db.get_schedule_for_group(group_id_to_show)
+        group_schedule = schedule_module.get_group_schedule(group_id_to_show)
         markup = types.InlineKeyboardMarkup()
         btn_back = types.InlineKeyboardButton("⬅️ Назад к выбору дня", callback_data="back_to_schedule_menu")
         markup.add(btn_back)
-        if full_schedule:
-            bot.send_message(chat_id, f"**Расписание на неделю:**\n\n{full_schedule}", parse_mode="Markdown", reply_markup=markup)
+        if group_schedule and group_schedule['week_message']:
+            bot.send_message(chat_id, group_schedule['week_message'], parse_mode="Markdown", reply_markup=markup)
         else:
             bot.send_message(chat_id, "Расписание для этой группы еще не заполнено.", reply_markup=markup)
         try: bot.delete_message(chat_id=chat_id, message_id=message_id)
@@ -286,7 +293,7 @@ def callback_query(call):
         
         if is_admin_user:
              group_id = admin_schedule_view_state.get(user_id)
-             group_info = db.get_group_info(group_id) if group_id else None
+             group_info = catalog.get_group_info(group_id) if group_id else None
              group_name_full = f"{group_info[2]}{group_info[1]}" if group_info else "..."
              bot.send_message(
                 chat_id,
@@ -317,6 +324,12 @@ def callback_query(call):
         bot.answer_callback_query(call.id, "Отлично!")
         bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Рад был помочь! Если возникнут другие вопросы, обращайся.", reply_markup=None)
     
+    elif call.data.startswith("faq_suggest_"):
+        bot.answer_callback_query(call.id)
+        support_module.show_faq_suggestion(call, bot)
+        try: bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except: pass
+
     elif call.data == "faq_not_solved":
         bot.answer_callback_query(call.id, "Создаю запрос в техподдержку...")
         support_module.create_ticket_after_faq(call, bot)
@@ -388,6 +401,9 @@ def callback_query(call):
             admin_module.show_requests_list(call.message, bot, is_new_requests=False)
             try: bot.delete_message(chat_id=chat_id, message_id=message_id)
             except: pass
+        elif call.data.startswith("admin_reqs_"):
+            bot.answer_callback_query(call.id)
+            admin_module.handle_requests_page_callback(bot, chat_id, message_id, call.data)
         elif call.data.startswith("admin_view_request_details_"):
             request_id = int(call.data.split('_')[-1])
             bot.answer_callback_query(call.id, f"Просмотр запроса #{request_id}...")
@@ -395,6 +411,11 @@ def callback_query(call):
             except: pass
             admin_module.show_request_details_for_admin(bot, chat_id, message_id, request_id)
             
+        elif call.data.startswith("admin_request_history_"):
+            parts = call.data.split('_')
+            bot.answer_callback_query(call.id)
+            admin_module.show_request_details_for_admin(bot, chat_id, message_id, int(parts[-1]), history_offset=int(parts[-2]))
+
         elif call.data.startswith("admin_change_status_"):
             parts = call.data.split('_')
             request_id_to_update = int(parts[-1]) 
@@ -412,7 +433,7 @@ def callback_query(call):
             except: pass
 
         elif call.data == "admin_confirm_delete_all":
-            requests = db.get_all_support_requests()
+            requests, _ = db.get_support_requests_page(limit=1)
             if not requests:
                 bot.answer_callback_query(call.id)
                 markup = types.InlineKeyboardMarkup()
@@ -472,6 +493,7 @@ def callback_query(call):
             admin_module.confirm_delete_all_faq(bot, chat_id, message_id)
         elif call.data == "admin_do_delete_all_faq":
             if db.delete_all_faq_items():
+                faq_matcher.clear_index()
                 bot.answer_callback_query(call.id, "Все FAQ удалены.", show_alert=True)
                 bot.edit_message_text(chat_id=chat_id, message_id=message_id, text="Все FAQ были удалены.", reply_markup=admin_module.get_manage_faq_menu())
             else:
@@ -500,6 +522,32 @@ def callback_query(call):
             group_id = int(call.data.split('_')[-1])
             admin_module.do_delete_group(bot, call, group_id)
             
+        elif call.data == "admin_announce":
+            bot.answer_callback_query(call.id)
+            admin_module.show_announcement_menu(bot, chat_id, message_id)
+        elif call.data == "admin_announce_all":
+            bot.answer_callback_query(call.id)
+            admin_module.start_announcement(bot, chat_id, message_id, admin_module.ANNOUNCE_ALL)
+        elif call.data == "admin_announce_classes":
+            bot.answer_callback_query(call.id)
+            admin_module.start_announcement(bot, chat_id, message_id, admin_module.ANNOUNCE_CLASSES)
+        elif call.data == "admin_announce_groups":
+            bot.answer_callback_query(call.id)
+            admin_module.start_announcement(bot, chat_id, message_id, admin_module.ANNOUNCE_GROUPS)
+        elif call.data.startswith("admin_announce_toggle_"):
+            bot.answer_callback_query(call.id)
+            admin_module.toggle_announcement_target(bot, chat_id, message_id, int(call.data.split('_')[-1]))
+        elif call.data == "admin_announce_next":
+            if admin_module.ask_announcement_text(bot, chat_id, message_id):
+                bot.answer_callback_query(call.id)
+            else:
+                bot.answer_callback_query(call.id, "Отметьте хотя бы один вариант.", show_alert=True)
+        elif call.data == "admin_announce_send":
+            admin_module.send_announcement(bot, call)
+        elif call.data == "admin_announce_cancel":
+            bot.answer_callback_query(call.id)
+            admin_module.cancel_announcement(bot, chat_id, message_id)
+
         elif call.data == "admin_manage_schedule":
             bot.answer_callback_query(call.id, "Управление расписанием...")
             schedule_module.show_manage_schedule_panel(bot, chat_id, message_id)
@@ -524,7 +572,7 @@ def callback_query(call):
 
         elif call.data.startswith("admin_do_delete_schedule_for_group_"):
             group_id = int(call.data.split('_')[-1])
-            if db.update_schedule(group_id, None):
+            if schedule_module.save_group_schedule(group_id, None):
                 bot.answer_callback_query(call.id, "Расписание для группы очищено.", show_alert=True)
                 schedule_module.show_manage_schedule_panel(bot, chat_id, message_id)
             else:
@@ -559,6 +607,10 @@ def process_admin_bulk_faq_text_message(message):
 def process_admin_add_group_message(message):
     admin_module.process_add_group(message, bot)
 
+@bot.message_handler(func=lambda message: admin_module.is_admin(message.from_user.id) and admin_module.admin_states.get(message.chat.id) == admin_module.ADMIN_STATE_AWAITING_ANNOUNCEMENT_TEXT)
+def process_admin_announcement_text_message(message):
+    admin_module.process_announcement_text(message, bot)
+
 @bot.message_handler(func=lambda message: admin_module.is_admin(message.from_user.id) and admin_module.admin_states.get(message.chat.id, {}).get('state') == schedule_module.ADMIN_STATE_AWAITING_SCHEDULE_TEXT)
 def process_admin_schedule_text_message(message):
     schedule_module.process_schedule_update(message, bot, admin_module.admin_states)
@@ -570,7 +622,16 @@ def echo_all(message):
 if __name__ == '__main__':
     print("Бот запущен...")
     db.init_db()
+    db.start_invalidation_listener()
+    faq_workers.start()
+    outbox.start_workers(bot)
     try:
         bot.polling(none_stop=True)
     except Exception as e:
-        print(f"Произошла ошибка при запуске бота: {e}")
\ No newline at end of file
+        print(f"Произошла ошибка при запуске бота: {e}")
+    finally:
+        invalidation.stop_listener()
+        outbox.stop_workers()
+        faq_workers.shutdown()
+        user_profiles.shutdown()
+        db.close_db_pool()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import psycopg2
+
+# Произвольный постоянный ключ advisory-блокировки, чтобы два процесса бота не мигрировали одновременно.
+MIGRATION_LOCK_KEY = 720_431_001
+
+# Каждая миграция: (версия, описание, список SQL-команд). Версии только растут,
+# уже выпущенные миграции не редактируются — изменения схемы добавляются новой записью.
+MIGRATIONS = [
+    (1, "Базовая схема", [
+        """
+        CREATE TABLE IF NOT EXISTS support_requests (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            username VARCHAR(255),
+            full_name VARCHAR(255),
+            description TEXT NOT NULL,
+            status VARCHAR(50) DEFAULT 'Открыт',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            assigned_to BIGINT,
+            resolved_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq (
+            id SERIAL PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            category VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS classes (
+            id SERIAL PRIMARY KEY,
+            class_number INT UNIQUE NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS class_groups (
+            id SERIAL PRIMARY KEY,
+            class_id INT NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+            group_name VARCHAR(10) NOT NULL,
+            UNIQUE(class_id, group_name)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            is_admin BOOLEAN DEFAULT FALSE,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            group_id INT REFERENCES class_groups(id) ON DELETE SET NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS schedules (
+            id SERIAL PRIMARY KEY,
+            group_id INT UNIQUE NOT NULL REFERENCES class_groups(id) ON DELETE CASCADE,
+            schedule_text TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS support_messages (
+            id SERIAL PRIMARY KEY,
+            request_id INTEGER NOT NULL REFERENCES support_requests(id) ON DELETE CASCADE,
+            sender_id BIGINT NOT NULL,
+            sender_name VARCHAR(255),
+            sender_type VARCHAR(10) NOT NULL,
+            message_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "INSERT INTO classes (class_number) SELECT i FROM generate_series(1, 11) AS i ON CONFLICT (class_number) DO NOTHING;",
+    ]),
+    (2, "Индексы для горячих запросов", [
+        # get_user_support_requests: WHERE user_id ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_support_requests_user_created ON support_requests (user_id, created_at DESC);",
+        # get_new_support_requests: WHERE status = 'Открыт' AND created_at >= ... ORDER BY created_at
+        "CREATE INDEX IF NOT EXISTS idx_support_requests_status_created ON support_requests (status, created_at);",
+        # get_messages_for_request: WHERE request_id ORDER BY created_at
+        "CREATE INDEX IF NOT EXISTS idx_support_messages_request_created ON support_messages (request_id, created_at);",
+        # get_user_ids_for_group и ON DELETE SET NULL при удалении группы
+        "CREATE INDEX IF NOT EXISTS idx_users_group_id ON users (group_id);",
+    ]),
+    (3, "Индексы для постраничного списка запросов", [
+        # get_support_requests_page: ORDER BY created_at DESC, id DESC с курсором (created_at, id)
+        "CREATE INDEX IF NOT EXISTS idx_support_requests_created_id ON support_requests (created_at, id);",
+        # То же с фильтром по статусу; заменяет (status, created_at) из версии 2
+        "CREATE INDEX IF NOT EXISTS idx_support_requests_status_created_id ON support_requests (status, created_at, id);",
+        "DROP INDEX IF EXISTS idx_support_requests_status_created;",
+    ]),
+    (4, "Сохраненные эмбеддинги вопросов FAQ", [
+        """
+        CREATE TABLE IF NOT EXISTS faq_embeddings (
+            faq_id INT PRIMARY KEY REFERENCES faq(id) ON DELETE CASCADE,
+            model_name VARCHAR(255) NOT NULL,
+            question_hash BYTEA NOT NULL,
+            embedding BYTEA NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ]),
+    (5, "Очередь исходящих уведомлений (outbox)", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            kind VARCHAR(50) NOT NULL,
+            batch_id UUID,
+            message_text TEXT NOT NULL,
+            parse_mode VARCHAR(20),
+            reply_markup TEXT,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        );
+        """,
+        # Выборка готовых к отправке и зависших в отправке строк - по частичным индексам
+        "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox (available_at, id) WHERE status = 'pending';",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_sending ON notification_outbox (locked_at) WHERE status = 'sending';",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_batch ON notification_outbox (batch_id) WHERE batch_id IS NOT NULL;",
+    ]),
+    (6, "Окна объединения уведомлений об изменении расписания", [
+        """
+        CREATE TABLE IF NOT EXISTS schedule_notification_windows (
+            group_id INT PRIMARY KEY REFERENCES class_groups(id) ON DELETE CASCADE,
+            base_schedule_text TEXT,
+            batch_id UUID NOT NULL,
+            send_after TIMESTAMP NOT NULL
+        );
+        """,
+    ]),
+    (7, "Отметка пользователей, недоступных для бота", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS deactivated_at TIMESTAMP;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS deactivation_reason TEXT;",
+    ]),
+    (8, "Эмбеддинги FAQ хранятся отдельно для каждой модели", [
+        # Бэкенды кодировщика (torch / onnx) больше не затирают векторы друг друга
+        "ALTER TABLE faq_embeddings DROP CONSTRAINT IF EXISTS faq_embeddings_pkey;",
+        "ALTER TABLE faq_embeddings ADD PRIMARY KEY (faq_id, model_name);",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cur):
+    """Возвращает примененную версию схемы или 0, если миграции еще не запускались."""
+    cur.execute("SELECT to_regclass('schema_version');")
+    if cur.fetchone()[0] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+    return cur.fetchone()[0]
+
+
+def apply_migration(cur, migration):
+    version, description, statements = migration
+    for statement in statements:
+        cur.execute(statement)
+    cur.execute(
+        "INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+        (version, description)
+    )
+
+
+def migrate(conn, target_version=LATEST_VERSION):
+    """
+    Доводит схему до target_version. Если схема уже актуальна, выполняется
+    только один SELECT и никаких DDL. Возвращает список примененных версий.
+    """
+    cur = conn.cursor()
+    try:
+        if get_schema_version(cur) >= target_version:
+            conn.rollback()
+            return []
+
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # Версию перечитываем под блокировкой: другой процесс мог успеть мигрировать.
+        current_version = get_schema_version(cur)
+
+        applied = []
+        for migration in MIGRATIONS:
+            if current_version < migration[0] <= target_version:
+                apply_migration(cur, migration)
+                applied.append(migration[0])
+        conn.commit()
+        return applied
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -0,0 +1,173 @@
+"""
+Надежная доставка уведомлений через таблицу notification_outbox.
+
+Производители (функции database.py с параметром notification) вставляют строки в той же транзакции,
+что и изменение, которое их вызвало: откат изменения отменяет и уведомления, а записанные
+сообщения переживают перезапуск бота. Рабочие потоки забирают пачки строк через
+FOR UPDATE SKIP LOCKED (несколько потоков и процессов не мешают друг другу), отправляют
+их через ограничитель broadcast и записывают исход. Временные ошибки повторяются
+с экспоненциальной паузой, после OUTBOX_MAX_ATTEMPTS попыток или при отказе Telegram
+сообщение переводится в статус 'dead'. Если чат недоступен навсегда (бот заблокирован),
+пользователь отмечается неактивным, и его ожидающие уведомления тоже переводятся в 'dead'.
+"""
+import threading
+import time
+import uuid
+import config
+import modules.database as db
+import modules.broadcast as broadcast
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_DEAD = "dead"
+
+KIND_SCHEDULE = "schedule_update"
+KIND_NEW_REQUEST = "new_support_request"
+KIND_REQUEST_STATUS = "support_request_status"
+
+WORKERS = getattr(config, 'OUTBOX_WORKERS', 4)
+BATCH_SIZE = getattr(config, 'OUTBOX_BATCH_SIZE', 50)
+POLL_INTERVAL = getattr(config, 'OUTBOX_POLL_INTERVAL', 1.0)
+MAX_ATTEMPTS = getattr(config, 'OUTBOX_MAX_ATTEMPTS', 6)
+RETRY_BASE_DELAY = getattr(config, 'OUTBOX_RETRY_BASE_DELAY', 5.0)
+RETRY_MAX_DELAY = getattr(config, 'OUTBOX_RETRY_MAX_DELAY', 600.0)
+# Строки в статусе 'sending' дольше этого срока считаются брошенными (процесс упал) и забираются снова
+LEASE_SECONDS = getattr(config, 'OUTBOX_LEASE_SECONDS', 300)
+# Доставленные уведомления хранятся столько дней, затем удаляются (не чаще раза в CLEANUP_INTERVAL секунд)
+RETENTION_DAYS = getattr(config, 'OUTBOX_RETENTION_DAYS', 7)
+CLEANUP_INTERVAL = 3600
+
+_workers = []
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+# Пачки, за доставкой которых уже следит поток этого процесса
+_tracked_batches = set()
+_tracked_lock = threading.Lock()
+
+
+def message(kind, text, parse_mode=None, reply_markup=None, batch_id=None):
+    """Описание уведомления для функций database.py: разметка клавиатуры хранится в JSON, как ее ждет Bot API."""
+    if reply_markup is not None and hasattr(reply_markup, 'to_json'):
+        reply_markup = reply_markup.to_json()
+    return {
+        'kind': kind,
+        'batch_id': batch_id,
+        'text': text,
+        'parse_mode': parse_mode,
+        'reply_markup': reply_markup,
+    }
+
+
+def new_batch_id():
+    return str(uuid.uuid4())
+
+
+def wake():
+    """Будит рабочие потоки этого процесса сразу после записи новых сообщений."""
+    _wake_event.set()
+
+
+def retry_delay(attempts):
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def _deliver(bot, row):
+    outbox_id, chat_id, text, parse_mode, reply_markup, attempts = row
+    outcome, error, wait = broadcast.deliver_once(bot, chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+    if outcome == broadcast.DELIVERY_FAILED and parse_mode and broadcast.classify_error(error) == broadcast.ERROR_PARSE:
+        # Текст собран из введенного админом расписания и может ломать разметку - отправляем без нее
+        print(f"Уведомление #{outbox_id}: разметка не разобрана ({error}), отправляю без форматирования.")
+        outcome, error, wait = broadcast.deliver_once(bot, chat_id, text, reply_markup=reply_markup)
+    if outcome == broadcast.DELIVERY_SENT:
+        return outbox_id, STATUS_SENT, None, None
+    if outcome == broadcast.DELIVERY_RETRY and attempts < MAX_ATTEMPTS:
+        return outbox_id, STATUS_PENDING, str(error), max(wait or 0, retry_delay(attempts))
+    print(f"Уведомление #{outbox_id} для {chat_id} не доставлено (попыток: {attempts}): {error}")
+    return outbox_id, STATUS_DEAD, str(error), None
+
+
+def _worker_loop(bot, cleanup=False):
+    next_cleanup = time.monotonic()
+    while not _stop_event.is_set():
+        try:
+            if cleanup and time.monotonic() >= next_cleanup:
+                db.delete_sent_outbox(RETENTION_DAYS)
+                next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+            rows = db.claim_outbox_batch(BATCH_SIZE, LEASE_SECONDS)
+            if not rows:
+                _wake_event.wait(POLL_INTERVAL)
+                _wake_event.clear()
+                continue
+            results = [_deliver(bot, row) for row in rows]
+            db.record_outbox_results(results)
+        except Exception as e:
+            # Поток не должен умирать: незаписанные строки заберутся снова по истечении аренды.
+            print(f"Ошибка потока доставки уведомлений: {e}")
+            _stop_event.wait(POLL_INTERVAL)
+
+
+def start_workers(bot, count=WORKERS):
+    if _workers:
+        return
+    _stop_event.clear()
+    for i in range(count):
+        worker = threading.Thread(target=_worker_loop, args=(bot, i == 0), name=f"outbox-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def stop_workers(timeout=10.0):
+    _stop_event.set()
+    _wake_event.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+
+
+def track_batch(bot, report_chat_id, batch_id, title, delay=0):
+    """
+    Показывает админу ход доставки пачки уведомлений одним редактируемым сообщением,
+    как broadcast.start_broadcast, но по счетчикам из notification_outbox.
+    delay - через сколько секунд пачка станет доступна для отправки. Повторный вызов для той же пачки ничего не делает.
+    """
+    with _tracked_lock:
+        if batch_id in _tracked_batches:
+            return None
+        _tracked_batches.add(batch_id)
+
+    job = broadcast.BroadcastJob(title)
+    reporter = broadcast.ProgressReporter(bot, report_chat_id, job)
+
+    def poll():
+        try:
+            if _stop_event.wait(delay):
+                return
+            job.started_at = time.monotonic()
+            _poll_batch(batch_id, job, reporter)
+        finally:
+            with _tracked_lock:
+                _tracked_batches.discard(batch_id)
+
+    threading.Thread(target=poll, name="outbox-progress", daemon=True).start()
+    return job
+
+
+def _poll_batch(batch_id, job, reporter):
+    while not _stop_event.is_set():
+        try:
+            counts = db.get_outbox_batch_counts(batch_id)
+            if counts is not None:
+                job.total = sum(counts.values())
+                if not job.total:
+                    return
+                job.sent = counts.get(STATUS_SENT, 0)
+                job.failed = counts.get(STATUS_DEAD, 0)
+                if not job.remaining:
+                    job.finished_at = time.monotonic()
+                    reporter.update()
+                    return
+                reporter.update()
+        except Exception as e:
+            print(f"Ошибка при обновлении хода доставки пачки {batch_id}: {e}")
+        _stop_event.wait(broadcast.PROGRESS_INTERVAL)
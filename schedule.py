@@ -1,10 +1,26 @@
 from telebot import types
 import re
 import modules.database as db
+import modules.catalog as catalog
 import config
+from modules.cache import LRUCache
+import modules.invalidation as invalidation
+import modules.outbox as outbox
 
 ADMIN_STATE_AWAITING_SCHEDULE_TEXT = 5
 
+DAYS_OF_WEEK = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+DAY_HEADER_PATTERN = re.compile(r'^\s*(' + '|'.join(DAYS_OF_WEEK) + '):', re.MULTILINE | re.IGNORECASE)
+
+EMPTY_SCHEDULE_TEXT = "Расписание еще не заполнено."
+NO_LESSONS_TEXT = "На этот день занятий не найдено."
+
+# Правки расписания группы в течение этого окна объединяются в одно уведомление ученикам
+NOTIFY_DEBOUNCE_MINUTES = getattr(config, 'SCHEDULE_NOTIFY_DEBOUNCE_MINUTES', 3)
+
+# group_id -> разобранное расписание группы, версия - schedules.updated_at
+_schedule_cache = LRUCache(max_size=getattr(config, 'SCHEDULE_CACHE_SIZE', 1000))
+
 def get_manage_schedule_menu():
     """Возвращает меню управления расписанием для администратора."""
     markup = types.InlineKeyboardMarkup(row_width=1)
@@ -25,7 +41,7 @@ def show_manage_schedule_panel(bot, chat_id, message_id):
     )
 
 def select_group_for_schedule_update(bot, chat_id):
-    groups = db.get_all_groups_with_classes()
+    groups = catalog.get_all_groups_with_classes()
     if not groups:
         bot.send_message(chat_id, "Сначала нужно создать хотя бы одну группу в разделе 'Управление классами'.")
         return
@@ -39,7 +55,7 @@ def select_group_for_schedule_update(bot, chat_id):
 
 def start_schedule_update_flow(bot, chat_id, admin_states, group_id):
     """Начинает процесс обновления расписания для конкретной группы."""
-    group_info = db.get_group_info(group_id)
+    group_info = catalog.get_group_info(group_id)
     group_name_full = f"{group_info[2]}{group_info[1]}" if group_info else f"ID: {group_id}"
 
     template = (
@@ -69,41 +85,41 @@ def process_schedule_update(message, bot, admin_states):
 
     group_id = state_data['group_id']
     new_schedule_text = message.text
-    
-    old_schedule_text = db.get_schedule_for_group(group_id)
-
-    old_schedule_dict = parse_schedule_to_dict(old_schedule_text)
     new_schedule_dict = parse_schedule_to_dict(new_schedule_text)
 
-    changed_days = []
-    all_days = sorted(list(set(old_schedule_dict.keys()) | set(new_schedule_dict.keys())), key=lambda x: ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"].index(x))
-
-    for day in all_days:
-        old_day_schedule = old_schedule_dict.get(day, "").strip()
-        new_day_schedule = new_schedule_dict.get(day, "").strip()
-
-        if old_day_schedule != new_day_schedule:
-            changed_days.append(day)
+    def build_notification(base_schedule_text):
+        # base_schedule_text - расписание до первой правки в текущем окне объединения
+        changed_days = get_changed_days(parse_schedule_to_dict(base_schedule_text), new_schedule_dict)
+        return build_schedule_notification(changed_days, is_major_update=(not base_schedule_text))
 
-    if db.update_schedule(group_id, new_schedule_text):
+    saved, queued = save_group_schedule_and_notify(group_id, new_schedule_text, build_notification)
+    if saved:
         bot.send_message(message.chat.id, "✅ Расписание успешно обновлено!")
-        notify_group_users_about_schedule_update(bot, group_id, changed_days, is_major_update=(not old_schedule_text))
+        if queued:
+            notify_group_users_about_schedule_update(bot, group_id, queued, report_chat_id=chat_id)
+        else:
+            print("Изменений в расписании не найдено, уведомления не отправляются.")
     else:
         bot.send_message(message.chat.id, "❌ Произошла ошибка при обновлении расписания.")
     
     admin_states[chat_id] = 0
 
+def get_changed_days(old_schedule_dict, new_schedule_dict):
+    """Дни недели (по порядку), расписание которых отличается."""
+    all_days = sorted(set(old_schedule_dict) | set(new_schedule_dict), key=DAYS_OF_WEEK.index)
+    return [
+        day for day in all_days
+        if old_schedule_dict.get(day, "").strip() != new_schedule_dict.get(day, "").strip()
+    ]
+
 def parse_schedule_to_dict(full_text):
     """Разбирает полный текст расписания в словарь."""
     if not full_text:
         return {}
     
-    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
     schedule_dict = {}
     
-    pattern = re.compile(r'^\s*(' + '|'.join(days) + '):', re.MULTILINE | re.IGNORECASE)
-    
-    matches = list(pattern.finditer(full_text))
+    matches = list(DAY_HEADER_PATTERN.finditer(full_text))
     
     if not matches:
         return {}
@@ -122,7 +138,7 @@ def parse_schedule_to_dict(full_text):
 def parse_schedule_for_day(full_text, day_name):
     """Получает расписание на конкретный день из полного текста."""
     if not full_text:
-        return "Расписание еще не заполнено."
+        return EMPTY_SCHEDULE_TEXT
     
     schedule_by_days = parse_schedule_to_dict(full_text)
     
@@ -131,21 +147,89 @@ def parse_schedule_for_day(full_text, day_name):
     if schedule_for_day:
         return schedule_for_day
     else:
-        return "На этот день занятий не найдено."
+        return NO_LESSONS_TEXT
 
-def notify_group_users_about_schedule_update(bot, group_id, changed_days, is_major_update=False):
-    """Отправляет пользователям конкретной группы уведомление об обновлении расписания."""
-    
-    if not changed_days and not is_major_update:
-        print("Изменений в расписании не найдено, уведомления не отправляются.")
-        return
+def build_schedule_entry(schedule_text, version):
+    """Разбирает расписание один раз и заранее готовит тексты для всех дней и недели."""
+    days = parse_schedule_to_dict(schedule_text)
+    if schedule_text:
+        day_texts = {day: days.get(day) or NO_LESSONS_TEXT for day in DAYS_OF_WEEK}
+        week_message = f"**Расписание на неделю:**\n\n{schedule_text}"
+    else:
+        day_texts = {day: EMPTY_SCHEDULE_TEXT for day in DAYS_OF_WEEK}
+        week_message = None
+    return {
+        'version': version,
+        'text': schedule_text,
+        'days': days,
+        'day_texts': day_texts,
+        'week_message': week_message,
+    }
+
+def get_group_schedule(group_id):
+    """
+    Разобранное расписание группы из кэша; при промахе - один запрос к БД.
+    Возвращает словарь build_schedule_entry или None, если БД недоступна.
+    """
+    entry = _schedule_cache.get(group_id, None)
+    if entry is not None:
+        return entry
+
+    result = db.get_schedule_with_version(group_id)
+    if result is None:
+        return None
+    schedule_text, version = result
+    entry = build_schedule_entry(schedule_text, version)
+    _schedule_cache.put(group_id, entry)
+    return entry
+
+def save_group_schedule(group_id, schedule_text):
+    """Сохраняет расписание и сразу кладет в кэш разобранную новую версию."""
+    return save_group_schedule_and_notify(group_id, schedule_text)[0]
 
-    user_ids_in_group = db.get_user_ids_for_group(group_id)
-    if not user_ids_in_group:
-        print(f"Нет пользователей в группе {group_id} для уведомления.")
+def save_group_schedule_and_notify(group_id, schedule_text, build_notification=None):
+    """
+    То же, но в той же транзакции ставит в outbox уведомление ученикам (см. db.update_schedule).
+    Возвращает (сохранено, queued), queued - {'batch_id', 'send_in'} или None.
+    """
+    version, queued = db.update_schedule(group_id, schedule_text, build_notification, NOTIFY_DEBOUNCE_MINUTES * 60)
+    if not version:
+        _schedule_cache.invalidate(group_id)
+        return False, None
+    _schedule_cache.put(group_id, build_schedule_entry(schedule_text, version))
+    return True, queued
+
+def invalidate_group_schedule(group_id):
+    _schedule_cache.invalidate(group_id)
+
+def _on_schedule_changed(group_id, version):
+    """Событие из другого процесса: сбрасываем запись, если ее версия отличается от новой."""
+    if group_id is None:
+        _schedule_cache.clear()
         return
-        
-    notification_text = ""
+    entry = _schedule_cache.get(group_id, None)
+    if entry is not None and entry['version'] is not None and entry['version'].isoformat() == version:
+        return
+    _schedule_cache.invalidate(group_id)
+
+def _on_catalog_changed(group_id, version):
+    # Удаление группы каскадно удаляет ее расписание.
+    if group_id is None:
+        _schedule_cache.clear()
+    else:
+        _schedule_cache.invalidate(group_id)
+
+invalidation.subscribe(invalidation.ENTITY_SCHEDULE, _on_schedule_changed)
+invalidation.subscribe(invalidation.ENTITY_CATALOG, _on_catalog_changed)
+
+def get_schedule_cache_stats():
+    return _schedule_cache.stats()
+
+def build_schedule_notification(changed_days, is_major_update=False):
+    """Уведомление outbox об обновлении расписания или None, если сообщать не о чем."""
+    if not changed_days and not is_major_update:
+        return None
+
     if is_major_update:
         notification_text = "🔔 **Опубликовано новое расписание для вашего класса!**"
     elif len(changed_days) > 3:
@@ -157,20 +241,33 @@ def notify_group_users_about_schedule_update(bot, group_id, changed_days, is_maj
     markup = types.InlineKeyboardMarkup(row_width=1)
     btn_view_schedule = types.InlineKeyboardButton("🗓️ Посмотреть актуальное расписание", callback_data="schedule_week")
     markup.add(btn_view_schedule)
+    return outbox.message(outbox.KIND_SCHEDULE, notification_text, parse_mode="Markdown", reply_markup=markup,
+                          batch_id=outbox.new_batch_id())
 
-    for user_id in user_ids_in_group:
-        try:
-            bot.send_message(
-                user_id,
-                notification_text,
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-        except Exception as e:
-            print(f"Не удалось отправить уведомление об обновлении расписания пользователю {user_id}: {e}")
+def notify_group_users_about_schedule_update(bot, group_id, queued, report_chat_id=None):
+    """
+    Уведомления уже записаны в outbox вместе с расписанием и уйдут по окончании окна объединения.
+    Если задан report_chat_id, туда сообщается время отправки, а затем ход рассылки.
+    """
+    if queued['send_in'] <= 0:
+        outbox.wake()
+    if not report_chat_id:
+        return
+
+    group_info = catalog.get_group_info(group_id)
+    group_name_full = f"{group_info[2]}{group_info[1]}" if group_info else f"ID: {group_id}"
+    if queued['send_in'] > 0:
+        minutes = max(1, round(queued['send_in'] / 60))
+        bot.send_message(
+            report_chat_id,
+            f"🕒 Уведомление ученикам группы {group_name_full} уйдет примерно через {minutes} мин. "
+            f"Правки расписания до этого момента попадут в то же уведомление."
+        )
+    outbox.track_batch(bot, report_chat_id, queued['batch_id'], f"Уведомление об изменении расписания группы {group_name_full}",
+                       delay=queued['send_in'])
 
 def select_group_for_schedule_delete(bot, chat_id, message_id):
-    groups = db.get_all_groups_with_classes()
+    groups = catalog.get_all_groups_with_classes()
     if not groups:
         bot.edit_message_text(chat_id, message_id, "Нет групп, для которых можно было бы удалить расписание.", reply_markup=types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("⬅️ Назад", callback_data="admin_manage_schedule")))
         return
@@ -182,7 +279,7 @@ def select_group_for_schedule_delete(bot, chat_id, message_id):
     bot.edit_message_text(chat_id, message_id, "Выберите группу, для которой хотите очистить расписание:", reply_markup=markup)
 
 def confirm_schedule_delete_for_group(bot, chat_id, message_id, group_id):
-    group_info = db.get_group_info(group_id)
+    group_info = catalog.get_group_info(group_id)
     if not group_info: return
     group_name_full = f"{group_info[2]}{group_info[1]}"
     
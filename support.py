@@ -1,12 +1,16 @@
 from telebot import types
 import modules.database as db
 import config
-import modules.faq_matcher as faq_matcher
+import modules.faq_workers as faq_workers
+import modules.outbox as outbox
 
 SUPPORT_STATE_NONE = 0
 SUPPORT_STATE_AWAITING_DESCRIPTION = 1
 SUPPORT_STATE_AWAITING_REPLY = 2
 SUPPORT_STATE_AWAITING_FAQ_CONFIRM = 3
+SUPPORT_STATE_SEARCHING_FAQ = 4
+
+SUGGESTION_BUTTON_MAX_LENGTH = 60
 
 user_support_states = {}
 user_replying_to_request_id = {}
@@ -30,40 +34,84 @@ def process_support_description(message, bot):
     full_name = f"{message.from_user.first_name} {message.from_user.last_name if message.from_user.last_name else ''}".strip()
     description = message.text
 
-    all_faq_items = db.get_all_faq_items()
-    
-    best_match = faq_matcher.find_best_faq_match(description, all_faq_items)
-    
-    if best_match:
-        faq_question, faq_answer = best_match
-        bot.send_message(
-            user_id,
-            f"💡 **Найден возможный ответ в нашем FAQ:**\n\n"
-            f"**Вопрос:** {faq_question}\n"
-            f"**Ответ:** {faq_answer}",
-            parse_mode="Markdown"
-        )
-        
-        markup = types.InlineKeyboardMarkup(row_width=2)
-        btn_yes = types.InlineKeyboardButton("Да", callback_data="faq_solved")
-        btn_no = types.InlineKeyboardButton("Нет", callback_data="faq_not_solved")
-        markup.add(btn_yes, btn_no)
-        bot.send_message(user_id, "Это решило вашу проблему?", reply_markup=markup)
+    # Пока идет поиск, новые сообщения пользователя не запускают второй
+    user_support_states[user_id] = {'state': SUPPORT_STATE_SEARCHING_FAQ}
+    faq_workers.find_faq_matches_async(
+        description,
+        lambda matches: continue_after_faq_search(bot, user_id, username, full_name, description, matches)
+    )
+
+def continue_after_faq_search(bot, user_id, username, full_name, description, matches):
+    """Вызывается из потока faq_workers по готовности поиска (или по таймауту с пустым списком)."""
+    if user_support_states.get(user_id, {}).get('state') != SUPPORT_STATE_SEARCHING_FAQ:
+        return  # пользователь уже ушел из сценария
 
+    if matches:
+        suggestions = [(question, answer) for question, answer, _, _ in matches]
         user_support_states[user_id] = {
             'state': SUPPORT_STATE_AWAITING_FAQ_CONFIRM,
-            'description': description
+            'description': description,
+            'suggestions': suggestions
         }
+        if matches[0][3]:
+            send_faq_answer(bot, user_id, suggestions, 0)
+        else:
+            markup = types.InlineKeyboardMarkup(row_width=1)
+            for i, (question, _) in enumerate(suggestions):
+                markup.add(types.InlineKeyboardButton(_shorten(question), callback_data=f"faq_suggest_{i}"))
+            markup.add(types.InlineKeyboardButton("Нет, создать запрос", callback_data="faq_not_solved"))
+            bot.send_message(user_id, "🤔 Возможно, вы имели в виду один из этих вопросов?", reply_markup=markup)
         return
 
     create_ticket(user_id, username, full_name, description, bot)
 
+def _shorten(text):
+    if len(text) <= SUGGESTION_BUTTON_MAX_LENGTH:
+        return text
+    return text[:SUGGESTION_BUTTON_MAX_LENGTH - 1] + "…"
+
+def send_faq_answer(bot, user_id, suggestions, shown_index):
+    """Показывает ответ из FAQ и спрашивает, помог ли он; остальные варианты - кнопками."""
+    faq_question, faq_answer = suggestions[shown_index]
+    bot.send_message(
+        user_id,
+        f"💡 **Найден возможный ответ в нашем FAQ:**\n\n"
+        f"**Вопрос:** {faq_question}\n"
+        f"**Ответ:** {faq_answer}",
+        parse_mode="Markdown"
+    )
+
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    btn_yes = types.InlineKeyboardButton("Да", callback_data="faq_solved")
+    btn_no = types.InlineKeyboardButton("Нет", callback_data="faq_not_solved")
+    markup.add(btn_yes, btn_no)
+    for i, (question, _) in enumerate(suggestions):
+        if i != shown_index:
+            markup.row(types.InlineKeyboardButton(f"Похожий вопрос: {_shorten(question)}", callback_data=f"faq_suggest_{i}"))
+    bot.send_message(user_id, "Это решило вашу проблему?", reply_markup=markup)
+
+def show_faq_suggestion(call, bot):
+    user_id = call.message.chat.id
+    state_data = user_support_states.get(user_id) or {}
+    suggestions = state_data.get('suggestions', [])
+    index = int(call.data.split('_')[-1])
+
+    if index >= len(suggestions):
+        bot.send_message(user_id, "Этот вариант уже неактуален. Опишите проблему заново.")
+        start_create_request_flow(call.message, bot)
+        return
+
+    send_faq_answer(bot, user_id, suggestions, index)
+
 def create_ticket(user_id, username, full_name, description, bot):
-    request_id = db.add_support_request(user_id, username, full_name, description)
+    request_id = db.add_support_request(
+        user_id, username, full_name, description,
+        build_notification=lambda new_request_id: build_admin_notification(new_request_id, user_id, full_name, description)
+    )
     if request_id:
+        outbox.wake()
         db.add_support_message(request_id, user_id, full_name, 'user', description)
         bot.send_message(user_id, f"Спасибо, ваш запрос #{request_id} принят и будет рассмотрен. Мы свяжемся с вами в ближайшее время.")
-        notify_admins_new_request(bot, request_id, user_id, full_name, description)
     else:
         bot.send_message(user_id, "Извините, не удалось создать запрос. Пожалуйста, попробуйте позже.")
 
@@ -132,24 +180,22 @@ def show_user_requests(message, bot):
     
     bot.send_message(user_id, requests_text, parse_mode="Markdown", reply_markup=markup)
 
-def notify_admins_new_request(bot, request_id, user_id, user_full_name, description):
+def build_admin_notification(request_id, user_id, user_full_name, description):
+    """(получатели, уведомление outbox) о новом запросе - ставится в очередь вместе с самим запросом."""
     markup = types.InlineKeyboardMarkup()
     btn_details = types.InlineKeyboardButton("Просмотреть запрос", callback_data=f"admin_view_request_details_{request_id}")
     markup.add(btn_details)
-    
-    for admin_id in config.ADMIN_IDS:
-        try:
-            bot.send_message(
-                admin_id,
-                f"🚨 **НОВЫЙ ЗАПРОС В ТЕХПОДДЕРЖКУ!** 🚨\n\n"
-                f"**ID запроса:** #{request_id}\n"
-                f"**От пользователя:** {user_full_name} (ID: `{user_id}`)\n"
-                f"**Описание:** {description}",
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-        except Exception as e:
-            print(f"Не удалось отправить уведомление админу {admin_id}: {e}")
+
+    notification = outbox.message(
+        outbox.KIND_NEW_REQUEST,
+        f"🚨 **НОВЫЙ ЗАПРОС В ТЕХПОДДЕРЖКУ!** 🚨\n\n"
+        f"**ID запроса:** #{request_id}\n"
+        f"**От пользователя:** {user_full_name} (ID: `{user_id}`)\n"
+        f"**Описание:** {description}",
+        parse_mode="Markdown",
+        reply_markup=markup
+    )
+    return config.ADMIN_IDS, notification
 
 def start_reply_flow(message, bot, request_id):
     chat_id = message.chat.id
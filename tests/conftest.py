@@ -0,0 +1,32 @@
+"""
+Общая настройка тестов.
+Модули проекта импортируются как пакет modules (см. структуру в README); если тесты запущены
+из самой папки модулей, она регистрируется под этим именем. Без config.py рядом подставляется
+минимальный конфиг: тесты не обращаются ни к Telegram, ни к PostgreSQL.
+"""
+import os
+import sys
+import types
+
+MODULES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import modules  # noqa: F401
+except ImportError:
+    package = types.ModuleType('modules')
+    package.__path__ = [MODULES_DIR]
+    sys.modules['modules'] = package
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = types.ModuleType('config')
+    config.BOT_TOKEN = 'test-token'
+    config.ADMIN_IDS = [1]
+    config.PG_HOST = 'localhost'
+    config.PG_PORT = 5432
+    config.PG_DATABASE = 'test'
+    config.PG_USER = 'test'
+    config.PG_PASSWORD = 'test'
+    config.DEBUG_FAQ_MATCHING = False
+    sys.modules['config'] = config
@@ -0,0 +1,109 @@
+import pytest
+import requests
+from telebot.apihelper import ApiTelegramException
+from modules import broadcast
+
+
+class FakeTime:
+    """Часы без реального ожидания: sleep только сдвигает monotonic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(broadcast, "time", fake)
+    return fake
+
+
+def test_bucket_limits_rate(clock):
+    bucket = broadcast.TokenBucket(rate=10, capacity=1)
+    started = clock.now
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.now - started == pytest.approx(0.4)
+
+
+def test_bucket_allows_burst_up_to_capacity(clock):
+    bucket = broadcast.TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 1000.0
+    bucket.acquire()
+    assert clock.now - 1000.0 == pytest.approx(0.5)
+
+
+def test_bucket_refills_while_idle(clock):
+    bucket = broadcast.TokenBucket(rate=1, capacity=1)
+    bucket.acquire()
+    clock.now += 5
+    bucket.acquire()
+    assert clock.now == 1005.0
+
+
+def test_pause_blocks_until_it_expires(clock):
+    bucket = broadcast.TokenBucket(rate=100, capacity=1)
+    bucket.pause(3)
+    bucket.acquire()
+    assert clock.now - 1000.0 == pytest.approx(3.0)
+
+
+def test_limiter_throttles_each_chat_separately(clock):
+    limiter = broadcast.RateLimiter(global_rate=100, per_chat_rate=1)
+    limiter.acquire(1)
+    limiter.acquire(2)
+    assert clock.now - 1000.0 < 0.05
+    limiter.acquire(1)
+    assert clock.now - 1000.0 == pytest.approx(1.0, abs=0.05)
+
+
+def api_error(code, description):
+    return ApiTelegramException("sendMessage", None, {"error_code": code, "description": description})
+
+
+@pytest.mark.parametrize("error, kind", [
+    (api_error(403, "Forbidden: bot was blocked by the user"), broadcast.ERROR_BLOCKED),
+    (api_error(403, "Forbidden: user is deactivated"), broadcast.ERROR_BLOCKED),
+    (api_error(400, "Bad Request: chat not found"), broadcast.ERROR_CHAT_NOT_FOUND),
+    (api_error(400, "Bad Request: can't parse entities: Unsupported start tag"), broadcast.ERROR_PARSE),
+    (api_error(400, "Bad Request: message is too long"), broadcast.ERROR_BAD_REQUEST),
+    (api_error(429, "Too Many Requests: retry after 5"), broadcast.ERROR_RATE_LIMIT),
+    (api_error(502, "Bad Gateway"), broadcast.ERROR_NETWORK),
+    (ConnectionError("connection reset"), broadcast.ERROR_NETWORK),
+    (requests.exceptions.ReadTimeout("read timed out"), broadcast.ERROR_NETWORK),
+    (TypeError("unexpected keyword argument"), broadcast.ERROR_BAD_REQUEST),
+])
+def test_classify_error(error, kind):
+    assert broadcast.classify_error(error) == kind
+
+
+class FailingBot:
+    def __init__(self, error):
+        self.error = error
+
+    def send_message(self, chat_id, text, **kwargs):
+        raise self.error
+
+
+def test_blocked_chat_is_deactivated_and_not_retried(monkeypatch):
+    deactivated = []
+    monkeypatch.setattr(broadcast.db, "deactivate_user", lambda chat_id, reason: deactivated.append((chat_id, reason)))
+    monkeypatch.setattr(broadcast.limiter, "acquire", lambda chat_id: None)
+    bot = FailingBot(api_error(403, "Forbidden: bot was blocked by the user"))
+    assert broadcast.deliver(bot, 42, "text") == broadcast.DELIVERY_UNREACHABLE
+    assert deactivated == [(42, broadcast.ERROR_BLOCKED)]
+
+
+def test_bad_request_keeps_user_active(monkeypatch):
+    monkeypatch.setattr(broadcast.db, "deactivate_user", lambda chat_id, reason: pytest.fail("пользователь не должен отключаться"))
+    monkeypatch.setattr(broadcast.limiter, "acquire", lambda chat_id: None)
+    bot = FailingBot(api_error(400, "Bad Request: message is too long"))
+    assert broadcast.deliver(bot, 42, "text") == broadcast.DELIVERY_FAILED
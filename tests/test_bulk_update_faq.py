@@ -0,0 +1,108 @@
+import pytest
+from modules import database as db
+from modules import invalidation
+
+
+class FaqTable:
+    """Таблица faq в памяти: курсор отдает ее на SELECT и применяет DELETE."""
+
+    def __init__(self, rows):
+        self.rows = {faq_id: (question, answer) for faq_id, question, answer in rows}
+        self.next_id = max(self.rows, default=0) + 1
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return FaqCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FaqCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+
+    def execute(self, query, params=None):
+        if query.startswith("SELECT"):
+            self.result = [(faq_id, q, a) for faq_id, (q, a) in sorted(self.table.rows.items())]
+        elif query.startswith("DELETE"):
+            for faq_id in params[0]:
+                del self.table.rows[faq_id]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def fake_execute_values(cur, query, values, page_size=100, fetch=False):
+    table = cur.table
+    if query.startswith("INSERT"):
+        ids = []
+        for question, answer in values:
+            table.rows[table.next_id] = (question, answer)
+            ids.append((table.next_id,))
+            table.next_id += 1
+        return ids
+    for faq_id, answer in values:
+        table.rows[faq_id] = (table.rows[faq_id][0], answer)
+    return None
+
+
+@pytest.fixture
+def faq(monkeypatch):
+    published = []
+    table = FaqTable([
+        (1, "Как записаться?", "Через сайт"),
+        (2, "Сколько стоит?", "1000"),
+        (3, "Где проходят занятия?", "Онлайн"),
+        (4, "Сколько стоит?", "дубль"),
+    ])
+    monkeypatch.setattr(db, "get_db_connection", lambda: table)
+    monkeypatch.setattr(db, "release_db_connection", lambda conn: None)
+    monkeypatch.setattr(db, "execute_values", fake_execute_values)
+    monkeypatch.setattr(invalidation, "publish", lambda cur, entity, **kwargs: published.append(entity))
+    table.published = published
+    return table
+
+
+def test_report_lists_inserted_updated_and_deleted_ids(faq):
+    report = db.bulk_update_faq([
+        ("Как записаться?", "Через сайт"),
+        ("Сколько стоит?", "1200"),
+        ("Есть ли пробный урок?", "Да"),
+    ])
+
+    assert report == {'inserted': [5], 'updated': [2], 'deleted': [3, 4]}
+    assert faq.rows == {
+        1: ("Как записаться?", "Через сайт"),
+        2: ("Сколько стоит?", "1200"),
+        5: ("Есть ли пробный урок?", "Да"),
+    }
+    assert faq.committed
+    assert faq.published == [invalidation.ENTITY_FAQ]
+
+
+def test_last_answer_wins_for_repeated_question(faq):
+    report = db.bulk_update_faq([
+        ("Как записаться?", "Через сайт"),
+        ("Сколько стоит?", "1000"),
+        ("Где проходят занятия?", "Онлайн"),
+        ("Сколько стоит?", "900"),
+    ])
+    assert report == {'inserted': [], 'updated': [2], 'deleted': [4]}
+
+
+def test_unchanged_faq_reports_nothing_and_skips_invalidation(faq):
+    db.bulk_update_faq([("Сколько стоит?", "дубль")])
+    faq.published.clear()
+
+    report = db.bulk_update_faq([("Сколько стоит?", "дубль")])
+    assert report == {'inserted': [], 'updated': [], 'deleted': []}
+    assert faq.published == []
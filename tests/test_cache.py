@@ -0,0 +1,53 @@
+from modules import cache
+from modules.cache import LRUCache, MISSING
+
+
+def test_get_returns_stored_value_and_missing_marker():
+    lru = LRUCache(max_size=2)
+    lru.put("a", None)
+    assert lru.get("a") is None
+    assert lru.get("b") is MISSING
+    assert lru.get("b", 0) == 0
+
+
+def test_evicts_least_recently_used():
+    lru = LRUCache(max_size=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert lru.get("b") is MISSING
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(max_size=10, ttl=5)
+    lru.put("a", 1)
+    now[0] += 4.9
+    assert lru.get("a") == 1
+    now[0] += 0.2
+    assert lru.get("a") is MISSING
+    stats = lru.stats()
+    assert stats['expirations'] == 1 and stats['size'] == 0
+
+
+def test_invalidate_where_removes_matching_entries():
+    lru = LRUCache()
+    for key in range(6):
+        lru.put(key, key % 2)
+    assert lru.invalidate_where(lambda key, value: value == 1) == 3
+    assert [key for key in range(6) if lru.get(key) is not MISSING] == [0, 2, 4]
+
+
+def test_stats_count_hits_and_misses():
+    lru = LRUCache()
+    lru.put("a", 1)
+    lru.get("a")
+    lru.get("a")
+    lru.get("b")
+    stats = lru.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert abs(stats['hit_rate'] - 2 / 3) < 1e-9
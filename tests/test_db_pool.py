@@ -0,0 +1,128 @@
+import threading
+import time
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from modules.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        if self.conn.on_execute:
+            self.conn.on_execute()
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self.on_execute = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        if self.in_transaction:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    return ConnectionPool(connect, **kwargs), created
+
+
+def test_reuses_returned_connection():
+    pool, created = make_pool(min_size=1, max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(created) == 1
+
+
+def test_times_out_when_exhausted():
+    pool, _ = make_pool(min_size=0, max_size=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool, _ = make_pool(min_size=0, max_size=1, timeout=2)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    assert pool.getconn() is conn
+    assert pool.stats()['waits'] == 1
+
+
+def test_putconn_rolls_back_open_transaction():
+    pool, _ = make_pool(min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.in_transaction = True
+    pool.putconn(conn)
+    assert not conn.in_transaction
+    assert pool.stats()['idle'] == 1
+
+
+def test_broken_idle_connection_is_replaced():
+    pool, created = make_pool(min_size=1, max_size=1, health_check_interval=0)
+    created[0].broken = True
+    conn = pool.getconn()
+    assert conn is created[1]
+    assert created[0].closed
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['in_use'] == 1
+
+
+def test_health_check_runs_without_pool_lock():
+    pool, created = make_pool(min_size=2, max_size=2, health_check_interval=0)
+    checking = threading.Event()
+    release = threading.Event()
+    slow = created[1]  # getconn забирает последнее простаивающее соединение
+
+    def hang():
+        checking.set()
+        release.wait(2)
+
+    slow.on_execute = hang
+    result = []
+    threading.Thread(target=lambda: result.append(pool.getconn())).start()
+    assert checking.wait(1)
+
+    started = time.monotonic()
+    other = pool.getconn()
+    assert time.monotonic() - started < 0.5
+    assert other is created[0]
+    assert pool.stats()['in_use'] == 2
+    release.set()
+
+
+def test_closed_pool_refuses_checkout():
+    pool, created = make_pool(min_size=1, max_size=1)
+    pool.closeall()
+    assert created[0].closed
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+import numpy as np
+import pytest
+from modules import faq_encoders
+from modules import faq_matcher
+from modules import faq_workers
+
+
+class SlowEncoder:
+    dim = 4
+    key = "fake-model"
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, texts):
+        self.batch_sizes.append(len(texts))
+        time.sleep(0.02)
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+@pytest.fixture
+def in_process_model(monkeypatch):
+    fake = SlowEncoder()
+    monkeypatch.setattr(faq_workers, "WORKER_PROCESSES", 0)
+    monkeypatch.setattr(faq_encoders, "create_encoder", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(faq_matcher, "encoder", None)
+    monkeypatch.setattr(faq_matcher, "model_state", faq_matcher.MODEL_STATE_NOT_LOADED)
+    monkeypatch.setattr(faq_matcher, "EMBEDDING_DIM", None)
+    monkeypatch.setattr(faq_matcher, "EMBEDDING_MODEL_KEY", None)
+    monkeypatch.setattr(faq_matcher, "BATCH_MAX_SIZE", 8)
+    monkeypatch.setattr(faq_matcher, "BATCH_WINDOW_MS", 200.0)
+    return fake
+
+
+def test_concurrent_queries_share_one_model_call_without_workers(in_process_model):
+    assert faq_matcher.load_model()
+    assert isinstance(faq_matcher.encoder, faq_encoders.BatchingEncoder)
+
+    start = threading.Barrier(8)
+    results = []
+
+    def ask(n):
+        start.wait()
+        results.append(faq_matcher.encode_query(f"вопрос {n}"))
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(results) == 8
+    assert sum(in_process_model.batch_sizes) == 8
+    assert max(in_process_model.batch_sizes) > 1
+    assert faq_matcher.get_encoder_stats()['max_batch_size'] > 1
+
+
+def test_worker_processes_encode_queries_one_by_one(in_process_model, monkeypatch):
+    monkeypatch.setattr(faq_matcher, "sync_index", lambda: None)
+    faq_workers._init_worker(queue.Queue())
+    assert faq_matcher.BATCH_MAX_SIZE == 0
+    assert not isinstance(faq_matcher.encoder, faq_encoders.BatchingEncoder)
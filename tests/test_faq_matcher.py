@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from modules import faq_matcher
+from modules.cache import LRUCache
+
+ITEMS = [
+    ("Как сменить пароль?", "В настройках профиля."),
+    ("Где посмотреть расписание?", "В разделе Расписание."),
+    ("Как связаться с учителем?", "Через техподдержку."),
+    ("Сколько длится урок?", "45 минут."),
+]
+
+
+def make_index(version=1, matrix=None):
+    if matrix is None:
+        matrix = np.eye(len(ITEMS), dtype=np.float32)
+    return faq_matcher.FaqIndex(list(range(101, 101 + len(ITEMS))), ITEMS, matrix, version)
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    """Подменяет кодирование запроса: вектор ближе всего к первому вопросу, дальше по убыванию."""
+    calls = []
+    query = np.array([0.8, 0.5, 0.3, 0.1], dtype=np.float32)
+
+    def encode_query(text):
+        calls.append(text)
+        return query / np.linalg.norm(query)
+
+    monkeypatch.setattr(faq_matcher, "encode_query", encode_query)
+    monkeypatch.setattr(faq_matcher, "_query_cache", LRUCache(max_size=16))
+    return calls
+
+
+def positions(matches):
+    return [pos for pos, _ in matches]
+
+
+def test_repeated_question_is_encoded_once(encoder):
+    index = make_index()
+    first = faq_matcher.search_query(index, "не могу войти в аккаунт")
+    second = faq_matcher.search_query(index, "  Не могу войти в аккаунт ")
+    assert first == second
+    assert positions(first) == [0, 1, 2]
+    assert len(encoder) == 1
+
+
+def test_top_k_one_does_not_truncate_later_suggestions(encoder):
+    index = make_index()
+    assert positions(faq_matcher.search_query(index, "не могу войти", top_k=1)) == [0]
+    assert positions(faq_matcher.search_query(index, "не могу войти", top_k=3)) == [0, 1, 2]
+    assert len(encoder) == 1
+
+
+def test_deeper_request_than_cached_is_recomputed(encoder):
+    index = make_index()
+    faq_matcher.search_query(index, "не могу войти")
+    assert positions(faq_matcher.search_query(index, "не могу войти", top_k=4)) == [0, 1, 2, 3]
+    assert len(encoder) == 1
+
+
+def test_new_index_version_reranks_without_reencoding(encoder):
+    faq_matcher.search_query(make_index(version=1), "не могу войти")
+    reversed_matrix = np.eye(len(ITEMS), dtype=np.float32)[::-1].copy()
+    matches = faq_matcher.search_query(make_index(version=2, matrix=reversed_matrix), "не могу войти")
+    assert positions(matches) == [3, 2, 1]
+    assert len(encoder) == 1
+
+
+def test_exact_question_skips_encoding(encoder):
+    assert faq_matcher.search_query(make_index(), "где посмотреть расписание", top_k=1) == [(1, 1.0)]
+    assert encoder == []
+
+
+def test_exact_question_is_padded_with_nearest_questions(encoder):
+    matrix = np.eye(len(ITEMS), dtype=np.float32)
+    matrix[3] = [0.0, 0.8, 0.0, 0.6]
+    matches = faq_matcher.search_query(make_index(matrix=matrix), "где посмотреть расписание")
+    assert positions(matches) == [1, 3, 0]
+    assert matches[0] == (1, 1.0)
+    assert encoder == []
+
+
+def test_paraphrase_without_shared_words_is_found(monkeypatch):
+    # "Как" роднит запрос с вопросами 0 и 2, а по смыслу он о длительности урока (3)
+    monkeypatch.setattr(faq_matcher, "LEXICAL_CANDIDATES", 2)
+    monkeypatch.setattr(faq_matcher, "encode_query", lambda text: np.array([0.1, 0.0, 0.1, 0.99], dtype=np.float32))
+    monkeypatch.setattr(faq_matcher, "_query_cache", LRUCache(max_size=16))
+    index = make_index()
+    assert 3 not in [pos for pos, _ in index.lexical.search("как долго идет занятие", 2)]
+
+    matches = faq_matcher.search_query(index, "как долго идет занятие")
+    assert positions(matches)[0] == 3
+
+
+def test_bm25_ranks_documents_sharing_terms():
+    index = faq_matcher.Bm25Index(ITEMS)
+    assert index.search("забыл пароль", 2)[0][0] == 0
+    assert index.search("совсем другие слова", 2) == []
+
+
+@pytest.fixture
+def faq_table(monkeypatch):
+    """FAQ без сохраненных векторов; записи в faq_embeddings собираются в список saved."""
+    saved = []
+    rows = [(101 + pos, question, answer, None, None) for pos, (question, answer) in enumerate(ITEMS)]
+    monkeypatch.setattr(faq_matcher.db, "get_faq_rows_with_embedding_meta", lambda model_key: rows)
+    monkeypatch.setattr(faq_matcher.db, "get_faq_embeddings", lambda faq_ids, model_key: {})
+    monkeypatch.setattr(faq_matcher.db, "save_faq_embeddings", saved.extend)
+    monkeypatch.setattr(faq_matcher, "encode", lambda texts: np.eye(len(ITEMS), dtype=np.float32)[:len(texts)])
+    monkeypatch.setattr(faq_matcher, "EMBEDDING_DIM", len(ITEMS))
+    monkeypatch.setattr(faq_matcher, "EMBEDDING_MODEL_KEY", "test-model")
+    monkeypatch.setattr(faq_matcher, "is_ready", lambda: True)
+    monkeypatch.setattr(faq_matcher, "_index", faq_matcher.FaqIndex([], [], None, 0))
+    return saved
+
+
+def test_build_index_does_not_write_embeddings(faq_table):
+    index, new_embeddings = faq_matcher.build_index()
+    assert len(index) == len(ITEMS)
+    assert [row[0] for row in new_embeddings] == index.ids
+    assert faq_table == []
+
+
+def test_sync_index_persists_new_embeddings(faq_table):
+    index = faq_matcher.sync_index()
+    assert len(index) == len(ITEMS)
+    assert [row[1] for row in faq_table] == ["test-model"] * len(ITEMS)
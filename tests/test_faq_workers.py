@@ -0,0 +1,94 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+import pytest
+from modules import faq_matcher
+from modules import faq_workers
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    executor = FakeExecutor()
+    restarts = []
+    monkeypatch.setattr(faq_workers, "WORKER_PROCESSES", 2)
+    monkeypatch.setattr(faq_workers, "MATCH_TIMEOUT", 0.1)
+    monkeypatch.setattr(faq_workers, "_executor", executor)
+    monkeypatch.setattr(faq_workers, "_ready_workers", 1)
+    monkeypatch.setattr(faq_workers, "_restart_executor", restarts.append)
+    executor.restarts = restarts
+    return executor
+
+
+def collect():
+    results = queue.Queue()
+    return results, results.put
+
+
+def test_result_is_passed_to_callback(pool):
+    results, on_done = collect()
+    faq_workers.find_faq_matches_async("как сменить пароль", on_done)
+    pool.futures[0].set_running_or_notify_cancel()
+    pool.futures[0].set_result([("Как сменить пароль?", "В профиле.", 0.9, True)])
+
+    assert results.get(timeout=1) == [("Как сменить пароль?", "В профиле.", 0.9, True)]
+    assert pool.restarts == []
+
+
+def test_hung_search_times_out_once_and_restarts_pool(pool):
+    results, on_done = collect()
+    started = threading.get_ident()
+    faq_workers.find_faq_matches_async("вопрос", on_done)
+    assert threading.get_ident() == started  # обработчик не ждал результата
+    pool.futures[0].set_running_or_notify_cancel()
+
+    assert results.get(timeout=1) == []
+    assert pool.restarts == [pool]
+
+    pool.futures[0].set_result([("поздний ответ", "", 1.0, True)])
+    with pytest.raises(queue.Empty):
+        results.get(timeout=0.2)
+
+
+def test_queued_search_is_cancelled_without_restart(pool):
+    results, on_done = collect()
+    faq_workers.find_faq_matches_async("вопрос", on_done)
+
+    assert results.get(timeout=1) == []
+    assert pool.futures[0].cancelled()
+    assert pool.restarts == []
+
+
+def test_warm_up_of_replaced_pool_is_not_counted(pool, monkeypatch):
+    monkeypatch.setattr(faq_workers, "_ready_workers", 0)
+    warmed = Future()
+    warmed.set_result(True)
+
+    faq_workers._on_worker_ready(FakeExecutor(), warmed)
+    assert faq_workers._ready_workers == 0
+    faq_workers._on_worker_ready(pool, warmed)
+    assert faq_workers._ready_workers == 1
+
+
+def test_workers_report_pids_that_restart_kills(monkeypatch):
+    pids = queue.Queue()
+    monkeypatch.setattr(faq_matcher, "load_model", lambda: True)
+    monkeypatch.setattr(faq_matcher, "sync_index", lambda: None)
+    monkeypatch.setattr(faq_matcher, "BATCH_MAX_SIZE", faq_matcher.BATCH_MAX_SIZE)
+    faq_workers._init_worker(pids)
+
+    killed = []
+    monkeypatch.setattr(faq_workers, "_worker_pids", pids)
+    monkeypatch.setattr(faq_workers.os, "kill", lambda pid, sig: killed.append(pid))
+    faq_workers._kill_workers()
+    assert killed == [os.getpid()]
@@ -0,0 +1,91 @@
+from modules import migrations
+
+
+class FakeCursor:
+    """Эмулирует таблицу schema_version; ведет журнал выполненных команд."""
+
+    def __init__(self, version=0, version_after_lock=None):
+        self.version = version
+        self.version_after_lock = version_after_lock
+        self.executed = []
+        self._last = None
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        self._last = query
+        if "pg_advisory_xact_lock" in query and self.version_after_lock is not None:
+            self.version = self.version_after_lock
+        if query.startswith("INSERT INTO schema_version"):
+            assert params[0] > self.version, "версии должны применяться по возрастанию"
+            self.version = params[0]
+
+    def fetchone(self):
+        if "to_regclass" in self._last:
+            return (None,) if self.version == 0 else ("schema_version",)
+        return (self.version,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def migration_statements():
+    return [statement for _, _, statements in migrations.MIGRATIONS for statement in statements]
+
+
+def test_versions_are_consecutive_from_one():
+    versions = [migration[0] for migration in migrations.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+    assert migrations.LATEST_VERSION == versions[-1]
+
+
+def test_fresh_database_applies_everything_in_order():
+    cur = FakeCursor()
+    conn = FakeConnection(cur)
+    assert migrations.migrate(conn) == [migration[0] for migration in migrations.MIGRATIONS]
+    executed = [query for query, _ in cur.executed]
+    applied = [query for query in executed if query in migration_statements()]
+    assert applied == migration_statements()
+    assert cur.version == migrations.LATEST_VERSION
+    assert conn.commits == 1
+
+
+def test_up_to_date_schema_runs_no_ddl():
+    cur = FakeCursor(version=migrations.LATEST_VERSION)
+    conn = FakeConnection(cur)
+    assert migrations.migrate(conn) == []
+    assert all(query.startswith("SELECT") for query, _ in cur.executed)
+    assert conn.rollbacks == 1 and conn.commits == 0
+
+
+def test_partial_schema_applies_only_newer_versions():
+    cur = FakeCursor(version=3)
+    assert migrations.migrate(FakeConnection(cur)) == list(range(4, migrations.LATEST_VERSION + 1))
+
+
+def test_version_is_rechecked_under_lock():
+    # Пока ждали блокировку, другой процесс уже довел схему до последней версии
+    cur = FakeCursor(version=2, version_after_lock=migrations.LATEST_VERSION)
+    assert migrations.migrate(FakeConnection(cur)) == []
+    assert not any(query in migration_statements() for query, _ in cur.executed)
+
+
+def test_target_version_limits_migration():
+    cur = FakeCursor()
+    assert migrations.migrate(FakeConnection(cur), target_version=2) == [1, 2]
+    assert cur.version == 2
@@ -0,0 +1,132 @@
+import pytest
+from telebot.apihelper import ApiTelegramException
+from modules import broadcast, outbox
+
+
+def api_error(code, description, **parameters):
+    return ApiTelegramException("sendMessage", None, {"error_code": code, "description": description, "parameters": parameters})
+
+
+class NoLimit:
+    def acquire(self, chat_id):
+        pass
+
+    def pause(self, seconds):
+        pass
+
+
+class FakeBot:
+    """Отвечает на send_message заранее заданными исключениями, затем успешно."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(broadcast, "limiter", NoLimit())
+
+
+def row(attempts=1, parse_mode=None):
+    return (7, 42, "Расписание изменено", parse_mode, None, attempts)
+
+
+def test_sent_row_is_marked_sent():
+    assert outbox._deliver(FakeBot(), row()) == (7, outbox.STATUS_SENT, None, None)
+
+
+def test_network_error_is_retried_with_backoff():
+    _, status, _, delay = outbox._deliver(FakeBot(ConnectionError("reset")), row(attempts=2))
+    assert status == outbox.STATUS_PENDING
+    assert delay == outbox.retry_delay(2)
+
+
+def test_rate_limit_waits_at_least_retry_after():
+    _, status, _, delay = outbox._deliver(FakeBot(api_error(429, "Too Many Requests", retry_after=900)), row())
+    assert status == outbox.STATUS_PENDING
+    assert delay == 900
+
+
+def test_gives_up_after_max_attempts():
+    _, status, _, _ = outbox._deliver(FakeBot(ConnectionError("reset")), row(attempts=outbox.MAX_ATTEMPTS))
+    assert status == outbox.STATUS_DEAD
+
+
+def test_bad_markup_is_resent_without_parse_mode():
+    bot = FakeBot(api_error(400, "Bad Request: can't parse entities: Can't find end of the entity"))
+    _, status, _, _ = outbox._deliver(bot, row(parse_mode="Markdown"))
+    assert status == outbox.STATUS_SENT
+    assert [call.get("parse_mode") for call in bot.calls] == ["Markdown", None]
+
+
+def test_other_bad_request_is_dead():
+    _, status, error, _ = outbox._deliver(FakeBot(api_error(400, "Bad Request: message is too long")), row())
+    assert status == outbox.STATUS_DEAD
+    assert "too long" in error
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert outbox.retry_delay(1) == outbox.RETRY_BASE_DELAY
+    assert outbox.retry_delay(2) == 2 * outbox.RETRY_BASE_DELAY
+    assert outbox.retry_delay(50) == outbox.RETRY_MAX_DELAY
+
+
+class Stopper:
+    """Подмена _stop_event: выключает цикл после заданного числа ожиданий."""
+
+    def __init__(self, waits):
+        self.waits = waits
+
+    def is_set(self):
+        return self.waits <= 0
+
+    def wait(self, timeout=None):
+        self.waits -= 1
+        return self.is_set()
+
+
+def test_worker_survives_database_errors(monkeypatch):
+    batches = [RuntimeError("соединение потеряно"), [row()]]
+    recorded = []
+
+    def claim(batch_size, lease_seconds):
+        batch = batches.pop(0) if batches else []
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    monkeypatch.setattr(outbox, "_stop_event", Stopper(2))
+    monkeypatch.setattr(outbox.db, "claim_outbox_batch", claim)
+    monkeypatch.setattr(outbox.db, "record_outbox_results", recorded.extend)
+    monkeypatch.setattr(outbox._wake_event, "wait", outbox._stop_event.wait)
+    outbox._worker_loop(FakeBot())
+
+    assert recorded == [(7, outbox.STATUS_SENT, None, None)]
+
+
+def test_progress_polling_survives_errors(monkeypatch):
+    counts = [RuntimeError("соединение потеряно"), {outbox.STATUS_SENT: 2}]
+    updates = []
+
+    def get_counts(batch_id):
+        result = counts.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    class Reporter:
+        def update(self):
+            updates.append(job.sent)
+
+    job = broadcast.BroadcastJob("Рассылка")
+    monkeypatch.setattr(outbox, "_stop_event", Stopper(5))
+    monkeypatch.setattr(outbox.db, "get_outbox_batch_counts", get_counts)
+    outbox._poll_batch(1, job, Reporter())
+
+    assert updates == [2] and job.finished_at is not None
@@ -0,0 +1,80 @@
+import pytest
+from modules import database as db
+
+USERS = list(range(1, 8))
+
+
+class FakeCursor:
+    """Выполняет постраничный запрос получателей по списку conn.users."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((query, params))
+        limit = params[-1]
+        after_id = params[-2] if "id > %s" in query else None
+        ids = [user_id for user_id in self.conn.users if after_id is None or user_id > after_id]
+        self.rows = [(user_id,) for user_id in ids[:limit]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.users = USERS
+        self.queries = []
+        self.checked_out = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    conn = FakeConnection()
+
+    def get_connection():
+        # Страница не должна брать второе соединение, пока первое не вернулось в пул
+        assert conn.checked_out == 0
+        conn.checked_out += 1
+        return conn
+
+    def release(released):
+        conn.checked_out -= 1
+
+    monkeypatch.setattr(db, "get_db_connection", get_connection)
+    monkeypatch.setattr(db, "release_db_connection", release)
+    return conn
+
+
+def test_pages_by_primary_key(pool):
+    assert list(db.iter_recipient_ids(batch_size=3)) == USERS
+    assert [params for _, params in pool.queries] == [(3,), (3, 3), (6, 3)]
+    assert all("ORDER BY id LIMIT %s" in query for query, _ in pool.queries)
+
+
+def test_connection_is_returned_between_pages(pool):
+    recipients = db.iter_recipient_ids(batch_size=2)
+    assert next(recipients) == 1
+    assert pool.checked_out == 0
+    assert list(recipients) == USERS[1:]
+    assert pool.checked_out == 0
+
+
+def test_exact_multiple_of_page_size_stops_on_empty_page(pool):
+    pool.users = USERS[:6]
+    assert list(db.iter_recipient_ids(batch_size=3)) == USERS[:6]
+    assert len(pool.queries) == 3
+
+
+def test_group_filter_is_passed_as_array(pool):
+    list(db.iter_recipient_ids(group_ids={4, 2}))
+    query, params = pool.queries[0]
+    assert "group_id = ANY(%s)" in query
+    assert sorted(params[0]) == [2, 4]
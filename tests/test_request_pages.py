@@ -0,0 +1,169 @@
+import datetime
+import pytest
+from modules import admin
+from modules import database as db
+
+BASE = datetime.datetime(2024, 9, 1, 8, 30)
+
+
+def make_requests(count):
+    # Часть запросов создана в одну и ту же секунду: порядок между ними решает id
+    return [
+        (req_id, 1000 + req_id, "user", "Ученик", f"Проблема {req_id}", "Открыт" if req_id % 3 else "Решен",
+         BASE + datetime.timedelta(seconds=req_id // 2, microseconds=req_id % 2 * 7))
+        for req_id in range(1, count + 1)
+    ]
+
+
+def keyset_page(rows):
+    """Та же выборка, что get_support_requests_page, но по списку в памяти."""
+    def page(status, cursor, direction, limit):
+        selected = [row for row in rows if not status or row[5] == status]
+        selected.sort(key=lambda row: (row[6], row[0]), reverse=direction == 'next')
+        if cursor:
+            selected = [row for row in selected if ((row[6], row[0]) < cursor) == (direction == 'next') and (row[6], row[0]) != cursor]
+        chunk = selected[:limit + 1]
+        has_more = len(chunk) > limit
+        chunk = chunk[:limit]
+        if direction != 'next':
+            chunk.reverse()
+        return chunk, has_more
+    return page
+
+
+class FakeBot:
+    def __init__(self):
+        self.markup = None
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.markup = reply_markup
+
+    def edit_message_text(self, chat_id=None, message_id=None, text=None, reply_markup=None, **kwargs):
+        self.markup = reply_markup
+
+    def buttons(self):
+        return {button.text: button.callback_data for row in self.markup.keyboard for button in row}
+
+    def request_ids(self):
+        return [int(data.split('_')[-1]) for data in self.buttons().values() if data.startswith("admin_view_request_details_")]
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    rows = make_requests(23)
+    monkeypatch.setattr(db, "get_support_requests_page", keyset_page(rows))
+    return rows
+
+
+def test_cursor_round_trip_keeps_microseconds():
+    created_at = datetime.datetime(2024, 9, 1, 8, 30, 15, 123456)
+    encoded = admin.encode_request_cursor(created_at, 98765)
+    assert admin.decode_request_cursor(*encoded.split('_')) == (created_at, 98765)
+
+
+def test_callback_data_fits_telegram_limit():
+    cursor = admin.encode_request_cursor(datetime.datetime(2099, 12, 31, 23, 59, 59, 999999), 2_147_483_647)
+    assert len(f"admin_reqs_del_work_n_{cursor}".encode()) <= 64
+
+
+def test_paging_forward_and_back_covers_every_request_once(pages):
+    bot = FakeBot()
+    admin.show_requests_page(bot, 1, None)
+    seen = [bot.request_ids()]
+    assert "⬅️ Новее" not in bot.buttons()
+    while "Старше ➡️" in bot.buttons():
+        admin.handle_requests_page_callback(bot, 1, 10, bot.buttons()["Старше ➡️"])
+        seen.append(bot.request_ids())
+
+    newest_first = [row[0] for row in sorted(pages, key=lambda row: (row[6], row[0]), reverse=True)]
+    assert [req_id for page in seen for req_id in page] == newest_first
+    assert [len(page) for page in seen] == [10, 10, 3]
+
+    admin.handle_requests_page_callback(bot, 1, 10, bot.buttons()["⬅️ Новее"])
+    assert bot.request_ids() == seen[1]
+    admin.handle_requests_page_callback(bot, 1, 10, bot.buttons()["⬅️ Новее"])
+    assert bot.request_ids() == seen[0]
+    assert "⬅️ Новее" not in bot.buttons()
+
+
+def test_status_filter_pages_only_matching_requests(pages):
+    bot = FakeBot()
+    admin.handle_requests_page_callback(bot, 1, 10, "admin_reqs_list_done")
+    expected = sorted((row for row in pages if row[5] == "Решен"), key=lambda row: (row[6], row[0]), reverse=True)
+    assert bot.request_ids() == [row[0] for row in expected]
+    assert "Старше ➡️" not in bot.buttons()
+
+
+def test_emptied_page_falls_back_to_first_page(pages):
+    bot = FakeBot()
+    stale = admin.encode_request_cursor(BASE - datetime.timedelta(days=1), 1)
+    admin.handle_requests_page_callback(bot, 1, 10, f"admin_reqs_list_all_n_{stale}")
+    assert len(bot.request_ids()) == admin.REQUESTS_PAGE_SIZE
+    assert "⬅️ Новее" not in bot.buttons()
+
+
+class RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.query = None
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.query, self.params = query, params
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self, rows):
+        self.cur = RecordingCursor(rows)
+
+    def cursor(self):
+        return self.cur
+
+
+def test_page_query_fetches_one_extra_row_to_detect_more(monkeypatch):
+    rows = make_requests(4)
+    conn = RecordingConnection(rows)
+    monkeypatch.setattr(db, "get_db_connection", lambda: conn)
+    monkeypatch.setattr(db, "release_db_connection", lambda conn: None)
+
+    page, has_more = db.get_support_requests_page(None, None, 'next', 3)
+    assert page == rows[:3] and has_more
+    assert conn.cur.params == [4]
+
+    cursor = (BASE, 5)
+    page, has_more = db.get_support_requests_page("Открыт", cursor, 'prev', 10)
+    assert page == rows[::-1] and not has_more
+    assert "(created_at, id) > (%s, %s)" in conn.cur.query and "ASC" in conn.cur.query
+    assert conn.cur.params == ["Открыт", BASE, 5, 11]
+
+
+def history_store(total, queried):
+    messages = [("Ученик", "user", f"Сообщение {n}", BASE + datetime.timedelta(minutes=n)) for n in range(1, total + 1)]
+
+    def fetch(request_id, limit, offset):
+        queried.append(offset)
+        window = messages[::-1][offset:offset + limit][::-1]
+        return make_requests(1)[0], window, total
+    return fetch
+
+
+@pytest.mark.parametrize("offset, expected", [(-5, 0), (0, 0), (5, 5), (7, 7), (100, 7)])
+def test_history_offset_is_clamped_to_existing_messages(monkeypatch, offset, expected):
+    queried = []
+    monkeypatch.setattr(db, "get_support_request_with_history", history_store(12, queried))
+    bot = FakeBot()
+    admin.show_request_details_for_admin(bot, 1, 10, 1, history_offset=offset)
+
+    assert queried[-1] == expected
+    buttons = bot.buttons()
+    if expected < 7:
+        assert buttons["⬆️ Ранее"] == f"admin_request_history_{min(expected + 5, 7)}_1"
+    else:
+        assert "⬆️ Ранее" not in buttons
+    assert ("⬇️ Позже" in buttons) == (expected > 0)
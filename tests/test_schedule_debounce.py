@@ -0,0 +1,89 @@
+import datetime
+from modules import database as db
+from modules import outbox
+
+GROUP = 5
+
+
+class ScheduleStore:
+    """Таблицы schedule_notification_windows и notification_outbox в памяти со своим CURRENT_TIMESTAMP."""
+
+    def __init__(self):
+        self.now = datetime.datetime(2024, 9, 1, 10, 0)
+        self.windows = {}
+        self.outbox = []
+        self.result = None
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if query.startswith("SELECT base_schedule_text"):
+            window = self.windows.get(params[0])
+            self.result = window[:2] if window and window[2] > self.now else None
+        elif query.startswith("DELETE FROM notification_outbox"):
+            self.outbox = [row for row in self.outbox if not (row['batch_id'] == params[0] and row['status'] == 'pending')]
+        elif query.startswith("INSERT INTO schedule_notification_windows"):
+            group_id, base_text, batch_id, seconds = params
+            self.windows[group_id] = (base_text, batch_id, self.now + datetime.timedelta(seconds=seconds))
+        elif query.startswith("SELECT send_after"):
+            send_after = self.windows[params[0]][2]
+            self.result = (send_after, (send_after - self.now).total_seconds())
+        elif query.startswith("INSERT INTO notification_outbox"):
+            kind, batch_id, text, parse_mode, reply_markup, available_at, group_id = params
+            self.outbox.append({'batch_id': batch_id, 'text': text, 'available_at': available_at, 'status': 'pending'})
+        else:
+            raise AssertionError(f"Неожиданный запрос: {query}")
+
+    def fetchone(self):
+        return self.result
+
+    def edit(self, previous_text, new_text, debounce_seconds=180):
+        bases = []
+
+        def build_notification(base_text):
+            bases.append(base_text)
+            if base_text == new_text:
+                return None
+            return outbox.message(outbox.KIND_SCHEDULE, f"{base_text} -> {new_text}", batch_id=outbox.new_batch_id())
+
+        queued = db._queue_schedule_notification(self, GROUP, previous_text, build_notification, debounce_seconds)
+        return queued, bases
+
+    def pending(self):
+        return [row for row in self.outbox if row['status'] == 'pending']
+
+
+def test_edits_inside_window_collapse_into_one_notification():
+    store = ScheduleStore()
+    first, _ = store.edit("Пн 9:00", "Пн 10:00")
+    store.now += datetime.timedelta(seconds=60)
+    second, bases = store.edit("Пн 10:00", "Пн 11:00")
+
+    assert bases == ["Пн 9:00"]
+    assert second['batch_id'] == first['batch_id']
+    assert [row['text'] for row in store.pending()] == ["Пн 9:00 -> Пн 11:00"]
+    # Окно не продлевается: уведомление уйдет в срок, назначенный первой правкой
+    assert store.pending()[0]['available_at'] == datetime.datetime(2024, 9, 1, 10, 3)
+    assert second['send_in'] == 120.0
+
+
+def test_edit_after_window_starts_new_batch():
+    store = ScheduleStore()
+    first, _ = store.edit("Пн 9:00", "Пн 10:00")
+    store.outbox[0]['status'] = 'sent'
+    store.now += datetime.timedelta(minutes=5)
+    second, bases = store.edit("Пн 10:00", "Пн 11:00")
+
+    assert bases == ["Пн 10:00"]
+    assert second['batch_id'] != first['batch_id']
+    assert second['send_in'] == 180.0
+    assert [row['text'] for row in store.outbox] == ["Пн 9:00 -> Пн 10:00", "Пн 10:00 -> Пн 11:00"]
+
+
+def test_reverting_inside_window_cancels_notification():
+    store = ScheduleStore()
+    store.edit("Пн 9:00", "Пн 10:00")
+    queued, bases = store.edit("Пн 10:00", "Пн 9:00")
+
+    assert queued is None
+    assert bases == ["Пн 9:00"]
+    assert store.pending() == []
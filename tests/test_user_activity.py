@@ -0,0 +1,31 @@
+import pytest
+from modules import database as db
+
+
+@pytest.fixture
+def no_db(monkeypatch):
+    """Любое обращение к БД проваливает тест, кроме загрузки набора недоступных пользователей."""
+    monkeypatch.setattr(db, "get_db_connection", lambda: pytest.fail("неожиданное обращение к БД"))
+    monkeypatch.setattr(db, "_load_inactive_users", lambda: {5})
+    monkeypatch.setattr(db, "_inactive_users", None)
+
+
+def test_active_user_is_not_written_on_start(no_db):
+    assert db.reactivate_user(1) is False
+    assert db.is_user_inactive(5)
+
+
+def test_deactivation_events_update_the_set(no_db):
+    assert not db.is_user_inactive(7)
+    db._on_user_active_changed(7, False)
+    assert db.is_user_inactive(7)
+    db._on_user_active_changed(5, True)
+    assert not db.is_user_inactive(5)
+
+
+def test_listener_reconnect_reloads_the_set(no_db, monkeypatch):
+    db.is_user_inactive(1)
+    db._on_user_active_changed(None, None)
+    monkeypatch.setattr(db, "_load_inactive_users", lambda: {9})
+    assert db.is_user_inactive(9)
+    assert not db.is_user_inactive(5)
@@ -0,0 +1,44 @@
+import pytest
+from modules import database as db
+from modules import user_profiles
+from modules.cache import LRUCache
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(user_profiles, "_persisted", LRUCache(max_size=2))
+    monkeypatch.setattr(user_profiles, "_pending", {})
+    monkeypatch.setattr(user_profiles, "_ensure_flusher", lambda: None)
+    monkeypatch.setattr(db, "add_or_update_user", lambda *args: calls.append(args[0]) or True)
+    return calls
+
+
+def test_unchanged_profile_is_written_once(writes):
+    for _ in range(3):
+        user_profiles.track_user(1, "anna", "Анна", None)
+    assert writes == [1]
+
+
+def test_fingerprints_are_bounded_and_evicted_users_rewritten(writes):
+    for user_id in (1, 2, 3):
+        user_profiles.track_user(user_id, f"user{user_id}", "Имя", None)
+    assert user_profiles.get_stats() == {'tracked': 2, 'pending': 0}
+
+    user_profiles.track_user(3, "user3", "Имя", None)
+    assert writes == [1, 2, 3]
+    user_profiles.track_user(1, "user1", "Имя", None)
+    assert writes == [1, 2, 3, 1]
+
+
+def test_changed_profile_waits_for_flush(writes, monkeypatch):
+    batches = []
+    monkeypatch.setattr(db, "upsert_users", lambda rows: batches.append(rows) or True)
+    user_profiles.track_user(1, "anna", "Анна", None)
+    user_profiles.track_user(1, "anna_k", "Анна", None)
+    assert writes == [1]
+
+    assert user_profiles.flush()
+    assert batches == [[(1, "anna_k", "Анна", None, False)]]
+    user_profiles.track_user(1, "anna_k", "Анна", None)
+    assert writes == [1] and len(batches) == 1
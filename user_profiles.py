@@ -0,0 +1,93 @@
+import threading
+import config
+import modules.database as db
+from modules.cache import LRUCache
+
+FLUSH_INTERVAL = getattr(config, 'PROFILE_FLUSH_INTERVAL', 5.0)
+
+# user_id -> отпечаток профиля, который точно записан в БД.
+# Вытесненный пользователь просто запишется заново при следующем обращении.
+_persisted = LRUCache(max_size=getattr(config, 'PROFILE_CACHE_SIZE', 100000))
+# user_id -> профиль, ожидающий пакетной записи
+_pending = {}
+_lock = threading.Lock()
+_flusher = None
+_stop_event = threading.Event()
+
+
+def _fingerprint(username, first_name, last_name, is_admin):
+    return (username, first_name, last_name, bool(is_admin))
+
+
+def track_user(user_id, username, first_name, last_name, is_admin=False):
+    """
+    Замена db.add_or_update_user для частых обращений (меню, /start).
+    Неизменившийся профиль не пишется вовсе, изменившийся у известного пользователя
+    откладывается до ближайшего пакетного сброса. Нового пользователя записывает сразу,
+    чтобы последующие set_user_group и т.п. находили его строку.
+    """
+    fingerprint = _fingerprint(username, first_name, last_name, is_admin)
+    with _lock:
+        if user_id in _pending:
+            if _pending[user_id] != fingerprint:
+                _pending[user_id] = fingerprint
+            return True
+        known = _persisted.get(user_id, None)
+        if known == fingerprint:
+            return True
+        if known is not None:
+            _pending[user_id] = fingerprint
+            _ensure_flusher()
+            return True
+
+    if db.add_or_update_user(user_id, username, first_name, last_name, is_admin):
+        with _lock:
+            _persisted.put(user_id, fingerprint)
+        return True
+    return False
+
+
+def flush():
+    """Записывает накопленные изменения профилей одним пакетом."""
+    with _lock:
+        if not _pending:
+            return True
+        batch = _pending.copy()
+        _pending.clear()
+
+    rows = [(user_id,) + fingerprint for user_id, fingerprint in batch.items()]
+    if db.upsert_users(rows):
+        with _lock:
+            for user_id, fingerprint in batch.items():
+                _persisted.put(user_id, fingerprint)
+        return True
+
+    with _lock:
+        # Возвращаем в очередь то, что не успело смениться более свежим профилем.
+        for user_id, fingerprint in batch.items():
+            _pending.setdefault(user_id, fingerprint)
+    return False
+
+
+def _flush_loop():
+    while not _stop_event.wait(FLUSH_INTERVAL):
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _stop_event.clear()
+        _flusher = threading.Thread(target=_flush_loop, name="profile-flusher", daemon=True)
+        _flusher.start()
+
+
+def shutdown():
+    """Останавливает фоновый сброс и записывает остаток очереди."""
+    _stop_event.set()
+    flush()
+
+
+def get_stats():
+    with _lock:
+        return {'tracked': _persisted.stats()['size'], 'pending': len(_pending)}